@@ -7,31 +7,39 @@ __release__ = '30 Oct 2024'
 __author__ = 'Alex Viytiv'
 
 # modules
-import urllib.request
-import urllib.parse
-import smtplib, ssl
+# NOTE: heavy modules (requests, lxml, ftplib, smtplib, ssl, email) are
+#       imported lazily by the stages that use them to keep startup fast
 import traceback
-import requests
+import threading
 import argparse
 import random
 import time
+import hashlib
 import json
+import itertools
+import struct
+import signal
+import array
+import mmap
 import glob
-import ssl
+import sys
 import re
 import os
 
-from lxml import html
-from ftplib import FTP
-from getpass import getpass
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from datetime import datetime, date, timedelta
-from utils import Font, LogLevel, Logger, Email
-from urllib.parse import quote
+from utils import Font, LogLevel, Logger, Email, MailQueue, ErrorStore, NameIndex, JsonStream, StackSampler, MemTracker
+from utils import moving_average, bucket_mean, resolution_spans, encode_series, span_bases, span_deltas
+from utils import SaveQueue, FileLock, LeaderLease, Credentials, atomic_write
 
 
 # global logger object
 logger = Logger(LogLevel.NORMAL)
 
+# global background persistence, flushed on exit
+saver = SaveQueue(logger)
+
 
 class htmlWorker:
     ''' Provide HTML processing functionality '''
@@ -82,24 +90,79 @@ class htmlWorker:
             f.write(self._content)
 
 
+class dbRecord:
+    ''' Compact data of the country for a single date
+
+    Static fields are kept in the shared "meta" tuple of (key, value)
+    pairs in the original order of keys, numbers and regions are kept in
+    arrays. Regions are integer IDs of the country region names, the
+    tuple of IDs ("layout") is shared by records with the same regions.
+    '''
+    __slots__ = ('meta', 'numbers', 'layout', 'regions')
+    fields = ('Tested', 'Sick', 'Recovered', 'Dead')
+
+    def __init__(self, meta, numbers, layout, regions):
+        self.meta = meta
+        self.numbers = numbers
+        self.layout = layout
+        self.regions = regions
+
+
 class dbWorker:
-    ''' DataBase manager '''
+    ''' DataBase manager
 
-    def __init__(self, path):
-        ''' DB Constructor '''
+    Country configs are stored as dbRecord objects: metadata repeated for
+    every date is stored once and region names are interned into IDs.
+    Configs that do not fit (e.g. non-integer numbers) are kept as is.
+    API accepts and returns plain config dicts.
+    '''
+
+    def __init__(self, path, lazy=False):
+        ''' DB Constructor
+
+        :param path: path to the DB file
+        :param lazy: defer DB loading until data is actually needed
+        '''
         self._path = path
         self.__db = {}
         self.__auto_save = True
-        self._upload()
+        self.__loaded = False
+        self.__lock = threading.RLock()
+
+        # other processes may use the same DB file
+        self.__file_lock = FileLock(path + '.lock')
+        self.__stat = None
+
+        # number of changes made and written to the file
+        self.__version = 0
+        self.__saved = 0
+
+        # interned parts of the records
+        self.__metas = {}
+        self.__layouts = {}
+        self.__region_ids = {}
+        self.__region_names = {}
+
+        if not lazy:
+            self._upload()
+
+    def __load(self):
+        ''' Upload DB on the first access '''
+        if not self.__loaded:
+            self._upload()
 
     def _upload(self):
         ''' Upload DB from the file '''
+        self.__loaded = True
+
         if not os.path.isfile(self._path):
             logger.error('Файл БД \'{}\' не існує'.format(self._path))
             if not logger.approve('Створити БД'):
                 logger.critical('Заборонена робота без БД')
                 self.__auto_save = False
                 exit(1)
+
+            self.__mark_dirty()
             return
 
         if self.__db:
@@ -108,14 +171,16 @@ class dbWorker:
                 logger.normal('БД не перезаписана')
                 return
 
-        with open(self._path, 'r+') as fp:
+        with self.__file_lock.hold(shared=True), open(self._path, 'r+') as fp:
             # read data for backup and reset pointer
             backup_data = fp.read()
             fp.seek(0)
+            self.__stat = self.__file_stat()
 
             # try to upload as JSON
             try:
-                self.__db = json.load(fp)
+                self.__db = {day: {country: self._pack(country, cfg) for country, cfg in data.items()}
+                             for day, data in json.loads(backup_data).items()}
             except Exception as e:
                 # failure processing
                 self.__auto_save = False
@@ -123,7 +188,7 @@ class dbWorker:
                 raise e
 
             # Create backup file
-            with open(self._path + '.backup', 'w+') as fpb:
+            with atomic_write(self._path + '.backup') as fpb:
                 fpb.write(backup_data)
 
             logger.debug('Створено резервну копію даних "%s"' % (self._path + '.backup'))
@@ -131,12 +196,114 @@ class dbWorker:
         logger.success('БД підвантажено')
 
     def save(self):
-        ''' Load DB to the file '''
-        with open(self._path, 'w+') as fp:
-            json.dump(self.__db, fp, indent=4, ensure_ascii=False)
+        ''' Load DB to the file
+
+        Usually called by the background saver. Records are replaced on
+        update and never changed, so only references to them are taken under
+        the DB lock; the file is written under the file lock alone and
+        updates do not wait for the disk.
+        '''
+        self.__load()
+
+        with self.__lock:
+            version, entries = self.__version, self.__entries()
+
+        with self.__file_lock.hold():
+            if not self.__is_db_sync():
+                logger.error('БД змінена іншим процесом, зміни не збережено')
+                return
+
+            if version <= self.__saved:
+                # the same or newer state is already written
+                return
+
+            # dates are dumped one by one to avoid unpacking the whole DB,
+            # the output is the same as dump of the whole DB
+            with atomic_write(self._path) as fp:
+                fp.write('{\n' if entries else '{')
+                for index, (day, data) in enumerate(self.__unpacked(entries)):
+                    chunk = json.dumps({day: data}, indent=4, ensure_ascii=False)
+                    fp.write((',\n' if index else '') + chunk[2:-2])
+                fp.write('\n}' if entries else '}')
+
+            self.__stat = self.__file_stat()
+            self.__saved = version
+
+            # binary snapshot for fast read-only access
+            dbSnapshot.write(self._path + '.snap', self.__unpacked(entries), self._path)
 
         logger.normal('БД збережено')
 
+    def __mark_dirty(self):
+        ''' Schedule background save of the DB '''
+        self.__version += 1
+        if self.__auto_save:
+            saver.mark(self._path, self.save)
+
+    def _pack(self, country, config):
+        ''' Convert config to the compact record
+
+        :param country: name of the country
+        :param config: config of the country
+        :return: dbRecord or config itself if it can not be packed
+        '''
+        if not isinstance(config, dict):
+            return config
+
+        regions = config.get('Regions')
+        numbers = [config.get(field) for field in dbRecord.fields]
+        if not all(type(v) is int for v in numbers) or \
+                not (regions is None or (type(regions) is dict and all(type(v) is int for v in regions.values()))):
+            return config
+
+        meta = tuple((key, None if key in dbRecord.fields or key == 'Regions' else value)
+                     for key, value in config.items())
+        try:
+            meta = self.__metas.setdefault(meta, meta)
+        except TypeError:
+            # metadata with lists or dicts is identified by its JSON
+            meta = self.__metas.setdefault(json.dumps(meta, ensure_ascii=False), meta)
+
+        layout = None
+        if regions is not None:
+            ids = self.__region_ids.setdefault(country, {})
+            names = self.__region_names.setdefault(country, [])
+            for name in regions:
+                if name not in ids:
+                    ids[name] = len(names)
+                    names.append(name)
+
+            layout = tuple(ids[name] for name in regions)
+            layout = self.__layouts.setdefault((country, layout), layout)
+            regions = array.array('q', regions.values())
+
+        return dbRecord(meta, array.array('q', numbers), layout, regions)
+
+    def _unpack(self, country, record):
+        ''' Convert compact record to the config
+
+        :param country: name of the country
+        :param record: dbRecord or config
+        :return: new config dict
+        '''
+        if not isinstance(record, dbRecord):
+            return record
+
+        config = {}
+        for key, value in record.meta:
+            if key == 'Regions':
+                names = self.__region_names[country]
+                config[key] = {names[rid]: count for rid, count in zip(record.layout, record.regions)}
+            elif key in dbRecord.fields:
+                config[key] = record.numbers[dbRecord.fields.index(key)]
+            elif isinstance(value, (list, dict)):
+                # shared value must not be changed through the config
+                config[key] = json.loads(json.dumps(value))
+            else:
+                config[key] = value
+
+        return config
+
     def update(self, key, config):
         ''' Update DB entries
 
@@ -144,6 +311,34 @@ class dbWorker:
         :param config: new config
         '''
         # keys {'date':'*', 'country': '*', 'region': '*'}
+        self.__load()
+        with self.__lock:
+            self.__update(key, config)
+            self.__mark_dirty()
+
+    def update_batch(self, day, configs):
+        ''' Update configs of countries for the date at once
+
+        Changes are applied under a single lock acquisition, so readers and
+        the background saver see either none or all of them.
+
+        :param day: date string
+        :param configs: dict of configs by country name
+        '''
+        if not configs:
+            return
+
+        self.__load()
+        with self.__lock:
+            data = self.__db.setdefault(day, {})
+            for country, config in configs.items():
+                data[country] = self._pack(country, config)
+            self.__mark_dirty()
+
+        logger.debug('БД дати {} оновлено: {}'.format(day, ', '.join(configs)))
+
+    def __update(self, key, config):
+        ''' Update DB entries under the lock '''
         k_date = key.get('date')
         k_cont = key.get('country')
         k_regn = key.get('region')
@@ -161,19 +356,17 @@ class dbWorker:
                 self.__db[k_date][k_cont] = {}
 
             if key.get('region'):
-                if not self.__db[k_date][k_cont]['regions'].get(k_regn):
-                    # create if not exist
-                    self.__db[k_date][k_cont]['regions'][k_regn] = {}
-
-                self.__db[k_date][k_cont]['regions'][k_regn] = config
+                country = self._unpack(k_cont, self.__db[k_date][k_cont])
+                country.setdefault('Regions', {})[k_regn] = config
+                self.__db[k_date][k_cont] = self._pack(k_cont, country)
                 logger.debug('БД регіону {} оновлено'.format(k_regn))
                 return
 
-            self.__db[k_date][k_cont] = config
+            self.__db[k_date][k_cont] = self._pack(k_cont, config)
             logger.debug('БД країни {} оновлено'.format(k_cont))
             return
 
-        self.__db[k_date] = config
+        self.__db[k_date] = {country: self._pack(country, cfg) for country, cfg in config.items()}
         logger.debug('БД дати {} оновлено'.format(k_date))
         return
 
@@ -184,6 +377,7 @@ class dbWorker:
         :param config: new config
         '''
         # keys {'date':'*', 'country': '*', 'region': '*'}
+        self.__load()
         k_date = key.get('date')
         k_cont = key.get('country')
         k_regn = key.get('region')
@@ -198,15 +392,16 @@ class dbWorker:
             if not self.__db[k_date].get(k_cont):
                 return default
 
+            config = self._unpack(k_cont, self.__db[k_date][k_cont])
             if key.get('region'):
-                if not self.__db[k_date][k_cont]['regions'].get(k_regn):
+                if not config.get('Regions', {}).get(k_regn):
                     return default
 
-                return self.__db[k_date][k_cont]['regions'][k_regn]
+                return config['Regions'][k_regn]
 
-            return self.__db[k_date][k_cont]
+            return config
 
-        return self.__db[k_date]
+        return {country: self._unpack(country, record) for country, record in self.__db[k_date].items()}
 
     def get_dates_list(self):
         """ Function return list of known dates
@@ -214,1125 +409,2236 @@ class dbWorker:
         Returns:
             list: all the known dates
         """
+        self.__load()
         return self.__db.keys()
 
-    def __is_db_sync(self):
-        # TODO: Check DB is sync
-        return True
+    def iter_dates(self, chunk_size=1 << 16):
+        ''' Iterate through DB entries date by date
 
-    def __del__(self):
-        ''' DB Destructor '''
-        if self.__auto_save:
-            self.save()
+        Loaded DB is iterated in memory. Otherwise the file is streamed and
+        only one date is decoded at a time, so the DB is not loaded at all.
 
+        :param chunk_size: size of the file chunks in bytes
+        :return: generator of (date, data)
+        '''
+        if self.__loaded:
+            yield from self.__unpacked(self.__entries())
+            return
 
-class iCovidBase:
-    ''' Base class with common functionality '''
-    def __init__(self):
-        self.db = dbWorker('icovid.db')
-        self._vocab = {}
-        self._load_vocabs()
+        if not os.path.isfile(self._path):
+            logger.error('Файл БД \'{}\' не існує'.format(self._path))
+            return
 
-    def _load_vocabs(self):
-        vocabs = [file for file in glob.glob("*.vocab")]
+        with open(self._path, 'rb') as fp:
+            yield from JsonStream(iter(lambda: fp.read(chunk_size), b'')).items()
 
-        for vocab in vocabs:
-            slang, dlang = os.path.basename(vocab).split('.')[0].split('_')
+    def __entries(self):
+        ''' Copy of the DB layout, records are replaced on update, so it is enough '''
+        with self.__lock:
+            return [(day, list(data.items())) for day, data in self.__db.items()]
 
-            # create vocabularies if not exist
-            self._vocab[slang] = self._vocab.get(slang, {})
-            self._vocab[slang][dlang] = self._vocab[slang].get(dlang, {})
+    def __unpacked(self, entries):
+        ''' Unpack copied entries date by date '''
+        for day, data in entries:
+            yield day, {country: self._unpack(country, record) for country, record in data}
 
-            with open(vocab, 'r+') as fp:
-                self._vocab[slang][dlang] = json.load(fp)
+    def snapshot(self):
+        ''' Open binary snapshot of the DB file for read-only access
 
-            logger.success('Словник "%s-%s" підвантажено' % (slang, dlang))
+        :return: dbSnapshot object or None if DB is loaded (it may differ
+                 from the file) or snapshot is absent or outdated
+        '''
+        if self.__loaded or not os.path.isfile(self._path + '.snap'):
+            return None
 
-    def _web_request(self, url, headers={}):
-        ''' Function perform HTML page request
+        try:
+            # snapshot is written together with DB under the lock
+            with self.__file_lock.hold(shared=True):
+                snapshot = dbSnapshot(self._path + '.snap')
+        except (OSError, ValueError) as e:
+            logger.warning('Знімок БД не відкрито: %s' % e)
+            return None
 
-        :param url: URL to webpage
-        :return: 'utf-8'-encoded HTML page
-        '''
+        if not snapshot.is_fresh(self._path):
+            logger.debug('Знімок БД застарів')
+            snapshot.close()
+            return None
+
+        return snapshot
+
+    def __file_stat(self):
+        ''' Get size and modification time of the DB file '''
         try:
-            html = requests.get(url, headers=headers).text
-        except Exception as e:
-            logger.warning('Недійсний сертифікат сервера "{}"'.format(url))
-            logger.debug(str(e))
-            if not logger.approve('Не перевіряти сертифікат', default=True):
-                logger.critical('Помилка отримання даних')
-                self.__auto_save = False
-                exit(1)
+            stat = os.stat(self._path)
+        except OSError:
+            return None
 
-            html = requests.get(url, headers=headers, verify=False).text
+        return stat.st_size, stat.st_mtime_ns
 
-        return html  # .decode('utf-8')
+    def __is_db_sync(self):
+        ''' Check DB file was not changed since it was loaded or saved '''
+        return self.__file_stat() == self.__stat
+
+
+class dbSnapshot:
+    ''' Read-only binary snapshot of the DB
+
+    Snapshot is written next to the JSON DB on every save and opened with
+    mmap, so no parsing is needed to read it. All the numbers are int64
+    (little-endian) arrays, so they are accessed as memoryview slices or
+    NumPy views without copying. The file layout:
+        header       magic, version, counts, size and mtime of the JSON DB
+        dates        [dates] ordinals of dates, sorted
+        offsets      [strings + 1] offsets of strings in the string table
+        countries    [countries x 4] name, code, first region, regions count
+        totals       [countries x fields x dates] country fields
+        regions      [regions x dates] number of sick in regions
+        strings      UTF-8 string table
+    Absent values are stored as "missing".
+    '''
+    magic = b'ICVS'
+    version = 1
+    fields = ('Population', 'Tested', 'Sick', 'Recovered', 'Dead')
+    missing = -2 ** 63
+    _header = struct.Struct('<4s6Iqq')
 
-    def _html_get_node(self, html_buffer, pattern, nid=None):
-        ''' Function lookup HTML content
+    def __init__(self, path):
+        ''' Open snapshot
 
-        :param html: WEB page HTML data
-        :param pattern: regex pattern for node
-        :param nid: Node ID if user want specific node
-        :return: all nodes found
+        :param path: path to the snapshot file
         '''
-        tree = html.fromstring(html_buffer)
-        nodes = tree.xpath(pattern)
+        self._path = path
 
-        return nodes[nid] if nid is not None else nodes
+        if sys.byteorder != 'little':
+            raise ValueError('Знімки БД підтримуються лише на little-endian платформах')
 
-    def __del__(self):
-        for slang in self._vocab:
-            for dlang in self._vocab[slang]:
-                vocab = '%s_%s.vocab' % (slang, dlang)
-                with open(vocab, 'w+') as fp:
-                    json.dump(self._vocab[slang][dlang], fp, indent=4, ensure_ascii=False)
+        with open(path, 'rb') as fp:
+            self._mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
 
-        logger.normal('Словники збережено')
+        magic, version, dates, countries, fields, regions, strings, self._src_size, self._src_mtime = \
+            self._header.unpack_from(self._mm)
+        if magic != self.magic or version != self.version or fields != len(self.fields):
+            self._mm.close()
+            raise ValueError('Невідомий формат знімку БД \'{}\''.format(path))
 
+        self._shape = (dates, countries, fields, regions, strings)
+        sizes = [dates, strings + 1, countries * 4, countries * fields * dates, regions * dates]
 
-class iCovid (iCovidBase):
-    def __init__(self, server_mode=False):
-        ''' Constructor '''
-        super().__init__()
+        # int64 sections follow the header one by one
+        body = memoryview(self._mm)[self._header.size:self._header.size + 8 * sum(sizes)].cast('q')
+        self._sections = []
+        for size in sizes:
+            self._sections.append(body[:size])
+            body = body[size:]
 
-        # initialize FTP object
-        self.ftp = FTP()
-        self.ftp.set_debuglevel(0)
+        self._dates, self._offsets, self._countries, self._totals, self._regions = self._sections
+        self._strings = memoryview(self._mm)[self._header.size + 8 * sum(sizes):]
 
-        # server mode flag and credentials data
-        self._server_mode = server_mode
-        self._ftp = {'login': '', 'password': ''}
-        self._smtp = {'email': '', 'password': ''}
+        # index of countries by name
+        self._index = {}
+        for row in range(countries):
+            name, code, first, count = self._countries[row * 4:row * 4 + 4]
+            self._index[self._string(name)] = (row, self._string(code), first, count)
 
-        # storage of errors that happened during data update
-        self.upd_errors = []
+    def _string(self, index):
+        ''' Get string from the string table '''
+        return str(self._strings[self._offsets[index]:self._offsets[index + 1]], 'utf-8')
 
-        # request credentials for FTP and SMTP if server mode used
-        if self._server_mode:
-            logger.normal('Увімкнено автономний режим роботи')
-            logger.normal('Введіть дані для FTP-з\'єднань ..')
-            self._ftp['login'], self._ftp['password'] = self._login()
+    def close(self):
+        ''' Release the mapping, views must not be used after it '''
+        for view in self._sections + [self._strings]:
+            view.release()
+        self._mm.close()
 
-            logger.normal('Введіть дані для SMTP-з\'єднань ..')
-            self._smtp['email'], self._smtp['password'] = self._login()
+    def is_fresh(self, source):
+        ''' Check snapshot is made of the current state of the JSON DB
 
-            if not (self._ftp['login'] and self._ftp['password'] and \
-                    self._smtp['email'] and self._smtp['password']):
-                logger.warning('Деякі дані не отримано. Вони будуть запитані пізніше')
+        :param source: path to the JSON DB
+        :return: TRUE if snapshot is up to date, FALSE otherwise
+        '''
+        try:
+            stat = os.stat(source)
+        except OSError:
+            return False
 
-    def update(self):
-        ''' Update latest data '''
-        # update callbacks
-        upd_cbs = [self._upd_ukr, self._upd_ulv, self._upd_isr, self._upd_pol,
-                   self._upd_rus, self._upd_hug, self._upd_rom]
-        # slovakia - https://korona.gov.sk/en/coronavirus-covid-19-in-the-slovak-republic-in-numbers/
+        return stat.st_size == self._src_size and stat.st_mtime_ns == self._src_mtime
 
-        curr_date = datetime.now().strftime("%d %b %Y")
+    def days(self):
+        ''' Get dates of the snapshot in DB format
 
-        # run update data
-        logger.normal('Оновлюємо дані ..')
-        start = time.time()
+        :return: list of date strings
+        '''
+        return [date.fromordinal(ordinal).strftime('%d %b %Y') for ordinal in self._dates]
 
-        for upd_cb in upd_cbs:
-            try:
-                # try to update and measure duration
-                upd_start = time.time()
-                data = upd_cb()
-                self.db.update({'date': curr_date, 'country': data['Name']}, data)
-                upd_duration = time.time() - upd_start
+    def ordinals(self):
+        ''' Get ordinals of the snapshot dates
 
-                logger.success('Дані з %s оновлені [%fс]' % (data['Name'], upd_duration))
+        :return: memoryview of ordinals
+        '''
+        return self._dates
 
-            except Exception as e:
-                # handle errors and continue data update
-                error_msg = 'Не вдалось оновити дані країни: %s' % upd_cb
-                logger.error(error_msg)
-                self.upd_errors.append([error_msg, traceback.format_exc()])
-                continue
+    def countries(self):
+        ''' Get names of the countries
 
-        duration = time.time() - start
-        logger.debug('Оновлення даних завершено [%fс]' % duration)
+        :return: list of names
+        '''
+        return list(self._index)
 
-    def _upd_ukr(self):
-        config = {'Name': 'Україна', 'Code': 'ukr',
-                  'ViewBoxSz': '0 0 640 410', 'ViewBoxLineSz': 0.7,
-                  'Population': 43762985, 'Area': 603628,
-                  'Tested': 0, 'Sick': 0, 'Recovered': 0, 'Dead': 0,
-                  'Peak': 65000, 'Description': '', 'Cure': 4,
-                  'Regions': {}}
+    def code(self, country):
+        ''' Get code of the country
+
+        :param country: name of the country
+        :return: code or empty string
+        '''
+        return self._index[country][1]
 
-        config['Description'] = 'Розташована в Східній та частково в Центральній Європі, у південно-західній частині Східноєвропейської рівнини.<br><br>Держава-правонаступниця УНР, Гетьманщини, Королівства Руського та Київської Русі.<br><br>Найбільша за площею країна з тих, чия територія повністю лежить у Європі.'
+    def series(self, country, field):
+        ''' Get series of the country field
 
-        # cure 2: https://www.president.gov.ua/news/ukrayina-rozpochinaye-klinichni-doslidzhennya-preparatu-sho-60777
-        # cure 4: https://www.president.gov.ua/en/news/ukrayina-vede-peregovori-z-predstavnikami-covax-stosovno-dos-65217
+        :param country: name of the country
+        :param field: name of the field, one of "fields"
+        :return: memoryview with value per date
+        '''
+        row = self._index[country][0] * len(self.fields) + self.fields.index(field)
+        dates = self._shape[0]
 
-        config = self.__upd_ukr_total(config)
-        config = self.__upd_ukr_regions(config)
+        return self._totals[row * dates:(row + 1) * dates]
 
-        return config
+    def regions(self, country):
+        ''' Get names of the country regions
 
-    def __upd_ukr_total(self, config):
-        # covid19.gov.ua
-        logger.normal(' - Збір загальних даних з covid19.gov.ua ..')
-        page = self._web_request('https://covid19.gov.ua/en/')
+        :param country: name of the country
+        :return: list of names
+        '''
+        _, _, first, count = self._index[country]
+        return [self._string(first + i) for i in range(count)]
 
-        divs = self._html_get_node(page, './/div[contains(@class, \'one-field\') and contains(@class, \'light-box\') and contains(@class, \'info-count\')]')
-        if len(divs) != 4:
-            logger.error('Неочікуване число елементів - %d' % len(divs))
-            exit(1)
+    def region_series(self, country, index):
+        ''' Get number of sick in the region
 
-        for i, case in enumerate(['Sick', 'Recovered', 'Dead', 'Tested']):
-            raw_text = divs[i].xpath('.//div')[0].text.strip()
-            config[case] = int(re.sub(r"\D", "", raw_text))
+        :param country: name of the country
+        :param index: index of the region in regions() list
+        :return: memoryview with value per date
+        '''
+        _, _, first, count = self._index[country]
+        if not 0 <= index < count:
+            raise IndexError('Невідомий регіон')
 
-        return config
+        # region names follow country strings, so string index is a row
+        row = first - 2 * len(self._index) + index
+        dates = self._shape[0]
 
-    def __upd_ukr_regions(self, config):
-        # moz.gov.ua
-        # detailed - https://index.minfin.com.ua/ua/reference/coronavirus/ukraine/
-        logger.normal(' - Збір даних про регіони з index.minfin.com.ua ..')
-        page = self._web_request('https://index.minfin.com.ua/ua/reference/coronavirus/ukraine/')
-
-        # initial regions data
-        initial = ["Автономна Республіка Крим", "Вінницька область",
-                   "Волинська область", "Дніпропетровська область",
-                   "Донецька область", "Житомирська область",
-                   "Закарпатська область", "Запорізька область",
-                   "Івано-Франківська область", "Кіровоградська область",
-                   "м. Київ", "м. Севастополь", "Київська область",
-                   "Львівська область", "Луганська область",
-                   "Миколаївська область", "Одеська область",
-                   "Полтавська область", "Рівненська область",
-                   "Сумська область", "Тернопільська область",
-                   "Харківська область", "Херсонська область",
-                   "Хмельницька область", "Чернівецька область",
-                   "Черкаська область", "Чернігівська область"]
-        config['Regions'] = {k: 0 for k in initial}
-
-        # used to store data under better regions naming
-        name_mapping = {"Вінницька": "Вінницька область",
-                        "Волинська": "Волинська область",
-                        "Дніпро­петровська": "Дніпропетровська область",
-                        "Донецька": "Донецька область",
-                        "Житомирська": "Житомирська область",
-                        "Закарпатська": "Закарпатська область",
-                        "Запорізька": "Запорізька область",
-                        "Івано-Франківська": "Івано-Франківська область",
-                        "Київська": "Київська область",
-                        "Кірово­градська": "Кіровоградська область",
-                        "Луганська": "Луганська область",
-                        "Львівська": "Львівська область",
-                        "Миколаївська": "Миколаївська область",
-                        "Одеська": "Одеська область",
-                        "Полтавська": "Полтавська область",
-                        "Рівненська": "Рівненська область",
-                        "Сумська": "Сумська область",
-                        "Тернопільська": "Тернопільська область",
-                        "Харківська": "Харківська область",
-                        "Херсонська": "Херсонська область",
-                        "Хмельницька": "Хмельницька область",
-                        "Черкаська": "Черкаська область",
-                        "Чернівецька": "Чернівецька область",
-                        "Чернігівська": "Чернігівська область",
-                        "м.Київ": "м. Київ"}
-
-        rows = self._html_get_node(page, './/div[@class="compact-table expand-table"]//table//tr')
-        for row in rows:
-            items = row.xpath('.//td')
-
-            if len(items) == 0 or len(items[0]) == 0:
-                continue
-            if items[0][0].text in name_mapping:
-                config['Regions'][name_mapping.get(items[0][0].text, items[0][0].text)] = int(items[1].text)
+        return self._regions[row * dates:(row + 1) * dates]
 
-        return config
+    def numpy(self):
+        ''' Get NumPy views of the snapshot (requires numpy)
 
-    def _upd_ulv(self):
-        config = {'Name': 'Львівщина', 'Code': 'ulv',
-                  'ViewBoxSz': '0 0 1300 1300', 'ViewBoxLineSz': 2,
-                  'Population': 2529608, 'Area': 21833,
-                  'Tested': 0, 'Sick': 0, 'Recovered': 0, 'Dead': 0,
-                  'Peak': 5000, 'Description': '', 'Cure': 4,
-                  'Regions': {}}
+        :return: tuple of (dates, totals, regions) arrays with shapes
+                 [dates], [countries, fields, dates], [regions, dates]
+                 or None if numpy is absent
+        '''
+        try:
+            import numpy
+        except ImportError:
+            logger.error('Для NumPy представлення потрібен модуль numpy')
+            return None
 
-        config['Description'] = 'Одна з трьох областей історико-культурного регіону Галичина, частини Карпатського регіону.<br><br>Одна з найрозвиненіших областей в економічному, туристичному, культурному та науковому напрямках.'
+        dates, countries, fields, regions, _ = self._shape
+        arrays = [numpy.frombuffer(view, dtype='<i8') for view in (self._dates, self._totals, self._regions)]
 
-        # cure 2: https://www.president.gov.ua/news/ukrayina-rozpochinaye-klinichni-doslidzhennya-preparatu-sho-60777
-        # cure 4: https://www.president.gov.ua/en/news/ukrayina-vede-peregovori-z-predstavnikami-covax-stosovno-dos-65217
+        return arrays[0], arrays[1].reshape(countries, fields, dates), arrays[2].reshape(regions, dates)
 
-        config = self.__upd_ulv_total(config)
-        config = self.__upd_ulv_regions(config)
+    @classmethod
+    def write(cls, path, entries, source):
+        ''' Write snapshot of the DB
 
-        return config
+        File is replaced at once, so readers keep the previous mapping.
 
-    def __upd_ulv_total(self, config):
-        # covid19.gov.ua
-        logger.normal(' - Збір загальних даних з index.minfin.com.ua ..')
-        page = self._web_request('https://index.minfin.com.ua/ua/reference/coronavirus/ukraine/')
+        :param path: path to the snapshot file
+        :param entries: iterable of (date, data) DB entries
+        :param source: path to the JSON DB the snapshot is made of
+        '''
+        entries = sorted(((datetime.strptime(day, '%d %b %Y').toordinal(), data) for day, data in entries),
+                         key=lambda entry: entry[0])
+        dates = len(entries)
+
+        # strings: country names, codes, then regions of all countries
+        names, codes, regions = {}, {}, {}
+        for _, data in entries:
+            for name, cfg in data.items():
+                names.setdefault(name, len(names))
+                codes[name] = cfg.get('Code', codes.get(name, ''))
+                for region in cfg.get('Regions', {}):
+                    regions.setdefault(name, {}).setdefault(region, None)
+
+        strings = list(names) + [codes[name] for name in names]
+        countries = array.array('q')
+        for name in names:
+            countries.extend([names[name], len(names) + names[name], len(strings), len(regions.get(name, {}))])
+            regions[name] = {region: row for row, region in enumerate(regions.get(name, {}), len(strings))}
+            strings += list(regions[name])
+
+        # fill matrices with values
+        first_region = 2 * len(names)
+        totals = array.array('q', [cls.missing]) * (len(names) * len(cls.fields) * dates)
+        sick = array.array('q', [cls.missing]) * ((len(strings) - first_region) * dates)
+        for column, (_, data) in enumerate(entries):
+            for name, cfg in data.items():
+                row = names[name] * len(cls.fields)
+                for shift, field in enumerate(cls.fields):
+                    if cfg.get(field) is not None:
+                        totals[(row + shift) * dates + column] = int(cfg[field])
+
+                index = regions[name]
+                for region, value in cfg.get('Regions', {}).items():
+                    if value is not None:
+                        sick[(index[region] - first_region) * dates + column] = int(value)
+
+        blob = bytearray()
+        offsets = array.array('q', [0])
+        for string in strings:
+            blob += string.encode('utf-8')
+            offsets.append(len(blob))
+
+        stat = os.stat(source)
+        header = cls._header.pack(cls.magic, cls.version, dates, len(names), len(cls.fields),
+                                  len(strings) - first_region, len(strings), stat.st_size, stat.st_mtime_ns)
+
+        with open(path + '.tmp', 'wb') as fp:
+            fp.write(header)
+            for section in (array.array('q', [entry[0] for entry in entries]), offsets, countries, totals, sick):
+                if sys.byteorder != 'little':
+                    section.byteswap()
+                fp.write(section.tobytes())
+            fp.write(blob)
+
+        os.replace(path + '.tmp', path)
+
+
+class summaryWorker:
+    ''' Daily summary of the DB used by CLI and web views
+
+    Summary keeps per-date and per-country totals, deltas against the
+    previous day and regions ranked by number of sick with their danger
+    zones, so views do not recompute anything on their own.
+    '''
+    # metrics stored in the summary
+    metrics = ['Tested', 'Sick', 'Recovered', 'Dead']
+
+    # number of danger zones
+    zones = 5
 
-        rows = self._html_get_node(page, './/div[@class="compact-table expand-table"]//table//tr')
-        for row in rows:
-            items = row.xpath('.//td')
-            if len(items) == 0 or len(items[0]) == 0:
-                continue
-            elif items[0][0].text == 'Львівська':
-                config['Sick'] = int(items[1].text)
-                config['Dead'] = int(items[3].text)
-                config['Recovered'] = int(items[5].text)
-
-        # headers required to get access to the mae.ro web-page
-        hdrs = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:82.0) Gecko/20100101 Firefox/82.0'}
-
-        # get intial page to find out final link with tested persond data
-        page = self._web_request('http://ses.lviv.ua/')
-        links = self._html_get_node(page, './/div[@class="moduletable"]//ul//li//a')
-
-        # go through all available paragraphs and look for the link
-        target_link = ''
-        for link in links:
-            if 'Covid-19 у Львівській області станом на' in link.text:
-                target_link = 'http://ses.lviv.ua' + link.attrib['href']
-                break
+    def __init__(self, path):
+        ''' Summary constructor
 
-        if target_link:
-            logger.debug('Цільове посилання: {} ..'.format(target_link))
-            # get the page with tested persons quanity
-            page = self._web_request(target_link, headers=hdrs)
-            paragraphs = self._html_get_node(page, './/div[@class="item-page news-page"]//div//p')
+        :param path: path to the summary file
+        '''
+        self._path = path
+        self.__summary = {}
+        self.__lock = threading.RLock()
 
-            for p in paragraphs:
-                if p.text_content() and 'Всього проведено' in p.text_content().strip():
-                    config['Tested'] = int(p.text_content().split()[2])
-                    break
+        if os.path.isfile(self._path):
+            with open(self._path, 'r') as fp:
+                self.__summary = json.load(fp)
 
-        return config
+    def save(self):
+        ''' Store summary to the file
 
-    def __upd_ulv_regions(self, config):
-        # moz.gov.ua
-        # detailed - https://index.minfin.com.ua/ua/reference/coronavirus/ukraine/
-        logger.normal(' - Збір даних про регіони з ses.lviv.ua ..')
-        # page = self._web_request(tested_links[0])
-
-        # initial regions data
-        initial = ["Бродівський район", "Буський район", "Городоцький район",
-                   "Дрогобицький район",  # Борислав, Стебник, Дрогобич, Трускавець
-                   "Жидачівський район", "Жовківський район", "Золочівський район",
-                   "Кам'янка-Бузький район", "Миколаївський район",  # Новий Розділ
-                   "Мостиський район", "Перемишлянський район", "Пустомитівський район",
-                   "Радехівський район", "Самбірський район",  # Самбір
-                   "Сколівський район", "Сокальський район",  # Червоноград
-                   "Старосамбірський район", "Стрийський район",  # Моршин, Стрий
-                   "Турківський район", "Яворівський район",
-                   "м. Львів"]
-        config['Regions'] = {k: 0 for k in initial}
-
-        sub_regions_mapping = {
-            'Львова': 'м. Львів',
-            'Борислав': 'Дрогобицький район',
-            'Бродівськ': 'Бродівський район',
-            'Буськ': 'Буський район',
-            'Городоцьк': 'Городоцький район',
-            'Дрогобицьк': 'Дрогобицький район',
-            'Дрогобич': 'Дрогобицький район',
-            'Стебник': 'Дрогобицький район',
-            'Жидачівськ': 'Жидачівський район',
-            'Жовківськ': 'Жовківський район',
-            'Золочівськ': 'Золочівський район',
-            'Кам’янка-Бузьк': 'Кам\'янка-Бузький район',
-            'Миколаївськ': 'Миколаївський район',
-            'Моршин': 'Стрийський район',
-            'Мостиськ': 'Мостиський район',
-            'Новий Розділ': 'Миколаївський район',
-            'Перемишлянськ': 'Перемишлянський район',
-            'Пустомитівськ': 'Пустомитівський район',
-            'Радехівськ': 'Радехівський район',
-            'Самбір': 'Самбірський район',
-            'Самбірськ': 'Самбірський район',
-            'Сколівськ': 'Сколівський район',
-            'Сокальськ': 'Сокальський район',
-            'Старосамбірськ': 'Старосамбірський район',
-            'Стрий': 'Стрийський район',
-            'Стрийськ': 'Стрийський район',
-            'Трускавець': 'Дрогобицький район',
-            'Турківськ': 'Турківський район',
-            'Червоноград': 'Сокальський район',
-            'Яворівськ': 'Яворівський район'
-        }
-
-        # headers required to get access to the mae.ro web-page
-        hdrs = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:82.0) Gecko/20100101 Firefox/82.0'}
-
-        # get intial page to find out final link with tested persond data
-        page = self._web_request('http://ses.lviv.ua/')
-        links = self._html_get_node(page, './/div[@class="moduletable"]//ul//li//a')
-
-        # go through all available paragraphs and look for the link
-        target_link = ''
-        for link in links:
-            if 'Covid-19 у Львівській області станом на' in link.text:
-                target_link = 'http://ses.lviv.ua' + link.attrib['href']
-                break
+        Summaries of dates are replaced on refresh and never changed, so
+        only the copy of the dict is taken under the lock.
+        '''
+        with self.__lock:
+            summary = dict(self.__summary)
 
-        if target_link:
-            logger.debug('Цільове посилання: {} ..'.format(target_link))
-            # get the page with regions sick quanity
-            page = self._web_request(target_link, headers=hdrs)
-            # extract text content of each data node
-            paragraphs = [p.text_content() for p in self._html_get_node(page, './/div[@class="item-page news-page"]//div//p')]
+        with atomic_write(self._path) as fp:
+            json.dump(summary, fp, ensure_ascii=False, separators=(',', ':'))
 
-            for ptext in paragraphs:
-                if not ptext:
-                    # no text in the paragraph
-                    continue
+        logger.debug('Зведені дані збережено')
 
-                for k, v in sub_regions_mapping.items():
-                    # look for the region in the aragraph text
-                    if k in ptext:
-                        try:
-                            local_sick = int(ptext.split('/')[0].replace('–', ' ').replace('-', ' ').split()[-1])
-                            config['Regions'][v] += local_sick
-                        except ValueError:
-                            # there may be incorrect web page formatting that will cause value error
-                            pass
-                        break
+    def get(self, day, country=None):
+        ''' Get summary for the date
 
-        return config
+        :param day: date string
+        :param country: country name, all countries if not specified
+        :return: summary or None if not calculated yet
+        '''
+        summary = self.__summary.get(day)
+        if summary is None or country is None:
+            return summary
 
-    def _upd_isr(self):
-        config = {'Name': 'Ізраїль', 'Code': 'isr',
-                  'ViewBoxSz': '0 0 250 800', 'ViewBoxLineSz': 1.0,
-                  'Population': 8638917, 'Area': 20770,
-                  'Tested': 0, 'Sick': 0, 'Recovered': 0, 'Dead': 0,
-                  'Peak': 80000, 'Description': '', 'Cure': 6,
-                  'Regions': {},
-                  'vii': ['💬 Дані з регіонів Ізраїлю відсутні у відкритому доступі.<br><br>👉 Публікація останніх відкритих даних відбулась 30 квітня 2020 року.<br><br>👉 Регіональний розподіл виконаний рівномірно на основі розподілу кількості населення у регіонах.', '💬']}
+        return summary['countries'].get(country)
 
-        config['Description'] = 'Розташований на східному узбережжі Середземного моря. Незалежність проголошено 14 травня 1948 року (5 іяра 5708 року).<br><br>Ізраїль є єврейською державою. Упродовж трьох тисячоліть слово «Ізраїль» позначає Землю Ізраїльську (івр. אֶרֶץ יִשְׂרָאֵל‎, Е́рец-Їсрае́ль) і весь єврейський народ.<br><br>Джерелом назви слугує Книга Буття, де Яків, син Ісаака, після боротьби з ангелом Бога отримує ім\'я Ізраїль.'
+    def get_last_date(self):
+        ''' Get the most recent date of the summary '''
+        if not self.__summary:
+            return None
 
-        # cure 3: https://www.ukrinform.ua/rubric-world/2899971-vakcina-proti-koronavirusu-oglad-svitovih-rozrobok.html
-        # cure 6: https://www.aljazeera.com/news/2020/12/19/netanyahu-gets-covid-vaccine-starts-israel-rollout
-        # https://data.gov.il/dataset/covid-19/resource/d07c0771-01a8-43b2-96cc-c6154e7fa9bd
-        # https://data.gov.il/dataset/covid-19/resource/dcf999c1-d394-4b57-a5e0-9d014a62e046#collapse-endpoints
-        # https://coronaupdates.health.gov.il/
+        return max(self.__summary, key=lambda day: datetime.strptime(day, '%d %b %Y'))
 
-        config = self.__upd_isr_total(config)
-        config = self.__upd_isr_regions(config)
+    def refresh(self, db, day, countries=None):
+        ''' Update summary rows for the date
 
-        return config
+        Only rows which source data changed since the previous refresh
+        are recalculated.
 
-    def __upd_isr_total(self, config):
-        # govextra.gov.il
-        # Palestine: https://corona.ps/
-        logger.normal(' - Збір загальних даних з worldometers.info ..')
-        page = self._web_request('https://www.worldometers.info/coronavirus/')
+        :param db: dbWorker object
+        :param day: date string
+        :param countries: names of the changed countries, all if not specified
+        :return: number of recalculated rows
+        '''
+        with self.__lock:
+            return self.__refresh(db, day, countries)
 
-        countries = self._html_get_node(page, './/table[@id="main_table_countries_today"]/tbody/tr')
-        for country in countries:
-            nodes = country.xpath('.//td//a')
+    def __refresh(self, db, day, countries=None):
+        ''' Update summary rows under the lock '''
+        today = db.get({'date': day})
+        if not today:
+            return 0
 
-            # check if there is name of country and it is Israel
-            if len(nodes) > 0 and nodes[0].text == 'Israel':
-                break
+        yestd_date = (datetime.strptime(day, '%d %b %Y') - timedelta(days=1)).strftime('%d %b %Y')
+        yestd = db.get({'date': yestd_date}, today)
 
-        config['Sick'] = int(country.xpath('.//td')[2].text.replace(',', ''))
-        config['Dead'] = int(country.xpath('.//td')[4].text.replace(',', ''))
-        config['Recovered'] = int(country.xpath('.//td')[6].text.replace(',', ''))
-        config['Tested'] = int(country.xpath('.//td')[12].text.replace(',', ''))
+        # summary is replaced, not changed, as it may be saved at the moment
+        rows = dict(self.__summary.get(day, {}).get('countries', {}))
+        refreshed = 0
 
-        return config
+        for country in countries if countries is not None else today:
+            cfg = today.get(country)
+            if not cfg:
+                continue
 
-    def __upd_isr_regions(self, config):
-        # news.google.com
-        logger.normal(' - Збір даних про регіони з news.google.com ..')
-        page = self._web_request('https://news.google.com/covid19/map?hl=uk&gl=UA&ceid=UA%3Auk&mid=%2Fm%2F03spz')
-
-        # initial regions data
-        initial = ['Єрусалимський округ', "Центральний округ (Хамерказ)",
-                   'Тель-Авівський округ', "Північний округ (Хацафон)",
-                   'Південний округ (Хадаром)', "Хайфський округ (Хейфа)",
-                   'Голанські Висоти', 'Палестина']
-        config['Regions'] = {k: 0 for k in initial}
-
-        # used to store data under better regions naming
-        name_mapping = {"Єрусалим": "Єрусалимський округ",
-                        "Хадаром": "Південний округ (Хадаром)",
-                        "Північний округ": "Північний округ (Хацафон)",
-                        "Хамерказ": "Центральний округ (Хамерказ)",
-                        "Хефа": "Хайфський округ (Хейфа)"}
-
-        # Населення Ізраїлю
-        # Єрусалим         - 1 075 900 / 8 638 917 = 12.45
-        # Центральний      - 2 108 700 / 8 638 917 = 24.41
-        # Тель-Авів        - 1 381 300 / 8 638 917 = 15.99
-        # Північний округ  - 1 394 200 / 8 638 917 = 16.14
-        # Південний округ  - 1 237 100 / 8 638 917 = 14.32
-        # Хайвський округ  -   989 200 / 8 638 917 = 11.45
-        # Голанські Висоти -    49 700 / 8 638 917 =  0.58
-        # Палестина        -   402 817 / 8 638 917 =  4.66
-        pop_per_district = {
-                'Єрусалимський округ': 12.45,
-                'Центральний округ (Хамерказ)': 24.41,
-                'Тель-Авівський округ': 15.99,
-                'Північний округ (Хацафон)': 16.14,
-                'Південний округ (Хадаром)': 14.32,
-                'Хайфський округ (Хейфа)': 11.45,
-                'Голанські Висоти': 0.58,
-                'Палестина': 4.66
-            }
-
-        config['Regions'] = {k: int(v * config['Sick'] / 100.0) for k, v in pop_per_district.items()}
-
-        # MANUAL. DAILY.
-        # This data is unavailable in public web-sites. Actual for 30 Apr 2020.
-        # config['Regions'] = {
-        #     'Єрусалимський округ': 2418,
-        #     'Центральний округ (Хамерказ)': 1524,
-        #     'Тель-Авівський округ': 483,
-        #     'Північний округ (Хацафон)': 400,
-        #     'Південний округ (Хадаром)': 310,
-        #     'Хайфський округ (Хейфа)': 142,
-        #     'Голанські Висоти': 0,
-        #     'Палестина': 0
-        # }
-
-        # update Palestine separately
-        page = self._web_request('https://news.google.com/covid19/map?hl=uk&gl=UA&ceid=UA%3Auk&mid=%2Fm%2F01k0p4')
-
-        palestine = self._html_get_node(page, './/tbody[@class="ppcUXd"]//tr', nid=1)
-        sick = palestine.xpath('.//td')[0].text.strip().replace('\xa0', '')
-        config['Regions']['Палестина'] = int(sick)
+            ycfg = yestd.get(country, cfg)
+            digest = hashlib.md5(json.dumps([cfg, ycfg], sort_keys=True).encode()).hexdigest()
 
-        return config
+            if rows.get(country, {}).get('digest') == digest:
+                # source data was not changed
+                continue
 
-    def _upd_pol(self):
-        config = {'Name': 'Польща', 'Code': 'pol',
-                  'ViewBoxSz': '0 0 650 600', 'ViewBoxLineSz': 0.8,
-                  'Population': 37851327, 'Area': 312679,
-                  'Tested': 0, 'Sick': 0, 'Recovered': 0, 'Dead': 0,
-                  'Peak': 90000, 'Description': '', 'Cure': 5,
-                  'Regions': {},
-                  'vii': ['💬 Узагальнені дані з воєводств Польщі відсутні у відкритому доступі.<br><br>👉 Міністерство охорони здоров\\\'я Польщі змінило формат подання щоденної статистики з грудня 2020 року.<br><br>👉 Місцеві дані відображають кількість хворих за попередню добу.', '💬']}
+            rows[country] = self._make_row(cfg, ycfg)
+            rows[country]['digest'] = digest
+            refreshed += 1
 
-        config['Description'] = 'Держава в Центральній Європі. За даними перепису населення, що відбувся у 2015 році, у країні проживало понад 38,5 мільйонів осіб.<br><br>Польща є п&apos;ятою за кількістю населення країною ЄС, дев&apos;ятою в Європі за площею та восьмою за населенням. Близько 61 % населення проживає в містах.'
+        # keep countries order of the DB
+        self.__summary[day] = {'updated': '{:%d %b %Y [%H:%M:%S]}'.format(datetime.now()),
+                               'countries': {k: rows[k] for k in today if k in rows}}
 
-        # cure 1: https://www.ukrinform.ua/rubric-world/2899971-vakcina-proti-koronavirusu-oglad-svitovih-rozrobok.html
-        # cure 5: https://notesfrompoland.com/2020/12/02/poland-announces-covid-vaccine-plan-aiming-for-70-80-of-population-to-vaccinate/
+        logger.debug('Зведені дані за %s: оновлено %d рядків' % (day, refreshed))
+        return refreshed
 
-        config = self.__upd_pol_total(config)
-        config = self.__upd_pol_regions(config)
+    def _make_row(self, cfg, ycfg):
+        ''' Calculate summary row of the country
 
-        return config
+        :param cfg: country config for the date
+        :param ycfg: country config for the previous date
+        :return: summary row
+        '''
+        row = {'Name': cfg['Name'], 'Population': cfg['Population'], 'Area': cfg['Area']}
 
-    def __upd_pol_total(self, config):
-        # news.google.com
-        logger.normal(' - Збір загальних даних з worldometers.info ..')
-        page = self._web_request('https://www.worldometers.info/coronavirus/')
+        for metric in self.metrics:
+            row[metric] = cfg[metric]
+            row['d_' + metric] = cfg[metric] - ycfg.get(metric, cfg[metric])
 
-        data = None
-        countries = self._html_get_node(page, './/table[@id="main_table_countries_today"]/tbody/tr')
-        for country in countries:
-            nodes = country.xpath('.//td//a')
+        # rank regions by number of sick
+        regions = [[k, v, v - ycfg['Regions'].get(k, v)] for k, v in cfg['Regions'].items()]
+        regions.sort(key=lambda it: it[1], reverse=True)
 
-            # check if there is name of country and it is Poland
-            if len(nodes) > 0 and nodes[0].text == 'Poland':
-                data = country
-                break
+        if regions:
+            min_sick = min(it[1] for it in regions)
+            sick_step = (max(it[1] for it in regions) + 1 - min_sick) / self.zones
 
-        config['Sick'] = int(country.xpath('.//td')[2].text.replace(',', ''))
-        config['Dead'] = int(country.xpath('.//td')[4].text.replace(',', ''))
-        config['Recovered'] = int(country.xpath('.//td')[6].text.replace(',', ''))
-        config['Tested'] = int(country.xpath('.//td')[12].text.replace(',', ''))
+            min_dsick = min(it[2] for it in regions)
+            dsick_step = (max(it[2] for it in regions) + 1 - min_dsick) / self.zones
 
-        return config
+            for reg in regions:
+                reg.append(int((reg[1] - min_sick) // sick_step))
+                reg.append(int((reg[2] - min_dsick) // dsick_step))
 
-    def __upd_pol_regions(self, config):
-        # news.google.com
-        logger.normal(' - Збір даних про регіони з www.gov.pl ..')
-        page = self._web_request('https://www.gov.pl/web/koronawirus/wykaz-zarazen-koronawirusem-sars-cov-2')
-
-        with open('page_pol.html', 'w+') as fp:
-            fp.write(page)
-
-        # initial regions data
-        initial = ['Мазовецьке воєводство', 'Сілезьке воєводство',
-                   'Нижньосілезьке воєводство', 'Великопольське воєводство',
-                   'Лодзьке воєводство', 'Малопольське воєводство',
-                   'Куявсько-Поморське воєводство', 'Поморське воєводство',
-                   'Опольске воєводство', 'Західнопоморське воєводство',
-                   'Підляське воєводство', 'Люблінське воєводство',
-                   'Підкарпатське воєводство', 'Свентокшиське воєводство',
-                   'Вармінсько-Мазурське воєводство', 'Любуське воєводство']
-        config['Regions'] = {k: 0 for k in initial}
-
-        # used to store data under better regions naming
-        name_mapping = {'mazowieckie': 'Мазовецьке воєводство',
-                        'śląskie': 'Сілезьке воєводство',
-                        'dolnośląskie': 'Нижньосілезьке воєводство',
-                        'łódzkie': 'Лодзьке воєводство',
-                        'małopolskie': 'Малопольське воєводство',
-                        'kujawsko-pomorskie': 'Куявсько-Поморське воєводство',
-                        'pomorskie': 'Поморське воєводство',
-                        'opolskie': 'Опольске воєводство',
-                        'zachodniopomorskie': 'Західнопоморське воєводство',
-                        'podkarpackie': 'Підкарпатське воєводство',
-                        'warmińsko-mazurskie': 'Вармінсько-Мазурське воєводство',
-                        'lubuskie': 'Любуське воєводство',
-                        'świętokrzyskie': 'Свентокшиське воєводство',
-                        'wielkopolskie': 'Великопольське воєводство',
-                        'podlaskie': 'Підляське воєводство',
-                        'lubelskie': 'Люблінське воєводство'}
-
-        # get regions. skip first two general nodes
-        regs_data = json.loads(self._html_get_node(page, './/pre[@id="registerData"]')[0].text)['data']
-        regions = [row.split(';') for row in regs_data.split('\n') if len(row.split(';')) > 1][2:]
-        for region in regions:
-            reg = region[0]
-            reg_name = name_mapping.get(reg, reg)
-
-            sick = int(region[1].replace(' ', ''))
-            config['Regions'][reg_name] = int(sick) if sick != '—' else 0
+        # each region is [name, sick, d_sick, sick zone, d_sick zone]
+        row['Regions'] = regions
+        return row
 
-        return config
+    def render(self, day, translate, metrics=None):
+        ''' Render summary for the CLI
 
-    def _upd_rus(self):
-        config = {'Name': 'Московія', 'Code': 'rus',
-                  'ViewBoxSz': '0 0 1250 800', 'ViewBoxLineSz': 0.8,
-                  'Population': 145927292, 'Area': 17098246,
-                  'Tested': 0, 'Sick': 0, 'Recovered': 0, 'Dead': 0,
-                  'Peak': 70000, 'Description': '', 'Cure': 6,
-                  'Regions': {}}
+        :param day: date string
+        :param translate: function used to translate text
+        :param metrics: metricsWorker object, metrics are not shown if not specified
+        :return: rendered text
+        '''
+        def fmt(value, tmpl='{}'):
+            return '—' if value is None else tmpl.format(value)
 
-        config['Description'] = 'Федеративна республіка у північній Євразії. Початки державності відносять до періоду Русі — середньовічної держави із центром в Києві, під час розпаду якої, її північно-східні провінції перейшли під владу Золотої Орди, а пізніше стали основою майбутньої Московської держави.<br><br>У березні 2014 року здійснила військову агресію проти України, анексувавши Крим та Севастополь. Веде гібридну війну на Донбасі з метою окупації України.'
+        summary = self.__summary.get(day)
+        if not summary:
+            return translate('eng', 'ukr', '\n * Немає даних за %s\n' % day)
 
-        # cure 3: https://www.aa.com.tr/en/latest-on-coronavirus-outbreak/russia-to-hold-phase-3-of-covid-19-vaccine-trial-abroad/1912694
-        # cure 6: https://www.bbc.com/news/world-europe-55221785
+        # date and time of the latest refresh
+        text = translate('eng', 'ukr', '\n * Дані станом на {}\n'.format(summary['updated']))
 
-        config = self.__upd_rus_total(config)
-        config = self.__upd_rus_regions(config)
+        for country, row in summary['countries'].items():
+            # country information
+            text += '\n   [ %s ] ' % Font.set(Font.fg.cyan, country)
+            text += 'Населення {:,} людей на {:,} км2 ({:.2f} л/км2)\n' \
+                    .format(row['Population'], row['Area'],
+                            row['Population'] / row['Area'])
 
-        return config
+            # total information
+            text += ' .{:-<76}.\n'.format('')
+            block = '   {:>10} | {:^20} | {:<+7}  {:>10} | {:^20} | {:<+7}\n'
 
-    def __upd_rus_total(self, config):
-        # news.google.com
-        # https://covid.ourworldindata.org/data/owid-covid-data.json
-        logger.normal(' - Збір загальних даних з covid19.rosminzdrav.ru ..')
-        page = self._web_request('https://covid19.rosminzdrav.ru/wp-json/api/mapdata/')
-        data = json.loads(page)['Items']
+            text += block.format(row['Tested'], Font.set(Font.fg.grey, 'Перевірені'), row['d_Tested'],
+                                 row['Recovered'], Font.set(Font.fg.green, 'Одужали'), row['d_Recovered'])
 
-        # config['Tested'] = sum([it['Observations'] for it in data])
-        config['Sick'] = sum([it['Confirmed'] for it in data])
-        config['Recovered'] = sum([it['Recovered'] for it in data])
-        config['Dead'] = sum([it['Deaths'] for it in data])
+            text += block.format(row['Sick'], Font.set(Font.fg.yellow, 'Хворі'), row['d_Sick'],
+                                 row['Dead'], Font.set(Font.fg.red, 'Померли'), row['d_Dead'])
 
-        page = self._web_request('https://www.worldometers.info/coronavirus/')
+            # derived metrics
+            c_metrics = metrics.get(country, day=day) if metrics else None
+            if c_metrics:
+                text += ' +{:-<76}+\n'.format('')
+                text += '   На 100 тис.: {} за 7 днів, {} за 14 днів | Rt {} | Приріст {} | Позитивних {}\n' \
+                        .format(fmt(c_metrics['Incidence7']), fmt(c_metrics['Incidence14']),
+                                fmt(c_metrics['Rt'], '{:.2f}'), fmt(c_metrics['Growth'], '{:.2f}'),
+                                fmt(c_metrics['Positivity'], '{}%'))
 
-        countries = self._html_get_node(page, './/table[@id="main_table_countries_today"]/tbody/tr')
-        for country in countries:
-            nodes = country.xpath('.//td//a')
+            # separator
+            text += ' +{:-<76}+\n'.format('')
 
-            # check if there is name of country and it is Russia
-            if len(nodes) > 0 and nodes[0].text == 'Russia':
-                break
+            # regions information
+            if row['Regions']:
+                # 5 zones Fonted by unique Font
+                zones = {0: Font.fg.white, 1: Font.fg.yellow,
+                         2: Font.fg.orange, 3: Font.fg.lightred,
+                         4: Font.fg.red}
 
-        config['Tested'] = int(country.xpath('.//td')[12].text.replace(',', ''))
+                text += '   Рівні небезпеки: %s\n' % ' '.join(Font.set(zones[i], str(i)) for i in range(5))
+                text += ' +{:-<76}+\n'.format('')
 
-        return config
+                for region, sick, d_sick, zone, d_zone in row['Regions']:
+                    r_metrics = metrics.get(country, region, day) if metrics else None
+                    rt = 'Rt ' + fmt(r_metrics['Rt'], '{:.2f}') if r_metrics else ''
 
-    def __upd_rus_regions(self, config):
-        # news.google.com
-        logger.normal(' - Збір даних про регіони з covid19.rosminzdrav.ru ..')
-        page = self._web_request('https://covid19.rosminzdrav.ru/wp-json/api/mapdata/')
-        data = json.loads(page)['Items']
-
-        # initial regions data
-        initial = ['м. Москва', 'Московська область',
-                   'м. Санкт-Петербург', 'Нижньогородська область',
-                   'Республіка Дагестан', 'Мурманська область',
-                   'Краснодарський край', 'Тульська область',
-                   'Ростовська область', 'Свердловська область',
-                   'Калузька область', 'Брянська область',
-                   'Республіка Татарстан', 'Рязанська область',
-                   'Республіка Північна Осетія - Аланія',
-                   'Ленінградська область', 'Республіка Башкортостан',
-                   'Курська область', 'Тамбовська область',
-                   'Володимирська область', 'Республіка Інгушетія',
-                   'Кабардино-Балкарська республіка', 'Республіка Мордовія',
-                   'Ямало-Ненетський авт. округ', 'Республіка Чувашія',
-                   'Ярославська область', 'Красноярський край',
-                   'Саратовська область', 'Новосибірська область',
-                   'Ставропольський край', 'Орловська область',
-                   'Челябінська область', 'Оренбурзька область',
-                   'Республіка Марій Ел', 'Хабаровський край',
-                   'Самарська область', 'Республіка Комі',
-                   'Волгоградська область', 'Тверська область',
-                   'Воронезька область', 'Приморський край',
-                   'Липецька область', 'Пермський край',
-                   'Кіровська область', 'Тюменська область',
-                   'Чеченська Республіка', 'Ульянівська область',
-                   'Пензенська область', 'Іванівська область',
-                   'Смоленська область', 'Калінінградська область',
-                   'Астраханська область', 'Алтайський край',
-                   'Білгородська область', 'Ханти-Мансійський авт. округ',
-                   'Республіка Бурятія', 'Карачаєво-Черкеська Республіка',
-                   'Новгородська область', 'Республіка Саха (Якутія)',
-                   'Республіка Калмикія', 'Архангельська область',
-                   'Республіка Хакасія', 'Камчатський край',
-                   'Удмуртська Республіка', 'Костромська область',
-                   'Псковська область', 'Забайкальський край',
-                   'Іркутська область', 'Вологодська область',
-                   'Омська область', 'Республіка Адигея',
-                   'Кемеровська область', 'Томська область',
-                   'Єврейська автономна область', 'Магаданська область',
-                   'Республіка Карелія', 'Амурська область',
-                   'Курганська область', 'Республіка Тива (Тува)',
-                   'Ненецький авт. округ', 'Сахалінська область',
-                   'Чукотський авт. округ', 'Республіка Алтай']
-        config['Regions'] = {k: 0 for k in initial}
-
-        # used to store data under better regions naming
-        name_mapping = {'Москва': 'м. Москва',
-                        'Московская область': 'Московська область',
-                        'Санкт-Петербург': "м. Санкт-Петербург",
-                        'Нижегородская область': "Нижньогородська область",
-                        'Дагестан': "Республіка Дагестан",
-                        'Мурманская область': "Мурманська область",
-                        'Краснодарский край': "Краснодарський край",
-                        'Тульская область': "Тульська область",
-                        'Ростовская область': "Ростовська область",
-                        'Свердловская область': "Свердловська область",
-                        'Калужская область': "Калузька область",
-                        'Брянская область': "Брянська область",
-                        'Татарстан': "Республіка Татарстан",
-                        'Рязанская область': "Рязанська область",
-                        'Северная Осетия': "Республіка Північна Осетія - Аланія",
-                        'Ленинградская область': "Ленінградська область",
-                        'Башкортостан': "Республіка Башкортостан",
-                        'Курская область': "Курська область",
-                        'Тамбовская область': "Тамбовська область",
-                        'Владимирская область': "Володимирська область",
-                        'Ингушетия': "Республіка Інгушетія",
-                        'Кабардино-Балкария': "Кабардино-Балкарська республіка",
-                        'Мордовия': "Республіка Мордовія",
-                        'Ямало-Ненецкий автономный округ': "Ямало-Ненетський авт. округ",
-                        'Чувашия': "Республіка Чувашія",
-                        'Ярославская область': "Ярославська область",
-                        'Красноярский край': "Красноярський край",
-                        'Саратовская область': "Саратовська область",
-                        'Новосибирская область': "Новосибірська область",
-                        'Ставропольский край': "Ставропольський край",
-                        'Орловская область': "Орловська область",
-                        'Челябинская область': "Челябінська область",
-                        'Оренбургская область': "Оренбурзька область",
-                        'Марий Эл': "Республіка Марій Ел",
-                        'Хабаровский край': "Хабаровський край",
-                        'Самарская область': "Самарська область",
-                        'Республика Коми': "Республіка Комі",
-                        'Волгоградская область': "Волгоградська область",
-                        'Тверская область': "Тверська область",
-                        'Воронежская область': "Воронезька область",
-                        'Приморский край': "Приморський край",
-                        'Липецкая область': "Липецька область",
-                        'Пермский край': "Пермський край",
-                        'Кировская область': "Кіровська область",
-                        'Тюменская область': "Тюменська область",
-                        'Чечня': "Чеченська Республіка",
-                        'Ульяновская область': "Ульянівська область",
-                        'Пензенская область': "Пензенська область",
-                        'Ивановская область': "Іванівська область",
-                        'Смоленская область': "Смоленська область",
-                        'Калининградская область': "Калінінградська область",
-                        'Астраханская область': "Астраханська область",
-                        'Алтайский край': "Алтайський край",
-                        'Белгородская область': "Білгородська область",
-                        'Ханты-Мансийский автономный округ — Югра': "Ханти-Мансійський авт. округ",
-                        'Бурятия': "Республіка Бурятія",
-                        'Карачаево-Черкесия': "Карачаєво-Черкеська Республіка",
-                        'Новгородская область': "Новгородська область",
-                        'Якутия': "Республіка Саха (Якутія)",
-                        'Калмыкия': "Республіка Калмикія",
-                        'Архангельская область': "Архангельська область",
-                        'Хакасия': "Республіка Хакасія",
-                        'Камчатский край': "Камчатський край",
-                        'Удмуртия': "Удмуртська Республіка",
-                        'Костромская область': "Костромська область",
-                        'Псковская область': "Псковська область",
-                        'Забайкальский край': "Забайкальський край",
-                        'Иркутская область': "Іркутська область",
-                        'Вологодская область': "Вологодська область",
-                        'Омская область': "Омська область",
-                        'Адыгея': "Республіка Адигея",
-                        'Кемеровская область': "Кемеровська область",
-                        'Томская область': "Томська область",
-                        'Еврейская автономная область': "Єврейська автономна область",
-                        'Магаданская область': "Магаданська область",
-                        'Карелия': "Республіка Карелія",
-                        'Амурская область': "Амурська область",
-                        'Курганская область': "Курганська область",
-                        'Тыва': "Республіка Тива (Тува)",
-                        'Ненецкий автономный округ': "Ненецький авт. округ",
-                        'Сахалинская область': "Сахалінська область",
-                        'Чукотский автономный округ': "Чукотський авт. округ",
-                        'Республика Алтай': "Республіка Алтай"}
-
-        # occupied regions
-        occupied_regions = {'Крым': ['Україна', 'Автономна Республіка Крим'],
-                            'Севастополь': ['Україна', 'м. Севастополь']}
-
-        for reg_data in data:
-            reg = reg_data['LocationName']
-
-            # check if region name is valid
-            if reg not in name_mapping and reg not in occupied_regions:
-                continue
+                    # depending of the value, region will have its Font
+                    ysick = Font.set(zones[d_zone], '%+d' % d_sick)
+                    region = Font.set(zones[zone], region) + ' '
+                    text += '   {:.<60} {:<6} | {:<5} {:>8}\n'.format(region, sick, ysick, rt)
 
-            reg_name = name_mapping.get(reg, reg)
+            else:
+                text += '   << Немає даних по регіонах >>\n'
 
-            if reg_name in occupied_regions:
-                # special processing for occupied regions
-                key = {'date': date.today().strftime("%d %b %Y"),
-                       'country': occupied_regions[reg_name][0]}
-                db = self.db.get(key)
-                db['Regions'][occupied_regions[reg_name][1]] = reg_data['Confirmed']
-                self.db.update(key, db)
-                continue
+            text += ' \'{:-<76}\'\n'.format('')
 
-            config['Regions'][reg_name] = reg_data['Confirmed']
+        return text
 
-        return config
 
-    def _upd_hug(self):
-        config = {'Name': 'Угорщина', 'Code': 'hug',
-                  'ViewBoxSz': '0 0 630 400', 'ViewBoxLineSz': 0.7,
-                  'Population': 9663123, 'Area': 93030,
-                  'Tested': 0, 'Sick': 0, 'Recovered': 0, 'Dead': 0,
-                  'Peak': 30000, 'Description': '', 'Cure': 4,
-                  'Regions': {}}
+class metricsWorker:
+    ''' Derived epidemiological metrics of countries and regions
 
-        config['Description'] = 'Держава в центральній Європі. Державна мова — угорська, що є найбільш уживаною уральською мовою у світі.<br><br>Територія сучасної Угорщини століттями була заселена цілою низкою народів, включаючи кельтів, римлян, германських племен, гунів, західних слов&apos;ян та аварів. Країна має економіку з високим рівнем доходу.'
+    Metrics are calculated over the full history once and then updated
+    incrementally: a new day appends values, repeated update of the latest
+    day recalculates only that day.
 
-        # cure 2: https://www.cfr.org/backgrounder/what-world-doing-create-covid-19-vaccine
-        # cure 2: https://hungarytoday.hu/avigan-drug-against-covid-19-to-be-tested-in-hungary/
-        # cure 2: https://dailynewshungary.com/hungarian-discovery-might-bring-a-breakthrough-in-curing-covid-19/
-        # cure 4: https://hungarytoday.hu/hungary-coronavirus-vaccine-registration/
+    Country metrics:
+        SickPer100k, TestedPer100k, DeadPer100k - totals per 100k people
+        New7, New14 - new cases during 7 and 14 days
+        Incidence7, Incidence14 - new cases per 100k people
+        Growth - new cases of 7 days against previous 7 days
+        Rt - reproduction number estimated from Growth
+        Positivity - new cases per new tests during 7 days
+    Region metrics:
+        New7, New14, Growth, Rt
+    '''
+    # generation time (days) used to estimate Rt
+    generation = 4
 
-        config = self.__upd_hug_total(config)
-        config = self.__upd_hug_regions(config)
+    def __init__(self, path):
+        ''' Metrics constructor
 
-        return config
+        :param path: path to the metrics file
+        '''
+        self._path = path
+        self.__metrics = {}
+        self.__lock = threading.RLock()
 
-    def __upd_hug_total(self, config):
-        # news.google.com
-        logger.normal(' - Збір загальних даних з koronavirus.gov.hu ..')
-        page = self._web_request('https://koronavirus.gov.hu/')
+        if os.path.isfile(self._path):
+            with open(self._path, 'r') as fp:
+                self.__metrics = json.load(fp)
 
-        recv_pest = self._html_get_node(page, './/div[@id="api-gyogyult-pest"]')[0]
-        recv_videk = self._html_get_node(page, './/div[@id="api-gyogyult-videk"]')[0]
-        config['Recovered'] = int(recv_pest.text.replace(' ', '')) + int(recv_videk.text.replace(' ', ''))
+    def save(self):
+        ''' Store metrics to the file
 
-        sick_pest = self._html_get_node(page, './/div[@id="api-fertozott-pest"]')[0]
-        sick_videk = self._html_get_node(page, './/div[@id="api-fertozott-videk"]')[0]
-        quarantine = self._html_get_node(page, './/div[@id="api-karantenban"]')[0]
-        config['Sick'] = int(sick_pest.text.replace(' ', '')) + int(sick_videk.text.replace(' ', '')) + int(quarantine.text.replace(' ', '')) + config['Recovered']
+        Entries of countries are replaced on refresh and never changed, so
+        only the copy of the dict is taken under the lock.
+        '''
+        with self.__lock:
+            metrics = dict(self.__metrics)
 
-        dead_pest = self._html_get_node(page, './/div[@id="api-elhunyt-pest"]')[0]
-        dead_videk = self._html_get_node(page, './/div[@id="api-elhunyt-videk"]')[0]
-        config['Dead'] = int(dead_pest.text.replace(' ', '')) + int(dead_videk.text.replace(' ', ''))
+        with atomic_write(self._path) as fp:
+            json.dump(metrics, fp, ensure_ascii=False, separators=(',', ':'))
 
-        tested = self._html_get_node(page, './/div[@id="api-mintavetel"]')[0]
-        config['Tested'] = int(tested.text.replace(' ', ''))
-        return config
+        logger.debug('Показники збережено')
 
-    def __upd_hug_regions(self, config):
-        # news.google.com
-        logger.normal(' - Збір даних про регіони з news.google.com ..')
-        page = self._web_request('https://news.google.com/covid19/map?hl=uk&gl=UA&ceid=UA%3Auk&mid=%2Fm%2F03gj2')
-
-        # initial regions data
-        initial = ['Медьє Бач-Кишкун', 'Медьє Бараня',
-                   'Медьє Бекеш', 'Медьє Боршод-Абауй-Земплен',
-                   'Медьє Чонґрад', 'Медьє Феєр',
-                   'Медьє Дьйор-Мошон-Шопрон', 'Медьє Гайду-Бігар',
-                   'Медьє Гевеш', 'Медьє Яс-Надькун-Сольнок',
-                   'Медьє Комаром-Естерґом', 'Медьє Ноґрад',
-                   'Медьє Пешт', 'Медьє Шомодь',
-                   'Медьє Саболч-Сатмар-Береґ', 'Медьє Толна',
-                   'Медьє Ваш', 'Медьє Веспрем',
-                   'Медьє Зала', 'м. Будапешт']
-        config['Regions'] = {k: 0 for k in initial}
-
-        # used to store data under better regions naming
-        name_mapping = {'Будапешт': 'м. Будапешт',
-                        'Пешт': 'Медьє Пешт',
-                        'Фейер': 'Медьє Феєр',
-                        'Комаром-Естерґом': 'Медьє Комаром-Естерґом',
-                        'Зала': 'Медьє Зала',
-                        'Чонґрад': 'Медьє Чонґрад',
-                        'Дьйор-Мошон-Шопрон': 'Медьє Дьйор-Мошон-Шопрон',
-                        'Боршод-Абауй-Земплєн': 'Медьє Боршод-Абауй-Земплен',
-                        'Веспрем': 'Медьє Веспрем',
-                        'Сабольч-Сатмар-Берег': 'Медьє Саболч-Сатмар-Береґ',
-                        'Баранья': 'Медьє Бараня',
-                        'Шомодь': 'Медьє Шомодь',
-                        'Ноґрад': 'Медьє Ноґрад',
-                        'Хайду-Біхар': 'Медьє Гайду-Бігар',
-                        'Бач-Кі́шкун': 'Медьє Бач-Кишкун',
-                        'Яс-Надькун-Сольнок': 'Медьє Яс-Надькун-Сольнок',
-                        'Толна': 'Медьє Толна',
-                        'Бекес': 'Медьє Бекеш',
-                        'Хевеш': 'Медьє Гевеш',
-                        'Ваш': 'Медьє Ваш'}
-
-        # get regions. skip first two general nodes
-        regions = self._html_get_node(page, './/tbody[@class="ppcUXd"]//tr')[2:]
-        for region in regions:
-            reg = region.xpath('.//th//div//div')[1].text
-            reg_name = name_mapping.get(reg, reg)
-
-            sick = region.xpath('.//td')[0].text.strip().replace('\xa0', '')
-            config['Regions'][reg_name] = int(sick) if sick != '—' else 0
+    def get(self, country, region=None, day=None):
+        ''' Get metrics for the date
 
-        return config
+        :param country: country name
+        :param region: region name, country metrics if not specified
+        :param day: date string, the latest date if not specified
+        :return: dict of metrics or None if not calculated
+        '''
+        entry = self.__metrics.get(country)
+        if not entry or not entry['days']:
+            return None
 
-    def _upd_rom(self):
-        config = {'Name': 'Румунія', 'Code': 'rom',
-                  'ViewBoxSz': '200 350 260 450', 'ViewBoxLineSz': 0.7,
-                  'Population': 19251921, 'Area': 238397,
-                  'Tested': 0, 'Sick': 0, 'Recovered': 0, 'Dead': 0,
-                  'Peak': 30000, 'Description': '', 'Cure': 4,
-                  'Regions': {}}
+        index = len(entry['days']) - 1
+        if day is not None:
+            ordinal = datetime.strptime(day, '%d %b %Y').toordinal()
+            if ordinal not in entry['days']:
+                return None
+            index = entry['days'].index(ordinal)
 
-        config['Description'] = 'Держава на перехресті східної, центральної та південно-східної Європи.<br><br>Назва Romania походить від лат. romanus, що означає &quot;громадянин Риму&quot;. Перше відоме вживання цього звернення датується XVI ст. італійськими гуманістами, що подорожували Трансільванією, Богданією та Волощиною.<br><br>Переважна більшість населення самоідентифікують, як православні християнами і є носіями румунської мови.'
+        if region is not None:
+            entry = entry['regions'].get(region)
+            if not entry:
+                return None
 
-        # cure 1: https://www.romania-insider.com/romania-european-system-coronavirus-vaccine
-        # cure 4: https://www.romania-insider.com/president-covid-vaccination-voluntary-romania
+        return {k: v[index] for k, v in entry['metrics'].items()}
 
-        config = self.__upd_rom_total(config)
-        config = self.__upd_rom_regions(config)
+    def refresh(self, db, day):
+        ''' Update metrics with the data of the date
 
-        return config
+        Countries without metrics or with changed past data are rebuilt
+        from the whole DB.
 
-    def __upd_rom_total(self, config):
-        # news.google.com
-        logger.normal(' - Збір загальних даних з mae.ro ..')
+        :param db: dbWorker object
+        :param day: date string
+        :return: number of recalculated countries
+        '''
+        with self.__lock:
+            return self.__refresh(db, day)
+
+    def __refresh(self, db, day):
+        ''' Update metrics under the lock '''
+        today = db.get({'date': day})
+        if not today:
+            return 0
+
+        ordinal = datetime.strptime(day, '%d %b %Y').toordinal()
+        rebuild = []
+        refreshed = 0
+
+        for country, cfg in today.items():
+            entry = self.__metrics.get(country)
+            if not entry or (entry['days'] and ordinal < entry['days'][-1]):
+                rebuild.append(country)
+                continue
 
-        # headers required to get access to the mae.ro web-page
-        hdrs = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/50.0.2661.102 Safari/537.36'}
+            latest = entry['days'] and ordinal == entry['days'][-1]
+            if latest and self._inputs(entry, -1) == self._inputs(cfg):
+                # data was not changed
+                continue
 
-        # get intial page to find out final link with tested persond data
-        page = self._web_request('https://stirioficiale.ro/informatii', headers=hdrs)
-        links = self._html_get_node(page, './/div[@class="flex-1 px-8 py-5"]//h1//a')
+            # entry is replaced, not changed, as it may be saved at the moment
+            entry = self._copy_entry(entry)
+            if latest:
+                self._truncate(entry, len(entry['days']) - 1)
 
-        # go through all available paragraphs and look for the link
-        target_link = ''
-        for link in links:
-            if 'BULETIN DE PRESĂ' in link.text:
-                target_link = link.attrib['href']
-                break
+            self._append(entry, ordinal, cfg)
+            self._calculate(entry, len(entry['days']) - 1)
+            self.__metrics[country] = entry
+            refreshed += 1
 
-        if target_link:
-            logger.debug('Цільове посилання: {} ..'.format(target_link))
-            # get the page with tested persons quanity
-            page = self._web_request(target_link, headers=hdrs)
-            paragraphs = self._html_get_node(page, './/div[@class="my-8 break-words rich-text"]//p')
-            for p in paragraphs:
-                if p.text and 'au fost prelucrate' in p.text.strip():
-                    config['Tested'] = int(p.text.split()[10].replace('.', ''))
-                    break
+        if rebuild:
+            refreshed += self.rebuild(db, rebuild)
 
-        # get other data
-        page = self._web_request('https://datelazi.ro/latestData.json')
-        #page = self._web_request('https://di5ds1eotmbx1.cloudfront.net/latestData.json')
+        logger.debug('Показники за %s: оновлено %d країн' % (day, refreshed))
+        return refreshed
 
-        data = json.loads(page)['currentDayStats']
+    def rebuild(self, db, countries=None):
+        ''' Calculate metrics over the whole history
 
-        config['Sick'] = data['numberInfected']
-        config['Recovered'] = data['numberCured']
-        config['Dead'] = data['numberDeceased']
+        :param db: dbWorker object
+        :param countries: names of countries, all if not specified
+        :return: number of calculated countries
+        '''
+        with self.__lock:
+            return self.__rebuild(db, countries)
+
+    def __rebuild(self, db, countries=None):
+        ''' Recalculate metrics under the lock '''
+        days = sorted(db.get_dates_list(), key=lambda d: datetime.strptime(d, '%d %b %Y'))
+        entries = {}
+
+        for day in days:
+            ordinal = datetime.strptime(day, '%d %b %Y').toordinal()
+            for country, cfg in db.get({'date': day}).items():
+                if countries is not None and country not in countries:
+                    continue
 
-        return config
+                self._append(entries.setdefault(country, self._new_entry()), ordinal, cfg)
+
+        for country, entry in entries.items():
+            self._calculate(entry, 0)
+            self.__metrics[country] = entry
+
+        return len(entries)
+
+    @staticmethod
+    def _new_entry():
+        return {'days': [], 'Population': 0, 'Tested': [], 'Sick': [], 'Dead': [],
+                'metrics': {}, 'regions': {}}
+
+    @staticmethod
+    def _copy_entry(entry):
+        ''' Copy of the entry with its own lists of values '''
+        def lists(item):
+            return {key: list(value) if isinstance(value, list) else value for key, value in item.items()}
+
+        copy = lists(entry)
+        copy['metrics'] = lists(entry['metrics'])
+        copy['regions'] = {name: dict(lists(reg), metrics=lists(reg['metrics']))
+                           for name, reg in entry['regions'].items()}
+        return copy
+
+    @staticmethod
+    def _inputs(data, index=None):
+        ''' Inputs of the calculation taken from config or stored entry '''
+        if index is None:
+            return [data['Population'], data['Tested'], data['Sick'], data['Dead'], data.get('Regions', {})]
+
+        regions = {k: v['Sick'][index] for k, v in data['regions'].items() if v['Sick'][index] is not None}
+        return [data['Population'], data['Tested'][index], data['Sick'][index], data['Dead'][index], regions]
+
+    @staticmethod
+    def _append(entry, ordinal, cfg):
+        ''' Append inputs of the day to the entry '''
+        size = len(entry['days'])
+        entry['days'].append(ordinal)
+        entry['Population'] = cfg['Population']
+
+        for key in ('Tested', 'Sick', 'Dead'):
+            entry[key].append(cfg[key])
+
+        # regions are aligned with days of the country
+        for region in cfg.get('Regions', {}):
+            if region not in entry['regions']:
+                entry['regions'][region] = {'Sick': [None] * size, 'metrics': {}}
+
+        for region, reg in entry['regions'].items():
+            reg['Sick'].append(cfg.get('Regions', {}).get(region))
+
+    @staticmethod
+    def _truncate(entry, size):
+        ''' Drop inputs and metrics starting from the index '''
+        for key in ('days', 'Tested', 'Sick', 'Dead'):
+            del entry[key][size:]
+
+        for item in [entry] + list(entry['regions'].values()):
+            for values in item['metrics'].values():
+                del values[size:]
+
+            if item is not entry:
+                del item['Sick'][size:]
+
+    def _calculate(self, entry, start):
+        ''' Calculate metrics of days starting from the index '''
+        days = entry['days']
+        per100k = 100000 / entry['Population'] if entry['Population'] else None
+        # windows depend on days only and are shared by all the series
+        week, fortnight = span_bases(days, 7, start), span_bases(days, 14, start)
+
+        def ratio(num, den, scale=1, digits=2):
+            if num is None or not den or scale is None:
+                return None
+            return round(num / den * scale, digits)
+
+        def rate(values):
+            return [ratio(v, 1, per100k) for v in values[start:]]
+
+        def spread(sick):
+            new7 = span_deltas(sick, week, start)
+            new14 = span_deltas(sick, fortnight, start)
+            # corrections of data may decrease totals, growth is unknown then
+            growth = [n7 / (n14 - n7) if n7 is not None and n14 is not None and 0 <= n7 < n14 else None
+                      for n7, n14 in zip(new7, new14)]
+            rt = [ratio(g ** (self.generation / 7), 1) if g is not None else None for g in growth]
+
+            return {'New7': new7, 'New14': new14, 'Growth': [ratio(g, 1) for g in growth], 'Rt': rt}
+
+        values = spread(entry['Sick'])
+        tested7 = span_deltas(entry['Tested'], week, start)
+
+        values['Incidence7'] = [ratio(v, 1, per100k) for v in values['New7']]
+        values['Incidence14'] = [ratio(v, 1, per100k) for v in values['New14']]
+        values['Positivity'] = [ratio(n, t, 100) for n, t in zip(values['New7'], tested7)]
+        values['SickPer100k'] = rate(entry['Sick'])
+        values['TestedPer100k'] = rate(entry['Tested'])
+        values['DeadPer100k'] = rate(entry['Dead'])
+
+        for name, series in values.items():
+            del entry['metrics'].setdefault(name, [])[start:]
+            entry['metrics'][name].extend(series)
+
+        for reg in entry['regions'].values():
+            for name, series in spread(reg['Sick']).items():
+                metric = reg['metrics'].setdefault(name, [None] * start)
+                del metric[start:]
+                metric.extend(series)
+
+
+class exportWorker:
+    ''' Bulk export of country and region series
+
+    Rows are streamed from the DB date by date and written in chunks, so
+    memory does not depend on the length of the history. Every row is a
+    country total (empty region) or a region entry (sick only):
+        date, country, code, region, tested, sick, recovered, dead
+    Dates follow the DB order.
+    '''
+    columns = ('date', 'country', 'code', 'region', 'tested', 'sick', 'recovered', 'dead')
+    formats = {'.csv': 'csv', '.jsonl': 'jsonl', '.parquet': 'parquet'}
+
+    def __init__(self, db, chunk_rows=4096):
+        ''' Constructor
+
+        :param db: dbWorker object
+        :param chunk_rows: number of rows written at once
+        '''
+        self._db = db
+        self._chunk_rows = chunk_rows
 
-    def __upd_rom_regions(self, config):
-        # news.google.com
-        logger.normal(' - Збір даних про регіони з datelazi.ro ..')
-        page = self._web_request('https://datelazi.ro/latestData.json')
-        data = json.loads(page)['currentDayStats']['countyInfectionsNumbers']
-
-        # initial regions data
-        initial = ['Повіт Алба', 'Повіт Арад', 'Повіт Арджеш', 'Повіт Бакеу',
-                   'Повіт Бистриця-Несеуд', 'Повіт Біхор', 'Повіт Ботошань',
-                   'Повіт Брашов', 'Повіт Бреїла', 'Повіт Бузеу', 'Повіт Васлуй',
-                   'Повіт Вилча', 'Повіт Вранча', 'Повіт Галац', 'Повіт Горж',
-                   'Повіт Джурджу', 'Повіт Димбовіца', 'Повіт Долж', 'Повіт Ілфов',
-                   'Повіт Караш-Северін', 'Повіт Келераші', 'Повіт Клуж',
-                   'Повіт Ковасна', 'Повіт Констанца', 'м. Бухарест',
-                   'Повіт Марамуреш', 'Повіт Мехедінць', 'Повіт Муреш',
-                   'Повіт Нямц', 'Повіт Олт', 'Повіт Прахова', 'Повіт Сату-Маре',
-                   'Повіт Селаж', 'Повіт Сібіу', 'Повіт Сучавський',
-                   'Повіт Телеорман', 'Повіт Тіміш', 'Повіт Тульча',
-                   'Повіт Харгіта', 'Повіт Хунедоара', 'Повіт Яломіца',
-                   'Повіт Ясси']
-        config['Regions'] = {k: 0 for k in initial}
-
-        # used to store data under better regions naming
-        name_mapping = {'AB': 'Повіт Алба',
-                        'AR': 'Повіт Арад',
-                        'AG': 'Повіт Арджеш',
-                        'BC': 'Повіт Бакеу',
-                        'BN': 'Повіт Бистриця-Несеуд',
-                        'BH': 'Повіт Біхор',
-                        'BT': 'Повіт Ботошань',
-                        'BV': 'Повіт Брашов',
-                        'BR': 'Повіт Бреїла',
-                        'BZ': 'Повіт Бузеу',
-                        'VS': 'Повіт Васлуй',
-                        'VL': 'Повіт Вилча',
-                        'VN': 'Повіт Вранча',
-                        'GL': 'Повіт Галац',
-                        'GJ': 'Повіт Горж',
-                        'GR': 'Повіт Джурджу',
-                        'DB': 'Повіт Димбовіца',
-                        'DJ': 'Повіт Долж',
-                        'IF': 'Повіт Ілфов',
-                        'CS': 'Повіт Караш-Северін',
-                        'CL': 'Повіт Келераші',
-                        'CJ': 'Повіт Клуж',
-                        'CV': 'Повіт Ковасна',
-                        'CT': 'Повіт Констанца',
-                        'MM': 'Повіт Марамуреш',
-                        'MH': 'Повіт Мехедінць',
-                        'MS': 'Повіт Муреш',
-                        'NT': 'Повіт Нямц',
-                        'OT': 'Повіт Олт',
-                        'PH': 'Повіт Прахова',
-                        'SM': 'Повіт Сату-Маре',
-                        'SJ': 'Повіт Селаж',
-                        'SB': 'Повіт Сібіу',
-                        'SV': 'Повіт Сучавський',
-                        'TR': 'Повіт Телеорман',
-                        'TM': 'Повіт Тіміш',
-                        'TL': 'Повіт Тульча',
-                        'HR': 'Повіт Харгіта',
-                        'HD': 'Повіт Хунедоара',
-                        'IL': 'Повіт Яломіца',
-                        'IS': 'Повіт Ясси',
-                        'B': 'м. Бухарест'}
-
-        for region in data:
-            reg_name = name_mapping.get(region, region)
-
-            if region == '-':
-                # unproceeded persons will be equally divided between regions
-                unknown = data[region]
-                logger.debug('Невідомий регіон у %d осіб' % unknown)
-
-                # common shared number
-                common = int(data[region] / len(config['Regions']))
-
-                for r in config['Regions']:
-                    if unknown == 0:
-                        break
+    def rows(self, since=None, until=None, countries=None):
+        ''' Iterate through the DB rows
 
-                    config['Regions'][r] += common + (1 if unknown > 0 else 0)
-                    unknown -= 1
+        :param since: first date to export (date object), inclusive
+        :param until: last date to export (date object), inclusive
+        :param countries: names or codes of countries to export
+        :return: generator of row tuples
+        '''
+        countries = set(countries) if countries else None
 
-            if region not in name_mapping:
+        for day, data in self._db.iter_dates():
+            curr = datetime.strptime(day, '%d %b %Y').date()
+            if (since and curr < since) or (until and curr > until):
                 continue
 
-            config['Regions'][reg_name] = data[region]
+            stamp = curr.isoformat()
+            for name, cfg in data.items():
+                code = cfg.get('Code', '')
+                if countries and name not in countries and code not in countries:
+                    continue
 
-        return config
+                yield (stamp, name, code, '', cfg.get('Tested'), cfg.get('Sick'),
+                       cfg.get('Recovered'), cfg.get('Dead'))
 
-    def __str__(self):
-        ''' Show COVID information '''
-        # get input data
-        data_today = self.db.get({'date': date.today().strftime("%d %b %Y")})
-        data_yestd = self.db.get({'date': (date.today() - timedelta(days=1)).strftime("%d %b %Y")}, data_today)
+                for region, sick in cfg.get('Regions', {}).items():
+                    yield (stamp, name, code, region, None, sick, None, None)
 
-        # datetime object containing current date and time
-        curr_date = '\n * Дані станом на {:%d %b %Y [%H:%M:%S]}\n'.format(datetime.now())
-        text = self.translate('eng', 'ukr', curr_date)
+    def chunks(self, rows):
+        ''' Split rows into the chunks
 
-        for country, cfg in data_today.items():
-            # yesterday configuration
-            ycfg = data_yestd.get(country, cfg)
+        :param rows: iterable of rows
+        :return: generator of row lists
+        '''
+        while True:
+            chunk = list(itertools.islice(rows, self._chunk_rows))
+            if not chunk:
+                return
+            yield chunk
 
-            # sort regions
-            regions = {k: v for k, v in sorted(cfg['Regions'].items(),
-                                               key=lambda it: it[1],
-                                               reverse=True)}
+    def export(self, target, fmt=None, **filters):
+        ''' Export DB rows to the file
 
-            # sort regions delta
-            rd = {k: v - ycfg['Regions'].get(k, v) for k, v in cfg['Regions'].items()}
-            rd_sick = {k: v for k, v in sorted(rd.items(),
-                                               key=lambda it: it[1],
-                                               reverse=True)}
+        :param target: path to the target file
+        :param fmt: 'csv', 'jsonl' or 'parquet', detected by extension if empty
+        :param filters: arguments of rows()
+        :return: dict with number of rows, bytes and duration, None on error
+        '''
+        fmt = fmt or self.formats.get(os.path.splitext(target)[1].lower())
+        writer = getattr(self, '_write_%s' % fmt, None) if fmt else None
+        if not writer:
+            logger.error('Невідомий формат експорту для \'{}\''.format(target))
+            return None
 
-            # country information
-            text += '\n   [ %s ] ' % Font.set(Font.fg.cyan, country)
-            text += 'Населення {:,} людей на {:,} км2 ({:.2f} л/км2)\n' \
-                    .format(cfg['Population'], cfg['Area'],
-                            cfg['Population'] / cfg['Area'])
+        start = time.perf_counter()
+        count = writer(target, self.chunks(self.rows(**filters)))
+        if count is None:
+            return None
 
-            # total information
-            text += ' .{:-<76}.\n'.format('')
-            block = '   {:>10} | {:^20} | {:<+7}  {:>10} | {:^20} | {:<+7}\n'
+        stats = {'rows': count, 'bytes': os.path.getsize(target), 'time': time.perf_counter() - start}
+        logger.debug('Експорт {}: {} рядків, {:.1f} КБ за {:.2f} с'.format(
+                     target, count, stats['bytes'] / 1024, stats['time']))
 
-            d_test = cfg['Tested'] - ycfg.get('Tested', cfg['Tested'])
-            d_recv = cfg['Recovered'] - ycfg.get('Recovered', cfg['Recovered'])
-            text += block.format(cfg['Tested'], Font.set(Font.fg.grey, 'Перевірені'), d_test,
-                                 cfg['Recovered'], Font.set(Font.fg.green, 'Одужали'), d_recv)
+        return stats
 
-            d_sick = cfg['Sick'] - ycfg.get('Sick', cfg['Sick'])
-            d_dead = cfg['Dead'] - ycfg.get('Dead', cfg['Dead'])
-            text += block.format(cfg['Sick'], Font.set(Font.fg.yellow, 'Хворі'), d_sick,
-                                 cfg['Dead'], Font.set(Font.fg.red, 'Померли'), d_dead)
+    def _write_csv(self, target, chunks):
+        ''' Write chunks as CSV '''
+        import csv
 
-            # separator
-            text += ' +{:-<76}+\n'.format('')
+        count = 0
+        with open(target, 'w', newline='', encoding='utf-8') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(self.columns)
+            for chunk in chunks:
+                writer.writerows(chunk)
+                count += len(chunk)
 
-            # regions information
-            if regions:
-                # 5 zones Fonted by unique Font
-                zones = {0: Font.fg.white, 1: Font.fg.yellow,
-                         2: Font.fg.orange, 3: Font.fg.lightred,
-                         4: Font.fg.red}
-                min_sick = min(regions.values())
-                sick_step = (max(regions.values()) + 1 - min_sick) / 5
+        return count
 
-                min_rdsick = min(rd_sick.values())
-                rdsick_step = (max(rd_sick.values()) + 1 - min_rdsick) / 5
+    def _write_jsonl(self, target, chunks):
+        ''' Write chunks as JSON lines '''
+        count = 0
+        with open(target, 'w', encoding='utf-8') as fp:
+            for chunk in chunks:
+                fp.write(''.join(json.dumps(dict(zip(self.columns, row)), ensure_ascii=False) + '\n'
+                                 for row in chunk))
+                count += len(chunk)
 
-                text += '   Рівні небезпеки: %s\n' % ' '.join(Font.set(zones[i], str(i)) for i in range(5))
-                text += ' +{:-<76}+\n'.format('')
+        return count
 
-                for region, sick in regions.items():
-                    # depending of the value, region will have its Font
-                    clr = zones[(rd_sick[region] - min_rdsick) // rdsick_step]
-                    ysick = Font.set(clr, '%+d' % rd_sick[region])
+    def _write_parquet(self, target, chunks):
+        ''' Write chunks as Parquet row groups (requires pyarrow) '''
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            logger.error('Для експорту у Parquet потрібен модуль pyarrow')
+            return None
 
-                    clr = zones[(sick - min_sick) // sick_step]
-                    region = Font.set(clr, region) + ' '
-                    text += '   {:.<68} {:<6} | {:<5}\n'.format(region, sick, ysick)
+        schema = pyarrow.schema([(name, pyarrow.string()) for name in self.columns[:4]] +
+                                [(name, pyarrow.int64()) for name in self.columns[4:]])
 
-            else:
-                text += '   << Немає даних по регіонах >>\n'
+        count = 0
+        with pyarrow.parquet.ParquetWriter(target, schema) as writer:
+            for chunk in chunks:
+                writer.write_table(pyarrow.Table.from_arrays(
+                    [pyarrow.array(column, type=field.type) for column, field in zip(zip(*chunk), schema)],
+                    schema=schema))
+                count += len(chunk)
 
-            text += ' \'{:-<76}\'\n'.format('')
+        return count
 
-        return text
 
-    def translate(self, slang, dlang, msg):
-        tokens_base = self._vocab.get(slang, {}).get(dlang, {})
+class queryService:
+    ''' Read-only HTTP service over the DB
 
-        for token, translation in tokens_base.items():
-            msg = msg.replace(token, translation)
+    Serves JSON answers for other tools:
+        /countries                               latest data of all countries
+        /country/<code>/history?from=&to=        series of the country
+        /country/<code>/regions                  latest data of the regions
+    Answers are built from the in-memory index and cached until the next
+    refresh() that should be called after every DB update. Only answers of
+    known resources are cached by their normalized keys, the least recently
+    used ones are dropped. Dates are in ISO format (YYYY-MM-DD).
+    '''
+    series = {'tested': 'Tested', 'sick': 'Sick', 'recovered': 'Recovered', 'dead': 'Dead'}
 
-        return msg
+    # max number of cached answers
+    cache_limit = 1024
 
-    def _html_report(self):
-        ''' Export data to HTML web page '''
-        def make_history(country, days_to_show=14):
+    def __init__(self, ctx, host='127.0.0.1', port=8020):
+        ''' Constructor
+
+        :param ctx: iCovidBase object with DB
+        :param host: address to listen
+        :param port: port to listen
+        '''
+        self._ctx = ctx
+        self._host = host
+        self._port = port
+        self._index = {}
+        self._cache = OrderedDict()
+        self._thread = None
+        self._loop = None
+        self._server = None
+
+    def refresh(self):
+        ''' Rebuild the index from DB and drop cached answers '''
+        start = time.time()
+
+        snapshot = self._ctx.db.snapshot()
+        if snapshot:
+            index = self._index_snapshot(snapshot)
+            snapshot.close()
+        else:
+            index = self._index_db()
+
+        # swap index and cache at once, requests in progress keep old ones
+        self._index, self._cache = index, OrderedDict()
+        logger.debug('Індекс HTTP сервісу оновлено [%fс]' % (time.time() - start))
+
+    def _index_db(self):
+        ''' Build index of the countries from DB entries '''
+        index = {}
+        for day, data in self._ctx.db.iter_dates():
+            stamp = datetime.strptime(day, '%d %b %Y').date().isoformat()
+            for name, cfg in data.items():
+                # country exists on dates with data only, as in the snapshot
+                if cfg.get('Sick') is None:
+                    continue
+
+                entry = index.setdefault(name, {'name': name, 'code': None, 'days': [],
+                                                'regions': [], **{k: [] for k in self.series}})
+                entry['code'] = cfg.get('Code', entry['code'])
+                entry['days'].append(stamp)
+                entry['regions'].append(cfg.get('Regions', {}))
+                entry['population'] = cfg.get('Population')
+                for key, field in self.series.items():
+                    entry[key].append(cfg.get(field))
+
+        by_code = {}
+        for entry in index.values():
+            # old records may miss code of the country
+            if not entry['code']:
+                continue
+
+            # DB keeps dates in order of insertion
+            order = sorted(range(len(entry['days'])), key=entry['days'].__getitem__)
+            for key in ['days', 'regions', *self.series]:
+                entry[key] = [entry[key][i] for i in order]
+
+            # only the latest regions are served, new cases are known if the day before is present
+            days = [date.fromisoformat(day).toordinal() for day in entry['days'][-2:]]
+            entry['regions'] = [entry['regions'][-2] if days[0] == days[-1] - 1 else None, entry['regions'][-1]]
+            by_code[entry['code']] = entry
+
+        return by_code
+
+    def _index_snapshot(self, snapshot):
+        ''' Build index of the countries from DB snapshot '''
+        def value(number):
+            return None if number == snapshot.missing else number
+
+        ordinals = snapshot.ordinals()
+
+        index = {}
+        for name in snapshot.countries():
+            code = snapshot.code(name)
+            if not code:
+                continue
+
+            # country exists on dates with data only
+            present = [i for i, v in enumerate(snapshot.series(name, 'Sick')) if v != snapshot.missing]
+            if not present:
+                # e.g. a new source without data yet
+                continue
+
+            entry = {'name': name, 'code': code, 'days': [date.fromordinal(ordinals[i]).isoformat() for i in present],
+                     'population': value(snapshot.series(name, 'Population')[present[-1]])}
+            for key, field in self.series.items():
+                series = snapshot.series(name, field)
+                entry[key] = [value(series[i]) for i in present]
+
+            regions = [(region, snapshot.region_series(name, i)) for i, region in enumerate(snapshot.regions(name))]
+            before = present[-2] if len(present) > 1 and ordinals[present[-2]] == ordinals[present[-1]] - 1 else None
+            entry['regions'] = [{region: sick[i] for region, sick in regions if sick[i] != snapshot.missing}
+                                if i is not None else None for i in (before, present[-1])]
+
+            index[code] = entry
+
+        return index
+
+    @staticmethod
+    def _encode(content):
+        return json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode()
+
+    def answer(self, target):
+        ''' Prepare answer for the request target
+
+        :param target: path with query string
+        :return: tuple (HTTP status, JSON body in bytes)
+        '''
+        key, error = self._route(target)
+        if key is None:
+            # errors are cheap and not cached
+            return error[0], self._encode(error[1])
+
+        cache = self._cache
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+
+        status, content = self._content(key)
+        cache[key] = (status, self._encode(content))
+        if len(cache) > self.cache_limit:
+            cache.popitem(last=False)
+
+        return cache[key]
+
+    def _route(self, target):
+        ''' Find normalized key of the request target
+
+        :param target: path with query string
+        :return: tuple of key and None or None and (HTTP status, error content)
+        '''
+        from urllib.parse import urlsplit, parse_qs, unquote
+
+        url = urlsplit(target)
+        parts = [unquote(part) for part in url.path.strip('/').split('/')]
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        if parts == ['countries']:
+            return ('countries',), None
+
+        if len(parts) == 3 and parts[0] == 'country':
+            if parts[1] not in self._index:
+                return None, (404, {'error': 'unknown country'})
+
+            if parts[2] == 'history':
+                dates = []
+                for value in (query.get('from'), query.get('to')):
+                    try:
+                        # different spellings of the date share the answer
+                        dates.append(date.fromisoformat(value).isoformat() if value else None)
+                    except ValueError:
+                        return None, (400, {'error': 'wrong date "%s"' % value})
+
+                return ('history', parts[1], *dates), None
+
+            if parts[2] == 'regions':
+                return ('regions', parts[1]), None
+
+        return None, (404, {'error': 'unknown resource'})
+
+    def _content(self, key):
+        ''' Build content of the resource
+
+        :param key: normalized key of the request
+        :return: tuple (HTTP status, content)
+        '''
+        if key[0] == 'countries':
+            return 200, [self._latest(entry) for entry in self._index.values()]
+
+        entry = self._index.get(key[1])
+        if not entry:
+            # index is refreshed since the key was found
+            return 404, {'error': 'unknown country'}
+
+        if key[0] == 'history':
+            return 200, self._history(entry, *key[2:])
+
+        return 200, self._regions(entry)
+
+    def _latest(self, entry):
+        ''' Latest data of the country '''
+        content = {'code': entry['code'], 'name': entry['name'], 'population': entry['population'],
+                   'date': entry['days'][-1]}
+        content.update({key: entry[key][-1] for key in self.series})
+
+        return content
+
+    def _history(self, entry, since, until):
+        ''' Series of the country in the range of normalized ISO dates '''
+        import bisect
+
+        # ISO dates are ordered as strings
+        first = bisect.bisect_left(entry['days'], since) if since else 0
+        last = bisect.bisect_right(entry['days'], until) if until else len(entry['days'])
+
+        content = {'code': entry['code'], 'name': entry['name'], 'days': entry['days'][first:last]}
+        content.update({key: entry[key][first:last] for key in self.series})
+
+        return content
+
+    def _regions(self, entry):
+        ''' Latest data of the country regions
+
+        New cases are taken against the previous calendar day and are null
+        if there is no data of the region for that day.
+        '''
+        prev, curr = entry['regions']
+
+        regions = []
+        for name, sick in curr.items():
+            new = sick - prev[name] if prev and prev.get(name) is not None else None
+            regions.append({'name': name, 'sick': sick, 'new': new})
+
+        return {'code': entry['code'], 'name': entry['name'], 'date': entry['days'][-1], 'regions': regions}
+
+    async def _handle(self, reader, writer):
+        ''' Serve requests of a single connection '''
+        import asyncio
+
+        reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+        try:
+            while True:
+                request = await reader.readuntil(b'\r\n\r\n')
+                lines = request.decode('latin-1').split('\r\n')
+                method, target, version = (lines[0].split(' ') + ['', ''])[:3]
+                headers = {k.strip().lower(): v.strip() for k, _, v in (l.partition(':') for l in lines[1:] if l)}
+
+                if method in ('GET', 'HEAD'):
+                    status, body = self.answer(target)
+                else:
+                    status, body = 405, b'{"error":"read-only service"}'
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                head = 'HTTP/1.1 {} {}\r\nContent-Type: application/json; charset=utf-8\r\n' \
+                       'Content-Length: {}\r\nConnection: {}\r\n\r\n'.format(
+                        status, reasons[status], len(body), 'keep-alive' if keep_alive else 'close')
+
+                writer.write(head.encode() + (body if method != 'HEAD' else b''))
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+
+        finally:
+            writer.close()
+
+    async def _serve(self, ready):
+        ''' Run server till it is closed '''
+        import asyncio
+
+        self._loop = asyncio.get_running_loop()
+        try:
+            self._server = await asyncio.start_server(self._handle, self._host, self._port)
+            logger.normal('HTTP сервіс доступний за адресою http://{}:{}'.format(self._host, self._port))
+        except OSError as e:
+            logger.error('Не вдалось запустити HTTP сервіс: %s' % e)
+            return
+        finally:
+            ready.set()
+
+        async with self._server:
+            try:
+                await self._server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    def start(self):
+        ''' Start service in the background thread
+
+        :return: TRUE if service is started, FALSE otherwise
+        '''
+        import asyncio
+
+        ready = threading.Event()
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._serve(ready)),
+                                        name='http', daemon=True)
+        self._thread.start()
+        ready.wait()
+
+        return self._server is not None
+
+    def stop(self):
+        ''' Stop background service '''
+        if self._server:
+            self._loop.call_soon_threadsafe(self._server.close)
+            self._thread.join()
+            self._server = None
+
+
+class sourceSpec:
+    ''' Compiled declarative description of a data source
+
+    Spec is loaded from a JSON file once. XPath expressions are compiled,
+    lookup tables are frozen and parsers are resolved by their names.
+    '''
+    def __init__(self, path):
+        ''' Constructor
+
+        :param path: path to the JSON spec
+        '''
+        from lxml import etree
+        from types import MappingProxyType
+
+        def compile_xpath(xpath):
+            if isinstance(xpath, list):
+                return tuple(etree.XPath(it) for it in xpath)
+
+            return etree.XPath(xpath)
+
+        with open(path, 'r') as fp:
+            raw = json.load(fp)
+
+        self.path = path
+        self.name = raw['config']['Name']
+        self.code = raw['config']['Code']
+        self.order = raw.get('order', 0)
+        self.refresh = raw.get('refresh', 3600)
+
+        self.config = MappingProxyType(raw['config'])
+        self.regions = tuple(raw.get('regions', []))
+        self.mapping = MappingProxyType(raw.get('mapping', {}))
+        self.names = NameIndex(self.mapping)
+        self.urls = MappingProxyType(raw.get('urls', {}))
+        self.headers = MappingProxyType(raw.get('headers', {}))
+        self.xpath = MappingProxyType({k: compile_xpath(v) for k, v in raw.get('xpath', {}).items()})
+        self.data = MappingProxyType(raw.get('data', {}))
+
+        unknown = [name for name in raw['parsers'] if name not in source_parsers]
+        if unknown:
+            raise ValueError('Невідомі обробники джерела "%s": %s' % (path, ', '.join(unknown)))
+
+        self.parsers = tuple(source_parsers[name] for name in raw['parsers'])
+
+    def __repr__(self):
+        return 'sourceSpec(%s)' % self.code
+
+    def new_config(self):
+        ''' Create initial config of the country
+
+        :return: config with zero data
+        '''
+        config = json.loads(json.dumps(dict(self.config)))
+        config['Regions'] = {k: 0 for k in self.regions}
+
+        return config
+
+    def parse(self, ctx):
+        ''' Collect data of the source
+
+        :param ctx: object that provides web requests and DB access
+        :return: config of the country
+        '''
+        config = self.new_config()
+
+        # metrics are reported per update cycle
+        self.names.reset()
+
+        for parser in self.parsers:
+            config = parser(ctx, self, config)
+
+        metrics = self.names.metrics()
+        if metrics['unmatched']:
+            logger.debug('Нерозпізнані назви регіонів (%s): %s' % (self.code, ', '.join(
+                '"%s" x%d' % it for it in metrics['unmatched'].items())))
+
+        return config
+
+
+class mergeBuffer:
+    ''' Buffer of data that sources contribute to other countries
+
+    Contributions are collected during the update cycle and applied together
+    with data of the sources, so the result does not depend on the order in
+    which sources finish. The latest contributions of every source are kept
+    and applied again if the target country refreshes without it.
+    '''
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__pending = {}
+        self.__known = {}
+
+    def add(self, source, country, region, value):
+        ''' Add contribution of the source
+
+        :param source: code of the contributing source
+        :param country: name of the target country
+        :param region: name of the target region
+        :param value: number of sick people
+        '''
+        with self.__lock:
+            self.__pending.setdefault(source, []).append((country, region, value))
+
+    def discard(self, source):
+        ''' Drop contributions of the failed source
+
+        :param source: code of the contributing source
+        '''
+        with self.__lock:
+            self.__pending.pop(source, None)
+
+    def take(self, source):
+        ''' Remove pending contributions of the source
+
+        :param source: code of the contributing source
+        :return: list of (country, region, value)
+        '''
+        with self.__lock:
+            return self.__pending.pop(source, [])
+
+    def extend(self, source, records):
+        ''' Add contributions collected by other buffer, e.g. in other process
+
+        :param source: code of the contributing source
+        :param records: list of (country, region, value)
+        '''
+        for record in records:
+            self.add(source, *record)
+
+    def apply(self, db, day, staged, validate=None):
+        ''' Write staged configs with contributions to DB in one batch
+
+        :param db: DB to be updated
+        :param day: date of data
+        :param staged: dict of collected configs by country name
+        :param validate: callable(rows) returning dict of rejected countries
+        :return: tuple of updated countries and dict of rejected ones
+        '''
+        with self.__lock:
+            for source, records in self.__pending.items():
+                self.__known[source] = (day, records)
+            self.__pending = {}
+
+            contributions = [rec for rec_day, records in self.__known.values()
+                             if rec_day == day for rec in records]
+
+        # prepare all the rows before DB is touched
+        rows = dict(staged)
+        for country, region, value in contributions:
+            if country not in rows:
+                current = db.get({'date': day, 'country': country})
+                if not current:
+                    logger.warning('Немає даних країни %s для регіону "%s"' % (country, region))
+                    continue
+
+                rows[country] = json.loads(json.dumps(current))
+
+            rows[country]['Regions'][region] = value
+
+        # rejected rows keep the previous data in DB
+        rejected = validate(rows) if validate else {}
+        for country in rejected:
+            rows.pop(country)
+
+        db.update_batch(day, rows)
+
+        return list(rows), rejected
+
+
+class qualityGate:
+    ''' Validation of collected data before it is written to DB
+
+    Every country is checked against its history in DB: cumulative counts
+    must not decrease, ratio of the regions sum to the number of sick must
+    stay close to the previous one and daily growth must not jump far away
+    from the recent growth (z-score). Countries that fail are quarantined:
+    their latest accepted record is carried to the day, so they stay in all
+    the views, and their pages are not published till they recover. Anomaly
+    that persists longer than the hold time is accepted as a level shift.
+    '''
+    fields = ('Tested', 'Sick', 'Recovered', 'Dead')
+
+    # growth of these fields is checked for jumps
+    jump_fields = ('Sick', 'Dead')
+
+    def __init__(self, window=28, z_limit=8.0, decrease=0.01, ratio_shift=0.25, hold=2 * 24 * 3600):
+        ''' Constructor
+
+        :param window: number of previous records used as history
+        :param z_limit: max z-score of the daily growth
+        :param decrease: max relative decrease of the cumulative counts
+        :param ratio_shift: max relative change of regions sum to sick ratio
+        :param hold: time in seconds after which the anomaly is accepted
+        '''
+        self._window = window
+        self._z_limit = z_limit
+        self._decrease = decrease
+        self._ratio_shift = ratio_shift
+        self._hold = hold
+
+        # quarantined countries: name -> (time of the first failure, issues)
+        self.quarantine = {}
+
+        # the latest accepted records of the rejected countries
+        self._accepted = {}
+
+    def _history(self, db, day, countries):
+        ''' Get the latest records of countries before the day
+
+        :param db: DB object
+        :param day: date string
+        :param countries: names of countries
+        :return: dict of country name and list of (ordinal, config)
+        '''
+        ordinal = datetime.strptime(day, '%d %b %Y').toordinal()
+        days = sorted((datetime.strptime(d, '%d %b %Y').toordinal(), d) for d in db.get_dates_list())
+        days = [(o, d) for o, d in days if o < ordinal][-self._window - 1:]
+
+        history = {country: [] for country in countries}
+        for o, d in days:
+            for country in countries:
+                config = db.get({'date': d, 'country': country})
+                if config:
+                    history[country].append((o, config))
+
+        return history
+
+    @staticmethod
+    def _regions_sum(config):
+        return sum(v for v in config.get('Regions', {}).values() if isinstance(v, (int, float)))
+
+    def issues(self, day, config, history):
+        ''' Check config of the country against its history
+
+        :param day: date string
+        :param config: collected config
+        :param history: list of (ordinal, config) of previous records
+        :return: list of found issues
+        '''
+        found = []
+
+        for key in self.fields:
+            if not isinstance(config.get(key), (int, float)) or config[key] < 0:
+                found.append('%s: недійсне значення %r' % (key, config.get(key)))
+
+        regions = config.get('Regions', {})
+        negative = [name for name, value in regions.items() if not isinstance(value, (int, float)) or value < 0]
+        if negative:
+            found.append('недійсні значення регіонів: %s' % ', '.join(negative[:5]))
+
+        if found or not history:
+            # history checks need valid numbers
+            return found
+
+        ordinal = datetime.strptime(day, '%d %b %Y').toordinal()
+        last_day, last = history[-1]
+
+        # cumulative counts
+        for key in self.fields:
+            if last.get(key) and config[key] < last[key] * (1 - self._decrease):
+                found.append('%s зменшилось з %d до %d' % (key, last[key], config[key]))
+
+        # regions are summed by the same rules day by day, so the ratio is stable
+        if regions and last.get('Regions') and config['Sick'] and last.get('Sick'):
+            before = self._regions_sum(last) / last['Sick']
+            after = self._regions_sum(config) / config['Sick']
+            if abs(after - before) > self._ratio_shift * max(before, 0.1):
+                found.append('сума регіонів до кількості хворих змінилась з %.2f до %.2f' % (before, after))
+
+        # daily growth is compared with the growth of the history window
+        days = [o for o, _ in history]
+        for key in self.jump_fields:
+            values = [c.get(key, 0) for _, c in history]
+            growth = [(b - a) / (d1 - d0) for a, b, d0, d1 in zip(values, values[1:], days, days[1:])]
+            if len(growth) < 7:
+                continue
+
+            mean = sum(growth) / len(growth)
+            std = (sum((g - mean) ** 2 for g in growth) / len(growth)) ** 0.5
+            current = (config[key] - values[-1]) / max(ordinal - last_day, 1)
+
+            # small and flat series must not produce huge scores
+            score = (current - mean) / max(std, 0.25 * abs(mean), 10)
+            if abs(score) > self._z_limit:
+                found.append('%s: приріст %d за день при середньому %d (z=%.1f)' % (key, current, mean, score))
+
+        return found
+
+    def check(self, db, day, rows):
+        ''' Validate configs collected for the day
+
+        :param db: DB object
+        :param day: date string
+        :param rows: dict of configs by country name
+        :return: dict of rejected country name and list of issues
+        '''
+        history = self._history(db, day, list(rows))
+        now = time.time()
+
+        rejected = {}
+        for country, config in rows.items():
+            found = self.issues(day, config, history[country])
+            if not found:
+                self.quarantine.pop(country, None)
+                continue
+
+            since = self.quarantine.setdefault(country, (now, found))[0]
+            self.quarantine[country] = (since, found)
+
+            if now - since >= self._hold:
+                logger.warning('Дані країни %s приймаються після карантину: %s' % (country, '; '.join(found)))
+                self.quarantine.pop(country)
+                continue
+
+            rejected[country] = found
+            self._accepted[country] = history[country][-1][1] if history[country] else None
+
+        return rejected
+
+    def carry_forward(self, db, day, rejected):
+        ''' Write the latest accepted records of rejected countries to the day
+
+        Countries that already have data of the day keep it.
+
+        :param db: DB object
+        :param day: date string
+        :param rejected: names of rejected countries
+        :return: list of countries carried forward
+        '''
+        carried = {}
+        for country in rejected:
+            accepted = self._accepted.pop(country, None)
+            if accepted and not db.get({'date': day, 'country': country}):
+                carried[country] = accepted
+
+        db.update_batch(day, carried)
+
+        return list(carried)
+
+    def publish_blocker(self, updated):
+        ''' Check the web page may be published after the update
+
+        Quarantined countries do not block the others, the web page is not
+        published only if no country passed the validation.
+
+        :param updated: countries updated in DB
+        :return: reason to not publish or None
+        '''
+        if not updated:
+            return 'нових перевірених даних немає'
+
+        return None
+
+
+class sourceRegistry:
+    ''' Registry of data sources loaded from the JSON specs '''
+    def __init__(self, path='sources'):
+        ''' Constructor
+
+        :param path: directory with JSON specs
+        '''
+        self._specs = sorted([sourceSpec(spec) for spec in glob.glob(os.path.join(path, '*.json'))],
+                             key=lambda spec: (spec.order, spec.code))
+        self._refreshed = {}
+
+        logger.debug('Завантажено %d джерел даних' % len(self._specs))
+
+    def __iter__(self):
+        return iter(self._specs)
+
+    def __len__(self):
+        return len(self._specs)
+
+    def due(self, now=None):
+        ''' Get sources that should be refreshed
+
+        :param now: current time
+        :return: list of specs
+        '''
+        now = now or time.time()
+        return [spec for spec in self._specs
+                if now - self._refreshed.get(spec.code, 0) >= spec.refresh]
+
+    def mark_refreshed(self, spec, now=None):
+        ''' Remember the time of the source refresh
+
+        :param spec: refreshed source spec
+        :param now: time of refresh
+        '''
+        self._refreshed[spec.code] = now or time.time()
+
+    def next_due(self):
+        ''' Get the time of the nearest source refresh '''
+        return min([self._refreshed.get(spec.code, 0) + spec.refresh for spec in self._specs], default=time.time())
+
+
+class updateError(Exception):
+    ''' Fatal error that stops the update cycle '''
+
+
+class inlineExecutor:
+    ''' Executor that runs jobs in the calling thread when result is requested
+
+    Used instead of the thread pool when sources are parsed one by one, so
+    profilers watching the calling thread see the parsers.
+    '''
+    class job:
+        def __init__(self, func, args):
+            self._func = func
+            self._args = args
+
+        def result(self):
+            return self._func(*self._args)
+
+        def cancel(self):
+            return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, func, *args):
+        return self.job(func, args)
+
+
+class iCovidBase:
+    ''' Base class with common functionality '''
+    def __init__(self):
+        self.open_storage()
+        self.__vocab = None
+
+        # data shared by sources during a single update cycle
+        self._cycle_cache = {}
+        self._cycle_locks = {}
+        self._cycle_lock = threading.Lock()
+
+    def open_storage(self):
+        ''' Open DB, summary and metrics, data in memory is dropped
+
+        Used to reload the files changed by the other instance.
+        '''
+        self.db = dbWorker('icovid.db', lazy=True)
+        self.summary = summaryWorker('icovid.db.summary')
+        self.metrics = metricsWorker('icovid.db.metrics')
+
+    @property
+    def _vocab(self):
+        ''' Vocabularies are loaded on the first use '''
+        if self.__vocab is None:
+            self.__vocab = {}
+            self._load_vocabs()
+
+        return self.__vocab
+
+    def _load_vocabs(self):
+        vocabs = [file for file in glob.glob("*.vocab")]
+
+        for vocab in vocabs:
+            slang, dlang = os.path.basename(vocab).split('.')[0].split('_')
+
+            # create vocabularies if not exist
+            self._vocab[slang] = self._vocab.get(slang, {})
+            self._vocab[slang][dlang] = self._vocab[slang].get(dlang, {})
+
+            with open(vocab, 'r+') as fp:
+                self._vocab[slang][dlang] = json.load(fp)
+
+            logger.success('Словник "%s-%s" підвантажено' % (slang, dlang))
+
+    def translate(self, slang, dlang, msg):
+        tokens_base = self._vocab.get(slang, {}).get(dlang, {})
+
+        for token, translation in tokens_base.items():
+            msg = msg.replace(token, translation)
+
+        return msg
+
+    def _web_request(self, url, headers={}):
+        ''' Function perform HTML page request
+
+        :param url: URL to webpage
+        :return: 'utf-8'-encoded HTML page
+        '''
+        import requests
+
+        try:
+            html = requests.get(url, headers=headers).text
+        except Exception as e:
+            logger.warning('Недійсний сертифікат сервера "{}"'.format(url))
+            logger.debug(str(e))
+            if not logger.approve('Не перевіряти сертифікат', default=True):
+                # parsers run in worker threads, so the cycle is stopped by exception
+                raise updateError('Помилка отримання даних з "%s"' % url)
+
+            html = requests.get(url, headers=headers, verify=False).text
+
+        return html  # .decode('utf-8')
+
+    def _web_json(self, url, *paths, headers={}):
+        ''' Function extracts JSON subtrees from the streamed response
+
+        Response is not loaded completely and only the requested subtrees
+        are decoded. Results are shared during the update cycle, so the
+        same document is requested once.
+
+        :param url: URL to JSON document
+        :param paths: paths of subtrees as tuples of object keys
+        :return: list of subtrees in order of paths
+        '''
+        key = (url, paths)
+
+        # sources are parsed in parallel, so the same document is requested
+        # by the first of them while the others wait for the result
+        with self._cycle_lock:
+            lock = self._cycle_locks.setdefault(key, threading.Lock())
+
+        with lock:
+            if key not in self._cycle_cache:
+                self._cycle_cache[key] = self._web_json_fetch(url, paths, headers)
+
+        return self._cycle_cache[key]
+
+    def _web_json_fetch(self, url, paths, headers):
+        import requests
+
+        start = time.time()
+        try:
+            resp = requests.get(url, headers=headers, stream=True)
+        except Exception as e:
+            logger.warning('Недійсний сертифікат сервера "{}"'.format(url))
+            logger.debug(str(e))
+            if not logger.approve('Не перевіряти сертифікат', default=True):
+                raise
+
+            resp = requests.get(url, headers=headers, stream=True, verify=False)
+
+        with resp:
+            stream = JsonStream(resp.iter_content(64 * 1024))
+            found = stream.extract(*paths)
+
+        missing = [path for path in paths if path not in found]
+        if missing:
+            raise KeyError('Відсутні дані JSON: %s' % missing)
+
+        logger.debug('JSON "%s": прочитано %d Б, буфер %d Б [%.3fс]',
+                     url, stream.read, stream.peak, time.time() - start)
+
+        return [found[path] for path in paths]
+
+    def _html_get_node(self, html_buffer, pattern, nid=None):
+        ''' Function lookup HTML content
+
+        :param html: WEB page HTML data
+        :param pattern: XPath pattern (string or compiled) for node
+        :param nid: Node ID if user want specific node
+        :return: all nodes found
+        '''
+        from lxml import html
+
+        tree = html.fromstring(html_buffer)
+        # pattern may be a precompiled XPath expression
+        nodes = pattern(tree) if callable(pattern) else tree.xpath(pattern)
+
+        return nodes[nid] if nid is not None else nodes
+
+
+class parseContext(iCovidBase):
+    ''' Context of the sources parsed in a worker process
+
+    Only network helpers of the base are used, so DB, summary and metrics
+    are not loaded. Recorded pages, if given, are served instead of the
+    network requests.
+    '''
+    def __init__(self, pages=None):
+        ''' Constructor
+
+        :param pages: dict of recorded pages by URL
+        '''
+        self._pages = pages
+        self.merge = mergeBuffer()
+
+        self._cycle_cache = {}
+        self._cycle_locks = {}
+        self._cycle_lock = threading.Lock()
+
+    def _web_request(self, url, headers={}):
+        if self._pages is not None:
+            return self._pages[url]
+
+        return super()._web_request(url, headers)
+
+    def _web_json_fetch(self, url, paths, headers):
+        if self._pages is not None:
+            found = JsonStream([self._pages[url].encode()]).extract(*paths)
+            return [found[path] for path in paths]
+
+        return super()._web_json_fetch(url, paths, headers)
+
+
+# state of the worker process
+_worker = {}
+
+
+def _worker_init(sources, lvl, userless, pages=None):
+    ''' Prepare worker process, specs are compiled once per process
+
+    :param sources: directory with JSON specs
+    :param lvl: log level
+    :param userless: do not ask user in the worker
+    :param pages: dict of recorded pages by URL
+    '''
+    logger.set_lvl(lvl)
+    logger.userless_mode(userless)
+
+    _worker['sources'] = {spec.code: spec for spec in sourceRegistry(sources)}
+    _worker['pages'] = pages
+
+
+def _worker_parse(code):
+    ''' Parse the source in the worker process
+
+    :param code: code of the source
+    :return: tuple of config, contributions to other countries and duration
+    '''
+    ctx = parseContext(_worker['pages'])
+
+    start = time.time()
+    config = _worker['sources'][code].parse(ctx)
+
+    return config, ctx.merge.take(code), time.time() - start
+
+
+def _render_tab(data, s_data, paths, checked):
+    ''' Prepare tab with the map of the country
+
+    Function is self-contained, so tabs may be rendered in worker processes.
+
+    :param data: country config
+    :param s_data: summary row of the country
+    :param paths: dict of SVG paths by region name
+    :param checked: 'checked' for the selected tab
+    :return: tab node
+    '''
+    country_tmpl = \
+        '            <div class="tab">\n' \
+        '                <input type="radio" name="tabgroup" id="{0}" onclick="country_changed(\'{0}\')" autocomplete="off" {1}>\n' \
+        '                <label for="{0}">{2}{3}</label>\n' \
+        '                <div class="tab_content">\n' \
+        '                    <svg id="map" viewBox="{4}">\n' \
+        '                        <g>\n' \
+        '{5}\n' \
+        '                        </g>\n' \
+        '                    </svg>\n' \
+        '                </div>\n' \
+        '            </div>\n'
+    region_tmpl = '{}<path title="{}" tested="{}" sick="{}" d_sick="{}" recovered="{}" dead="{}" style="fill: rgb({}, {}, {});{}" class="land enabled" onclick="copy_info()" d="{}"/>\n'
+    path_style_tmpl = ' stroke:#000000; stroke-width:{}; stroke-linecap:butt; stroke-linejoin:round; stroke-opacity:1;'
+    vii_tmpl = '<span class="vi_info" onclick="notify(\'{}\', 15000);">{}</span>'
+
+    tab = '    '
+    s_regions = {reg[0]: reg for reg in s_data['Regions']}
+
+    # stage 3 - regions data
+    color_step = (data['Peak'] / 256) or 1
+    path_style = path_style_tmpl.format(data['ViewBoxLineSz'])
+
+    _regions = ''
+    for region, path in paths.items():
+        # get number of sick people in region
+        _, sick, d_sick = s_regions.get(region, [region, 0, 0])[:3]
+        sick = sick if sick else '—'
+
+        # stub for the future development
+        test = '—'
+        recv = '—'
+        dead = '—'
+
+        # calculate color
+        aux_Font = int(255 - ((0 if sick == '—' else sick) / color_step))
+        rgb = (255, aux_Font, aux_Font)
+
+        _regions += region_tmpl.format(tab * 7, region, test, sick, d_sick,
+                                       recv, dead, *rgb, path_style, path)
+
+    # strip redundant newline
+    _regions = _regions.rstrip()
+
+    # prepare very important information (vii)
+    vii = vii_tmpl.format(*data['vii']) if data.get('vii') else ''
+
+    # form data per country
+    return country_tmpl.format(data['Code'], checked,
+                               data['Name'], vii,
+                               data['ViewBoxSz'],
+                               _regions)
+
+
+class iCovid (iCovidBase):
+    def __init__(self, server_mode=False, interactive=True, credentials='icovid.credentials'):
+        ''' Constructor
+
+        :param server_mode: update data periodically
+        :param interactive: allow to ask the user for credentials
+        :param credentials: path to the credentials file
+        '''
+        super().__init__()
+
+        # FTP object is initialized on the first upload
+        self.ftp = None
+
+        # data sources are compiled once
+        self.sources = sourceRegistry('sources')
+
+        # server mode flag and credentials data
+        self._server_mode = server_mode
+        self._interactive = interactive
+        self._ftp = {'login': '', 'password': ''}
+        self._smtp = {'email': '', 'password': ''}
+        self.credentials = Credentials(logger, credentials, interactive)
+        logger.set_policy(self.credentials.policy())
+
+        # storage of errors that happened during data update
+        self.upd_errors = ErrorStore()
+
+        # data that sources contribute to other countries
+        self.merge = mergeBuffer()
+
+        # collected data is validated before it is written to DB
+        self.quality = qualityGate()
+
+        # worker processes for parsing and rendering, disabled by default
+        self.pool = None
+        self._chunksize = 1
+
+        # digests of generated pages and uploaded files
+        self._pages_path = 'icovid.pages'
+        self._uploads_path = 'icovid.uploads'
+
+        # background delivery of emails
+        self.mail = MailQueue('icovid.mail', logger, lambda: (self._smtp['email'], self._smtp['password']))
+
+        # request credentials for FTP and SMTP if server mode used
+        if self._server_mode:
+            logger.normal('Увімкнено автономний режим роботи')
+            self._ftp['login'], self._ftp['password'] = self.credentials.get('ftp')
+            self._smtp['email'], self._smtp['password'] = self.credentials.get('smtp')
+
+            if not (self._ftp['login'] and self._ftp['password'] and \
+                    self._smtp['email'] and self._smtp['password']):
+                logger.warning('Деякі дані не отримано. Вони будуть запитані пізніше')
+
+    def _collect(self, spec):
+        ''' Parse the source and measure duration
+
+        :param spec: source specification
+        :return: tuple of config and duration
+        '''
+        start = time.time()
+        data = spec.parse(self)
+
+        return data, time.time() - start
+
+    def _collect_in_process(self, spec):
+        ''' Parse the source in the worker process and measure duration
+
+        :param spec: source specification
+        :return: tuple of config and duration
+        '''
+        data, contributions, duration = self.pool.submit(_worker_parse, spec.code).result()
+        self.merge.extend(spec.code, contributions)
+
+        return data, duration
+
+    def start_workers(self, workers=None, chunksize=1):
+        ''' Parse sources and render tabs in worker processes
+
+        Sources are fetched and parsed by workers, only resulting configs
+        come back. Processes are spawned to not inherit threads and locks.
+
+        :param workers: number of processes, number of CPUs if not specified
+        :param chunksize: number of tabs sent to the worker at once
+        '''
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_worker_init,
+                                        initargs=('sources', logger.get_lvl(), self._server_mode or not self._interactive))
+        self._chunksize = chunksize
+
+        logger.debug('Увімкнено обробку у %d процесах' % self.pool._max_workers)
+
+    def stop_workers(self):
+        ''' Stop worker processes '''
+        if self.pool:
+            self.pool.shutdown()
+            self.pool = None
+
+    def update(self, workers=4):
+        ''' Update latest data of the sources that are due to refresh
+
+        Sources are parsed in parallel and nothing is written to DB until
+        all of them finish. Collected data and cross-country contributions
+        are applied to DB in one batch.
+
+        :param workers: number of sources parsed simultaneously, limited by
+                        the number of worker processes if they are enabled,
+                        sources are parsed in the calling thread if it is 1
+        :return: list of countries updated in DB
+        '''
+        curr_date = datetime.now().strftime("%d %b %Y")
+
+        # run update data
+        logger.normal('Оновлюємо дані ..')
+        start = time.time()
+        self._cycle_cache = {}
+        self._cycle_locks = {}
+
+        staged = {}
+        due = list(self.sources.due())
+
+        # threads wait for worker processes if they are enabled
+        collect = self._collect_in_process if self.pool else self._collect
+
+        threads = len(due) if self.pool else min(workers, len(due))
+        executor = ThreadPoolExecutor(max_workers=threads) if threads > 1 else inlineExecutor()
+        with executor as pool:
+            jobs = [(spec, pool.submit(collect, spec)) for spec in due]
+
+            # results are handled in order of sources to keep log readable
+            for spec, job in jobs:
+                try:
+                    data, upd_duration = job.result()
+                    staged[data['Name']] = data
+                    self.upd_errors.resolve(spec.code)
+
+                    logger.success('Дані з %s оновлені [%fс]' % (data['Name'], upd_duration))
+
+                except updateError:
+                    # nothing is written to DB, sources that did not start are skipped
+                    for _, other in jobs:
+                        other.cancel()
+                    raise
+
+                except Exception as e:
+                    # handle errors and continue data update
+                    error_msg = 'Не вдалось оновити дані країни: %s' % spec.name
+                    logger.error(error_msg)
+                    self.upd_errors.add(spec.code, error_msg, traceback.format_exc())
+
+                    # partial contributions of the failed source are dropped
+                    self.merge.discard(spec.code)
+
+                # failed sources are retried on the next refresh as well
+                self.sources.mark_refreshed(spec)
+
+        updated, rejected = self.merge.apply(self.db, curr_date, staged,
+                                             lambda rows: self.quality.check(self.db, curr_date, rows))
+
+        for country, issues in rejected.items():
+            error_msg = 'Дані країни %s не пройшли перевірку і не збережені' % country
+            logger.warning('%s: %s' % (error_msg, '; '.join(issues)))
+            self.upd_errors.add('quality:%s' % country, error_msg, '\n'.join(issues))
+
+        for country in updated:
+            self.upd_errors.resolve('quality:%s' % country)
+
+        # rejected countries must not disappear from the views of the day
+        for country in self.quality.carry_forward(self.db, curr_date, rejected):
+            logger.normal('Для країни %s використано останні перевірені дані' % country)
+
+        # cross-country updates may touch other countries, so let summary
+        # detect changed rows by itself
+        self.summary.refresh(self.db, curr_date)
+        saver.mark(self.summary._path, self.summary.save)
+
+        self.metrics.refresh(self.db, curr_date)
+        saver.mark(self.metrics._path, self.metrics.save)
+
+        duration = time.time() - start
+        logger.debug('Оновлення даних завершено [%fс]' % duration)
+
+        return updated
+
+    def __str__(self):
+        ''' Show COVID information '''
+        curr_date = date.today().strftime("%d %b %Y")
+        self._ensure_summary(curr_date)
+
+        return self.summary.render(curr_date, self.translate, self.metrics)
+
+    def _ensure_summary(self, day):
+        ''' Calculate summary and metrics for the date if they are absent
+
+        :param day: date string
+        '''
+        if self.summary.get(day) is None and self.summary.refresh(self.db, day):
+            saver.mark(self.summary._path, self.summary.save)
+
+        countries = self.db.get({'date': day}) or {}
+        if any(self.metrics.get(country, day=day) is None for country in countries):
+            if self.metrics.refresh(self.db, day):
+                saver.mark(self.metrics._path, self.metrics.save)
+
+    def _html_history(self, path='./report/history'):
+        ''' Export full history of countries for charts
+
+        Three files are created per country: "<code>.json" keeps an overview
+        with resolution decreasing to the past, "<code>.daily.json" keeps
+        all the days and "<code>.regions.json" keeps the number of sick
+        in every region. Web page requests them only when user changes the
+        range of charts or selects the region.
+
+        :param path: directory for history files
+        :return: list of created files
+        '''
+        metrics = {'test': 'Tested', 'sick': 'Sick', 'recv': 'Recovered', 'dead': 'Dead'}
+
+        # collect series of all the countries in one pass through DB
+        days = sorted(self.db.get_dates_list(), key=lambda d: datetime.strptime(d, '%d %b %Y'))
+        series = {}
+        for day in days:
+            for country, info in self.db.get({'date': day}).items():
+                data = series.setdefault(country, {'days': [], 'regions': [], **{k: [] for k in metrics}})
+                data['code'] = info.get('Code', data.get('code'))
+                data['days'].append(day)
+                data['regions'].append(info.get('Regions', {}))
+                for key, name in metrics.items():
+                    data[key].append(info[name])
+
+        os.makedirs(path, exist_ok=True)
+
+        files = []
+        for data in series.values():
+            # old records may miss code of the country
+            code = data['code']
+            if not code:
+                continue
+
+            dates = [datetime.strptime(d, '%d %b %Y').date() for d in data['days']]
+            labels = [self.translate('eng', 'ukr', d) for d in data['days']]
+
+            daily = {'days': [' '.join(l.split()[:2]) for l in labels]}
+            daily.update({k: encode_series(data[k]) for k in metrics})
+            daily['avg'] = {k: encode_series([round(v) for v in moving_average(data[k], 7)]) for k in metrics}
+
+            spans = resolution_spans(dates)
+            overview = {'days': [], 'span': spans}
+            for start, stop in spans:
+                if stop - start == 1:
+                    overview['days'].append(daily['days'][start])
+                elif dates[stop - 1] - dates[start] < timedelta(days=7):
+                    overview['days'].append('%s – %s' % (daily['days'][start], daily['days'][stop - 1]))
+                else:
+                    overview['days'].append(' '.join(labels[start].split()[1:]))
+            overview.update({k: encode_series([round(v) for v in bucket_mean(data[k], spans)]) for k in metrics})
+
+            regions = self._html_regions_history(daily['days'], data['regions'])
+
+            for name, content in (('%s.json' % code, overview), ('%s.daily.json' % code, daily),
+                                  ('%s.regions.json' % code, regions)):
+                fname = os.path.join(path, name)
+                with atomic_write(fname) as fp:
+                    json.dump(content, fp, ensure_ascii=False, separators=(',', ':'))
+                files.append(fname)
+
+        logger.debug('Створено файли історії: %d' % len(files))
+        return files
+
+    @staticmethod
+    def _html_regions_history(days, regions):
+        ''' Prepare history of the country regions
+
+        Regions are indexed by position in "names" list, the latest order
+        of regions is kept. Days before the first data of the region are
+        filled with zero, missed days keep the previous value.
+
+        :param days: labels of days
+        :param regions: list of dicts region -> number of sick per day
+        :return: dict with days, names, sick and 7-day average of new cases
+        '''
+        names = list(regions[-1]) if regions else []
+        names += sorted({name for day in regions for name in day} - set(names))
+
+        history = {'days': days, 'names': names, 'sick': [], 'avg': []}
+        for name in names:
+            sick = []
+            for day in regions:
+                sick.append(day.get(name, sick[-1] if sick else 0))
+
+            new = [curr - prev for prev, curr in zip([0] + sick, sick)]
+            history['sick'].append(encode_series(sick))
+            history['avg'].append(encode_series([round(v) for v in moving_average(new, 7)]))
+
+        return history
+
+    def _html_report(self, multipage=False):
+        ''' Export data to HTML web page
+
+        :param multipage: create page per country and index of pages
+        :return: list of created pages
+        '''
+        def make_history(country, days_to_show=14):
             """ Prepare dynamics data for chart drawing
 
             Args:
@@ -1340,7 +2646,7 @@ class iCovid (iCovidBase):
                 days_to_show (int, optional): Number of days to process. Defaults to 14.
 
             Returns:
-                dict: History data
+                dict: History data as JSON arrays
             """
             data = {'days': [], 'test': [], 'sick': [], 'recv': [], 'dead': []}
 
@@ -1349,92 +2655,47 @@ class iCovid (iCovidBase):
                 if not info:
                     continue
 
-                data['days'].append('"%s"' % self.translate('eng', 'ukr', day).split()[0])
-                data['test'].append('"%s"' % info['Tested'])
-                data['sick'].append('"%s"' % info['Sick'])
-                data['recv'].append('"%s"' % info['Recovered'])
-                data['dead'].append('"%s"' % info['Dead'])
+                data['days'].append(self.translate('eng', 'ukr', day).split()[0])
+                data['test'].append(info['Tested'])
+                data['sick'].append(info['Sick'])
+                data['recv'].append(info['Recovered'])
+                data['dead'].append(info['Dead'])
 
             for k, v in data.items():
-                data[k] = '[%s]' % ', '.join(v[-days_to_show:])
+                data[k] = json.dumps(encode_series(v[-days_to_show:]) if k != 'days' else v[-days_to_show:],
+                                     ensure_ascii=False, separators=(',', ':'))
 
             return data
 
-        def make_data_regs(country, today, yestd):
+        def make_data_regs(summary):
             """ Function build data regs attribute
 
             Args:
-                country (str): name of the country
-                today (str): today`s date
-                yestd (str): yesterday`s date
+                summary (dict): summary row of the country
 
             Returns:
-                str: data-regs attribute
+                str: data-regs attribute, flat array of name, sick, d_sick,
+                     sick zone and d_sick zone of every region
             """
-            data_regs = []
-            data_reg_tmpl = '"{}", "{}", "{}", "{}", "{}"'
-
-            today_data = self.db.get({'date': today, 'country': country})
-            yestd_data = self.db.get({'date': yestd, 'country': country}, today_data)
-
-            for region in today_data['Regions']:
-                sick = today_data['Regions'].get(region, 0)
-                d_sick = sick - yestd_data['Regions'].get(region, sick)
-                data_regs.append([region, sick, d_sick])
-                #data_regs.append(data_reg_tmpl.format(region, sick, d_sick))
+            # regions are already sorted by number of sick
+            data_regs = [item for region in summary['Regions'] for item in region]
 
-            # 5 zones Fonted by unique Font
-            danger_color = "dtrr_danger{}"
-            min_sick = min([it[1] for it in data_regs])
-            sick_step = (max([it[1] for it in data_regs]) + 1 - min_sick) / 5
-
-            min_dsick = min([it[2] for it in data_regs])
-            dsick_step = (max([it[2] for it in data_regs]) + 1 - min_dsick) / 5
-
-            for reg in data_regs:
-                # depending of the value, region will have its Font
-                sick = danger_color.format(int((reg[1] - min_sick) // sick_step))
-                reg.append(sick)
-                delta_sick = danger_color.format(int((reg[2] - min_dsick) // dsick_step))
-                reg.append(delta_sick)
-
-            # sort regions by number of sick and format
-            data_regs = [data_reg_tmpl.format(*x) for x in sorted(data_regs, key=lambda x: int(x[1]), reverse=True)]
-
-            return '[{}]'.format(','.join(data_regs)).replace('\'', '&apos;')
+            return json.dumps(data_regs, ensure_ascii=False, separators=(',', ':')).replace('\'', '&apos;')
 
         # define templates for complex nodes
-        total_tmpl = '{}<div id="total{}" title="{}" peak="{}" popl="{}" area="{}" dens="{}" desc="{}" cure="{}" data-regs=\'{}\' tested="{}" d_tested="{}" sick="{}" d_sick="{}" recovered="{}" d_recovered="{}" dead="{}" d_dead="{}" data-days=\'{}\' data-test=\'{}\' data-sick=\'{}\' data-recv=\'{}\' data-dead=\'{}\' style="display: none;"></div>\n'
-        country_tmpl = \
+        total_tmpl = '{}<div id="total{}" title="{}" peak="{}" popl="{}" area="{}" dens="{}" desc="{}" cure="{}" data-regs=\'{}\' tested="{}" d_tested="{}" sick="{}" d_sick="{}" recovered="{}" d_recovered="{}" dead="{}" d_dead="{}" data-days=\'{}\' data-test=\'{}\' data-sick=\'{}\' data-recv=\'{}\' data-dead=\'{}\' data-metrics=\'{}\' style="display: none;"></div>\n'
+        nav_tmpl = \
             '            <div class="tab">\n' \
-            '                <input type="radio" name="tabgroup" id="{0}" onclick="country_changed(\'{0}\')" autocomplete="off" {1}>\n' \
-            '                <label for="{0}">{2}{3}</label>\n' \
-            '                <div class="tab_content">\n' \
-            '                    <svg id="map" viewBox="{4}">\n' \
-            '                        <g>\n' \
-            '{5}\n' \
-            '                        </g>\n' \
-            '                    </svg>\n' \
-            '                </div>\n' \
+            '                <input type="radio" name="tabgroup" id="{0}" onclick="location.href=\'{0}.html\'" autocomplete="off">\n' \
+            '                <label for="{0}">{1}</label>\n' \
             '            </div>\n'
-        region_tmpl = '{}<path title="{}" tested="{}" sick="{}" d_sick="{}" recovered="{}" dead="{}" style="fill: rgb({}, {}, {});{}" class="land enabled" onclick="copy_info()" d="{}"/>\n'
-        path_style_tmpl = ' stroke:#000000; stroke-width:{}; stroke-linecap:butt; stroke-linejoin:round; stroke-opacity:1;'
-        vii_tmpl = '<span class="vi_info" onclick="notify(\'{}\', 15000);">{}</span>'
-
-        # create htmlWorker object
-        html = htmlWorker('./report/report.html', './report/index.html')
-
-        # config for rendering
-        render_cfg = {}
-        updated = ''
-        total = ''
-        regions = ''
-        checked = 'checked'
+        page_tmpl = '{}<li><a href="{}.html">{}</a> — хворих {:,} ({:+,})</li>\n'
+
         tab = '    '
 
-        # get current and yesterday dates
+        # get current date
         curr_date = date.today().strftime("%d %b %Y")
-        yest_date = (date.today() - timedelta(days=1)).strftime("%d %b %Y")
+        self._ensure_summary(curr_date)
 
         # upload paths for regions
         with open('./report/regions.map', 'r+') as fp:
@@ -1442,122 +2703,159 @@ class iCovid (iCovidBase):
 
         # get data for current date
         today_data = self.db.get({'date': curr_date})
-        yestd_data = self.db.get({'date': yest_date}, today_data)
 
         # stage 1 - date of latest data update
         updated = self.translate('eng', 'ukr', datetime.now().strftime("%H:%M від %d %b %Y"))
 
-        # configure default information
-        default = today_data.get('Україна')
-        y_default = yestd_data.get('Україна')
-
-        # prepare dynamics data
-        hist = make_history('Україна', 14)
-
-        # make default total data
-        total = total_tmpl.format(tab * 2, '', default['Name'], default['Peak'],
-                                  '{:,}'.format(default['Population']),
-                                  '{:,}'.format(default['Area']),
-                                  '{:.2f}'.format(default['Population'] / default['Area']),
-                                  default['Description'], default['Cure'],
-                                  make_data_regs(default['Name'], curr_date, yest_date),
-                                  default['Tested'], default['Tested'] - y_default.get('Tested', 0),
-                                  default['Sick'],   default['Sick'] - y_default.get('Sick', 0),
-                                  default['Recovered'], default['Recovered'] - y_default.get('Recovered', 0),
-                                  default['Dead'], default['Dead'] - y_default.get('Dead', 0),
-                                  hist['days'], hist['test'], hist['sick'], hist['recv'], hist['dead'])
-
-
-        for country, data in today_data.items():
-            y_data = yestd_data.get(country, {})
+        # prepare product version
+        version = '{} [{}]'.format(__version__, self.translate('eng', 'ukr', __release__))
+
+        def make_total(data, suffix):
+            """ Prepare total info of the country
+
+            Args:
+                data (dict): country config
+                suffix (str): suffix of the node id
+
+            Returns:
+                str: total node
+            """
+            s_data = self.summary.get(curr_date, data['Name'])
+
             # prepare dynamics data
-            hist = make_history(country, 14)
-
-            # stage 2 - prepare total info for the country
-            total += total_tmpl.format(tab * 2, '_%s' % data['Code'], data['Name'], data['Peak'],
-                                       '{:,}'.format(data['Population']),
-                                       '{:,}'.format(data['Area']),
-                                       '{:.2f}'.format(data['Population'] / data['Area']),
-                                       data['Description'], data['Cure'],
-                                       make_data_regs(data['Name'], curr_date, yest_date),
-                                       data['Tested'], data['Tested'] - y_data.get('Tested', 0),
-                                       data['Sick'], data['Sick'] - y_data.get('Sick', 0),
-                                       data['Recovered'], data['Recovered'] - y_data.get('Recovered', 0),
-                                       data['Dead'], data['Dead'] - y_data.get('Dead', 0),
-                                       hist['days'], hist['test'], hist['sick'], hist['recv'], hist['dead'])
-
-            # stage 3 - regions data
-            color_step = (data['Peak'] / 256) or 1
-            path_style = path_style_tmpl.format(data['ViewBoxLineSz'])
-
-            _regions = ''
-            for region, path in regions_map[data['Name']].items():
-                # get number of sick people in region
-                sick = data['Regions'].get(region, 0)
-                d_sick = sick - y_data['Regions'].get(region, sick)
-                sick = sick if sick else '—'
-
-                # stub for the future development
-                test = '—'
-                recv = '—'
-                dead = '—'
-
-                # calculate color
-                aux_Font = int(255 - ((0 if sick == '—' else sick) / color_step))
-                rgb = (255, aux_Font, aux_Font)
-
-                _regions += region_tmpl.format(tab * 7, region, test, sick, d_sick,
-                                               recv, dead, *rgb, path_style, path)
+            hist = make_history(data['Name'], 14)
+
+            return total_tmpl.format(tab * 2, suffix, data['Name'], data['Peak'],
+                                     '{:,}'.format(data['Population']),
+                                     '{:,}'.format(data['Area']),
+                                     '{:.2f}'.format(data['Population'] / data['Area']),
+                                     data['Description'], data['Cure'],
+                                     make_data_regs(s_data),
+                                     s_data['Tested'], s_data['d_Tested'],
+                                     s_data['Sick'], s_data['d_Sick'],
+                                     s_data['Recovered'], s_data['d_Recovered'],
+                                     s_data['Dead'], s_data['d_Dead'],
+                                     hist['days'], hist['test'], hist['sick'], hist['recv'], hist['dead'],
+                                     json.dumps(self.metrics.get(data['Name'], day=curr_date) or {}, separators=(',', ':')))
+
+        def make_tabs(countries, checked):
+            """ Prepare tabs with the maps of the countries
+
+            Tabs are rendered by worker processes if they are enabled.
+
+            Args:
+                countries (list): country configs
+                checked (list): 'checked' for the selected tab per country
+
+            Returns:
+                list: tab nodes
+            """
+            args = [(data, self.summary.get(curr_date, data['Name']), regions_map[data['Name']], check)
+                    for data, check in zip(countries, checked)]
+
+            if self.pool and len(args) > 1:
+                return list(self.pool.map(_render_tab, *zip(*args), chunksize=self._chunksize))
+
+            return [_render_tab(*arg) for arg in args]
+
+        def make_page(source, target, render_cfg):
+            """ Render the page
+
+            Args:
+                source (str): template of the page
+                target (str): path of the page
+                render_cfg (dict): values of the template
+            """
+            # prepare snowflakes set
+            snowflakes_kinds = ['❅', '❆', '❄']
+            snowflake_tmpl = '{}<div class="snowflake">{}</div>'
+
+            snowflakes_num = 20
+            snow = '\n'.join([snowflake_tmpl.format(tab * 3, random.choice(snowflakes_kinds)) for i in range(snowflakes_num)])
+
+            # prepare data for rendering
+            render_cfg.update({'updated': updated, 'version': version, 'snow': snow})
+
+            # render and save
+            html = htmlWorker(source, target)
+            html.render(render_cfg)
+            html.save()
+
+        pages = []
+        if not multipage:
+            # make default total data
+            total = make_total(today_data['Україна'], '')
+
+            for country, data in today_data.items():
+                # stage 2 - prepare total info for the country
+                total += make_total(data, '_%s' % data['Code'])
+
+            # the first tab is selected
+            checked = ['checked'] + [''] * (len(today_data) - 1)
+            regions = ''.join(make_tabs(list(today_data.values()), checked))
 
             # strip redundant newline
-            _regions = _regions.rstrip()
+            make_page('./report/report.html', './report/index.html',
+                      {'regions': regions.rstrip(), 'total': total.rstrip()})
+            pages.append('./report/index.html')
+
+        else:
+            # pages are rendered only if data of the country changed
+            digests = {}
+            if os.path.isfile(self._pages_path):
+                with open(self._pages_path, 'r') as fp:
+                    digests = json.load(fp)
 
-            # prepare very important information (vii)
-            vii = vii_tmpl.format(*data['vii']) if data.get('vii') else ''
+            names = [[data['Code'], data['Name']] for data in today_data.values()]
 
-            # form data per country
-            regions += country_tmpl.format(data['Code'], checked,
-                                           data['Name'], vii,
-                                           data['ViewBoxSz'],
-                                           _regions)
-            checked = ''
+            changed = {}
+            for country, data in today_data.items():
+                target = './report/%s.html' % data['Code']
+                inputs = [data, self.summary.get(curr_date, country), self.metrics.get(country, day=curr_date),
+                          make_history(country, 14), names, version]
+                digest = hashlib.md5(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
 
-        # strip redundant newline
-        regions = regions.rstrip()
-        total = total.rstrip()
+                if digests.get(data['Code']) != digest or not os.path.isfile(target):
+                    changed[country] = digest
 
-        # prepare product version
-        version = '{} [{}]'.format(__version__, self.translate('eng', 'ukr', __release__))
+            tabs = make_tabs([today_data[country] for country in changed], ['checked'] * len(changed))
 
-        # prepare snowflakes set
-        snow = ''
-        snowflakes_kinds = ['❅', '❆', '❄']
-        snowflake_tmpl = '{}<div class="snowflake">{}</div>'
+            for (country, digest), tab_node in zip(changed.items(), tabs):
+                data = today_data[country]
+                target = './report/%s.html' % data['Code']
 
-        snowflakes_num = 20
-        snow = '\n'.join([snowflake_tmpl.format(tab * 3, random.choice(snowflakes_kinds)) for i in range(snowflakes_num)])
+                # other countries are links to their pages
+                regions = ''.join(tab_node if other == country else
+                                  nav_tmpl.format(odata['Code'], odata['Name'])
+                                  for other, odata in today_data.items())
 
-        # prepare data for rendering
-        render_cfg = {'updated': updated, 'regions': regions, 'total': total, 'version': version, 'snow': snow}
+                total = make_total(data, '') + make_total(data, '_%s' % data['Code'])
 
-        # render and save
-        html.render(render_cfg)
-        html.save()
+                make_page('./report/report.html', target,
+                          {'regions': regions.rstrip(), 'total': total.rstrip()})
+                digests[data['Code']] = digest
+                pages.append(target)
 
-    def _login(self):
-        ''' Get login data from the user
+            # index of pages
+            rows = [[data['Code'], data['Name'], self.summary.get(curr_date, country)['Sick'],
+                     self.summary.get(curr_date, country)['d_Sick']] for country, data in today_data.items()]
+            digest = hashlib.md5(json.dumps([rows, version], sort_keys=True).encode()).hexdigest()
 
-        :return: username and password
-        '''
-        try:
-            username = input(' [запит даних] > ім\'я користувача: ')
-            password = getpass(' [запит даних] > пароль %s: ' % username)
-        except KeyboardInterrupt:
-            logger.print('', end='\n')
-            logger.debug('Дані користувача не надано')
-            return (None, None)
+            if digests.get('') != digest or not os.path.isfile('./report/index.html'):
+                countries = ''.join(page_tmpl.format(tab * 3, *row) for row in rows)
+                make_page('./report/pages.html', './report/index.html', {'countries': countries.rstrip()})
+                digests[''] = digest
+                pages.append('./report/index.html')
+
+            with open(self._pages_path, 'w+') as fp:
+                json.dump(digests, fp)
+
+            logger.debug('Згенеровано сторінок: %d з %d' % (len(pages), len(today_data) + 1))
+
+        # history is requested by web page on demand
+        self._html_history()
 
-        return (username, password)
+        return pages
 
     def _ftp_upload(self, srcfile):
         def ftp_path(orig_path):
@@ -1572,46 +2870,51 @@ class iCovid (iCovidBase):
         logger.debug('Файл "%s" вивантажено [%fс]' % (srcfile, duration))
 
     def smtp_send(self, emails):
-        ''' Function sends emails using Google Mail Server '''
-        # run web files upload
+        ''' Function queues emails for delivery through Google Mail Server '''
         logger.normal('Надсилання електронного листа ..')
 
         # check if user entered SMTP credentials earlier
         if not (self._smtp['email'] and self._smtp['password']):
             # ask user to enter credentials for SMTP server
-            self._smtp['email'], self._smtp['password'] = self._login()
+            self._smtp['email'], self._smtp['password'] = self.credentials.get('smtp')
             if not (self._smtp['email'] and self._smtp['password']):
-                logger.warning('Дані для входу в обліковий запис на надані')
-                return
+                logger.warning('Дані для входу в обліковий запис на надані. Лист буде надіслано пізніше')
         else:
             logger.normal('Автоматичне використання попередньої пошти та паролю')
 
-        # Create secure connection with server and send emails
-        start = time.time()
-        ctx = ssl.create_default_context()
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465, context=ctx) as server:
-            server.login(self._smtp['email'], self._smtp['password'])
+        # delivery is performed by the background queue
+        for email in emails:
+            self.mail.put(email)
 
-            for email in emails:
-                server.sendmail(self._smtp['email'], email.get_to(), email.get_message())
+        logger.debug('До черги додано {} лист(ів)'.format(len(emails)))
 
-        duration = time.time() - start
-        logger.success('Надіслано {} лист(ів) [{:.3f} c]'.format(len(emails), duration))
+    def webpage_update(self, server, multipage=False):
+        ''' Update web-page files through FTP server
 
-    def webpage_update(self, server):
-        ''' Update web-page files through FTP server '''
+        :param server: FTP server
+        :param multipage: use page per country and upload changed files only
+        '''
         # generate HTML report
         logger.normal('Генерування веб-сторінки ..')
-        self._html_report()
+        self._html_report(multipage)
         logger.success('Веб-сторінку згенеровано')
 
+        self._webpage_publish(server, only_changed=multipage)
+
+    def _webpage_publish(self, server, only_changed=False):
+        ''' Upload generated web-page files to the FTP server
+
+        :param server: FTP server
+        :param only_changed: upload pages of countries and files changed
+                             since the previous upload
+        '''
         # run web files upload
         logger.normal('Оновлення веб-сторінки ..')
 
         # check if user entered login and password earlier
         if not (self._ftp['login'] and self._ftp['password']):
             # there is no all information, so request a new one from the user
-            self._ftp['login'], self._ftp['password'] = self._login()
+            self._ftp['login'], self._ftp['password'] = self.credentials.get('ftp')
             if not (self._ftp['login'] and self._ftp['password']):
                 logger.warning('Оновлення веб-сторінки скасовано')
                 return
@@ -1619,6 +2922,12 @@ class iCovid (iCovidBase):
             logger.normal('Автоматичне використання попередніх логіну та паролю')
 
         # setup FTP connection
+        from ftplib import FTP
+
+        if self.ftp is None:
+            self.ftp = FTP()
+            self.ftp.set_debuglevel(0)
+
         start = time.time()
         try:
             self.ftp.connect(server, 21)
@@ -1649,16 +2958,62 @@ class iCovid (iCovidBase):
                      './report/flags/flag_rus.jpg',
                      './report/flags/flag_hug.jpg',
                      './report/flags/flag_rom.jpg']
+        history_files = sorted(glob.glob('./report/history/*.json'))
+
+        uploads = {}
+        if only_changed:
+            # country pages are uploaded alongside the index
+            web_files += sorted(set(glob.glob('./report/*.html')) - set(web_files) -
+                                {'./report/report.html', './report/pages.html'})
+
+            # pages of quarantined countries keep the published data
+            today = self.db.get({'date': date.today().strftime('%d %b %Y')}, {})
+            held = {'./report/%s.html' % today[country]['Code'] for country in self.quality.quarantine
+                    if country in today}
+            web_files = [wfile for wfile in web_files if wfile not in held]
+
+            if os.path.isfile(self._uploads_path):
+                with open(self._uploads_path, 'r') as fp:
+                    uploads = json.load(fp)
 
         duration = time.time() - start
         logger.normal('Приєднано до FTP-сервера [%fс]' % duration)
 
+        # make sure directory for history exists
+        from ftplib import error_perm
+
+        if history_files:
+            try:
+                self.ftp.mkd('history')
+            except error_perm:
+                pass
+
+        web_files += history_files
+
+        if only_changed:
+            digests = {}
+            for wfile in web_files:
+                with open(wfile, 'rb') as fp:
+                    digests[wfile] = hashlib.md5(fp.read()).hexdigest()
+
+            web_files = [wfile for wfile in web_files if uploads.get(wfile) != digests[wfile]]
+            if not web_files:
+                logger.normal('Файли веб-сторінки не змінились')
+                return
+
         # copy files
         logger.normal('Починаємо надсилання файлів ...', end='\r')
         start = time.time()
         for i, wfile in enumerate(web_files, 1):
             self._ftp_upload(wfile)
-            logger.normal('Наділано на сервер {} з {} файлів ...'.format(i, len(web_files)), end='\r' if wfile != web_files[-1] else '\n')
+            logger.normal('Наділано на сервер %d з %d файлів ...', i, len(web_files),
+                          end='\r' if wfile != web_files[-1] else '\n')
+
+            if only_changed:
+                # remember uploaded files, so failed ones are retried next time
+                uploads[wfile] = digests[wfile]
+                with open(self._uploads_path, 'w+') as fp:
+                    json.dump(uploads, fp)
         duration = time.time() - start
 
         logger.success('Веб-сторінку "%s" оновлено [%fс]' % (server, duration))
@@ -1673,14 +3028,20 @@ class iCovid (iCovidBase):
 
             return text
 
-        if not self.upd_errors:
-            # no errors happened
+        pending = self.upd_errors.pending()
+        if not pending:
+            # no new errors or state changes
             return
 
-        error_tmpl = """<p><strong>Помилка</strong><br/>{}<br/><br/><strong>Деталі</strong><br/><code>{}</code></p>"""
+        error_tmpl = """<p><strong>Помилка</strong> [{}]<br/>{}<br/><br/><strong>Стан</strong><br/>{}, повторень: {}, вперше: {}, востаннє: {}<br/><br/><strong>Деталі</strong><br/><code>{}</code></p>"""
+        states = {ErrorStore.ACTIVE: 'активна', ErrorStore.RESOLVED: 'усунена'}
+
+        def timestamp(seconds):
+            """ Function formats time of the error """
+            return self.translate('eng', 'ukr', '{:%d-%b-%Y %H:%M:%S}'.format(datetime.fromtimestamp(seconds)))
 
         html_tmpl = """<html><body style="white-space: pre-line">
-            <div><img alt="⚠️" src=""> Під час автоматичного оновлення даних виникла неочікувана помилка.</div>
+            <div><img alt="⚠️" src=""> Під час автоматичного оновлення даних виникли нові помилки або змінився їх стан.</div>
             <table style="border-collapse: collapse; width: 800px;" border="1">
                 <tbody>
                     <tr>
@@ -1698,13 +3059,349 @@ class iCovid (iCovidBase):
             </body>
             </html>"""
 
-        errors = '<hr>'.join([error_tmpl.format(screen_content(error[0]), screen_content(error[1])) for error in self.upd_errors])
+        errors = '<hr>'.join([error_tmpl.format(fprint, screen_content(error['message']),
+                                                states[error['state']], error['count'],
+                                                timestamp(error['first']), timestamp(error['last']),
+                                                screen_content(error['details']))
+                              for fprint, error in pending])
+
+        # the same state will not be reported again
+        self.upd_errors.mark_notified([fprint for fprint, _ in pending])
 
         return html_tmpl.format(self.translate('eng', 'ukr', '{:%d-%b-%Y %H:%M:%S}'.format(datetime.now())), errors)
 
-    def add_error(self, error, details):
+    def add_error(self, error, details, source='main'):
         """ Function add some user errors to the errors list """
-        self.upd_errors.append([error, details])
+        self.upd_errors.add(source, error, details)
+
+
+# registry of data source parsers: name -> callable(ctx, spec, config)
+source_parsers = {}
+
+
+def source_parser(name):
+    ''' Decorator used to register data source parser
+
+    :param name: name of the parser used in source specs
+    '''
+    def register(func):
+        source_parsers[name] = func
+        return func
+
+    return register
+
+
+@source_parser('worldometers_total')
+def _parse_worldometers_total(ctx, spec, config):
+    ''' Get total data from the worldometers.info countries table '''
+    logger.normal(' - Збір загальних даних з worldometers.info ..')
+    page = ctx._web_request(spec.urls['total'])
+    target = spec.data['worldometers']
+
+    for country in ctx._html_get_node(page, spec.xpath['countries']):
+        nodes = spec.xpath['country_name'](country)
+
+        # check if there is name of the desired country
+        if len(nodes) > 0 and nodes[0].text == target['name']:
+            break
+    else:
+        raise ValueError('Країну "%s" не знайдено' % target['name'])
+
+    cells = spec.xpath['cells'](country)
+    for case, column in target['columns'].items():
+        config[case] = int(cells[column].text.replace(',', ''))
+
+    return config
+
+
+@source_parser('google_regions')
+def _parse_google_regions(ctx, spec, config):
+    ''' Get regions data from the news.google.com COVID-19 map '''
+    logger.normal(' - Збір даних про регіони з news.google.com ..')
+    page = ctx._web_request(spec.urls['regions'])
+
+    # get regions. skip first two general nodes
+    regions = ctx._html_get_node(page, spec.xpath['google_rows'])[2:]
+    for region in regions:
+        reg = spec.xpath['google_name'](region)[1].text
+        reg_name = spec.names.get(reg, reg)
+
+        sick = spec.xpath['cells'](region)[0].text.strip().replace('\xa0', '')
+        config['Regions'][reg_name] = int(sick) if sick != '—' else 0
+
+    return config
+
+
+@source_parser('ukr_total')
+def _parse_ukr_total(ctx, spec, config):
+    # covid19.gov.ua
+    logger.normal(' - Збір загальних даних з covid19.gov.ua ..')
+    page = ctx._web_request(spec.urls['total'])
+
+    divs = ctx._html_get_node(page, spec.xpath['counters'])
+    if len(divs) != 4:
+        raise ValueError('Неочікуване число елементів - %d' % len(divs))
+
+    for i, case in enumerate(['Sick', 'Recovered', 'Dead', 'Tested']):
+        raw_text = spec.xpath['counter_value'](divs[i])[0].text.strip()
+        config[case] = int(re.sub(r"\D", "", raw_text))
+
+    return config
+
+
+@source_parser('ukr_regions')
+def _parse_ukr_regions(ctx, spec, config):
+    # detailed - https://index.minfin.com.ua/ua/reference/coronavirus/ukraine/
+    logger.normal(' - Збір даних про регіони з index.minfin.com.ua ..')
+    page = ctx._web_request(spec.urls['regions'])
+
+    rows = ctx._html_get_node(page, spec.xpath['rows'])
+    for row in rows:
+        items = spec.xpath['cells'](row)
+
+        if len(items) == 0 or len(items[0]) == 0:
+            continue
+
+        reg_name = spec.names.get(items[0][0].text)
+        if reg_name:
+            config['Regions'][reg_name] = int(items[1].text)
+
+    return config
+
+
+def _ses_lviv_report(ctx, spec):
+    ''' Get paragraphs of the latest ses.lviv.ua report
+
+    :return: list of paragraph nodes
+    '''
+    # get intial page to find out final link with the report
+    page = ctx._web_request(spec.urls['reports'])
+    links = ctx._html_get_node(page, spec.xpath['links'])
+
+    # go through all available links and look for the report
+    target_link = ''
+    for link in links:
+        if spec.data['link_title'] in link.text:
+            target_link = spec.data['link_base'] + link.attrib['href']
+            break
+
+    if not target_link:
+        return []
+
+    logger.debug('Цільове посилання: {} ..'.format(target_link))
+    page = ctx._web_request(target_link, headers=dict(spec.headers))
+
+    return ctx._html_get_node(page, spec.xpath['paragraphs'])
+
+
+@source_parser('ulv_total')
+def _parse_ulv_total(ctx, spec, config):
+    logger.normal(' - Збір загальних даних з index.minfin.com.ua ..')
+    page = ctx._web_request(spec.urls['total'])
+
+    rows = ctx._html_get_node(page, spec.xpath['rows'])
+    for row in rows:
+        items = spec.xpath['cells'](row)
+        if len(items) == 0 or len(items[0]) == 0:
+            continue
+        elif items[0][0].text == spec.data['minfin_name']:
+            config['Sick'] = int(items[1].text)
+            config['Dead'] = int(items[3].text)
+            config['Recovered'] = int(items[5].text)
+
+    # get the page with tested persons quanity
+    for p in _ses_lviv_report(ctx, spec):
+        if p.text_content() and spec.data['tested_marker'] in p.text_content().strip():
+            config['Tested'] = int(p.text_content().split()[2])
+            break
+
+    return config
+
+
+@source_parser('ulv_regions')
+def _parse_ulv_regions(ctx, spec, config):
+    logger.normal(' - Збір даних про регіони з ses.lviv.ua ..')
+
+    # extract text content of each data node
+    paragraphs = [p.text_content() for p in _ses_lviv_report(ctx, spec)]
+
+    for ptext in paragraphs:
+        if not ptext:
+            # no text in the paragraph
+            continue
+
+        # look for the first region name in the paragraph text
+        reg_name = spec.names.search(ptext)
+        if not reg_name:
+            continue
+
+        try:
+            local_sick = int(ptext.split('/')[0].replace('–', ' ').replace('-', ' ').split()[-1])
+            config['Regions'][reg_name] += local_sick
+        except ValueError:
+            # there may be incorrect web page formatting that will cause value error,
+            # the region keeps the previous value and validation compares the sums
+            logger.debug('Не вдалось розібрати дані регіону %s: "%s"', reg_name, ptext.strip()[:80])
+
+    return config
+
+
+@source_parser('isr_regions')
+def _parse_isr_regions(ctx, spec, config):
+    # data from regions of Israel is not public, so it is distributed
+    # proportionally to the population of districts
+    logger.normal(' - Збір даних про регіони з news.google.com ..')
+    config['Regions'] = {k: int(v * config['Sick'] / 100.0) for k, v in spec.data['population_share'].items()}
+
+    # update Palestine separately
+    page = ctx._web_request(spec.urls['palestine'])
+
+    palestine = ctx._html_get_node(page, spec.xpath['google_rows'], nid=1)
+    sick = spec.xpath['cells'](palestine)[0].text.strip().replace('\xa0', '')
+    config['Regions']['Палестина'] = int(sick)
+
+    return config
+
+
+@source_parser('pol_regions')
+def _parse_pol_regions(ctx, spec, config):
+    logger.normal(' - Збір даних про регіони з www.gov.pl ..')
+    page = ctx._web_request(spec.urls['regions'])
+
+    # get regions. skip first two general nodes
+    regs_data = json.loads(ctx._html_get_node(page, spec.xpath['register'])[0].text)['data']
+    regions = [row.split(';') for row in regs_data.split('\n') if len(row.split(';')) > 1][2:]
+    for region in regions:
+        reg = region[0]
+        reg_name = spec.names.get(reg, reg)
+
+        sick = int(region[1].replace(' ', ''))
+        config['Regions'][reg_name] = int(sick) if sick != '—' else 0
+
+    return config
+
+
+@source_parser('rus_total')
+def _parse_rus_total(ctx, spec, config):
+    # https://covid.ourworldindata.org/data/owid-covid-data.json
+    logger.normal(' - Збір загальних даних з covid19.rosminzdrav.ru ..')
+    data, = ctx._web_json(spec.urls['mapdata'], ('Items',))
+
+    config['Sick'] = sum([it['Confirmed'] for it in data])
+    config['Recovered'] = sum([it['Recovered'] for it in data])
+    config['Dead'] = sum([it['Deaths'] for it in data])
+
+    return config
+
+
+@source_parser('rus_regions')
+def _parse_rus_regions(ctx, spec, config):
+    logger.normal(' - Збір даних про регіони з covid19.rosminzdrav.ru ..')
+    data, = ctx._web_json(spec.urls['mapdata'], ('Items',))
+
+    # occupied regions
+    occupied_regions = spec.data['occupied']
+
+    for reg_data in data:
+        reg = reg_data['LocationName']
+
+        if reg in occupied_regions:
+            # occupied regions are contributed to their country
+            country, region = occupied_regions[reg]
+            ctx.merge.add(spec.code, country, region, reg_data['Confirmed'])
+            continue
+
+        # check if region name is valid
+        reg_name = spec.names.get(reg)
+        if not reg_name:
+            continue
+
+        config['Regions'][reg_name] = reg_data['Confirmed']
+
+    return config
+
+
+@source_parser('hug_total')
+def _parse_hug_total(ctx, spec, config):
+    logger.normal(' - Збір загальних даних з koronavirus.gov.hu ..')
+    page = ctx._web_request(spec.urls['total'])
+
+    def counter(xpath):
+        return int(ctx._html_get_node(page, xpath)[0].text.replace(' ', ''))
+
+    config['Recovered'] = sum([counter(xpath) for xpath in spec.xpath['recovered']])
+    config['Sick'] = sum([counter(xpath) for xpath in spec.xpath['sick']]) + config['Recovered']
+    config['Dead'] = sum([counter(xpath) for xpath in spec.xpath['dead']])
+    config['Tested'] = counter(spec.xpath['tested'])
+
+    return config
+
+
+@source_parser('rom_total')
+def _parse_rom_total(ctx, spec, config):
+    logger.normal(' - Збір загальних даних з mae.ro ..')
+
+    # get intial page to find out final link with tested persond data
+    page = ctx._web_request(spec.urls['bulletins'], headers=dict(spec.headers))
+    links = ctx._html_get_node(page, spec.xpath['links'])
+
+    # go through all available paragraphs and look for the link
+    target_link = ''
+    for link in links:
+        if spec.data['link_title'] in link.text:
+            target_link = link.attrib['href']
+            break
+
+    if target_link:
+        logger.debug('Цільове посилання: {} ..'.format(target_link))
+        # get the page with tested persons quanity
+        page = ctx._web_request(target_link, headers=dict(spec.headers))
+        paragraphs = ctx._html_get_node(page, spec.xpath['paragraphs'])
+        for p in paragraphs:
+            if p.text and spec.data['tested_marker'] in p.text.strip():
+                config['Tested'] = int(p.text.split()[10].replace('.', ''))
+                break
+
+    # get other data
+    data, = ctx._web_json(spec.urls['latest'], ('currentDayStats',))
+
+    config['Sick'] = data['numberInfected']
+    config['Recovered'] = data['numberCured']
+    config['Dead'] = data['numberDeceased']
+
+    return config
+
+
+@source_parser('rom_regions')
+def _parse_rom_regions(ctx, spec, config):
+    logger.normal(' - Збір даних про регіони з datelazi.ro ..')
+    data = ctx._web_json(spec.urls['latest'], ('currentDayStats',))[0]['countyInfectionsNumbers']
+
+    for region in data:
+        if region == spec.data['unknown_region']:
+            # unproceeded persons will be equally divided between regions
+            unknown = data[region]
+            logger.debug('Невідомий регіон у %d осіб' % unknown)
+
+            # common shared number
+            common = int(data[region] / len(config['Regions']))
+
+            for r in config['Regions']:
+                if unknown == 0:
+                    break
+
+                config['Regions'][r] += common + (1 if unknown > 0 else 0)
+                unknown -= 1
+
+            continue
+
+        reg_name = spec.names.get(region)
+        if not reg_name:
+            continue
+
+        config['Regions'][reg_name] = data[region]
+
+    return config
 
 
 def help():
@@ -1730,6 +3427,42 @@ def help():
            '  To update a web page, run tool with \'-w\' option:\n' + \
            '      ./icovid.py [-w|--web_update]\n' + \
            '\n' + \
+           '  To create a page per country and upload only changed files, add \'-m\'\n' + \
+           '  option to the web update:\n' + \
+           '      ./icovid.py [-w|--web_update] [-m|--multipage]\n' + \
+           '\n' + \
+           '  To print data of the latest update without any network requests, run tool\n' + \
+           '  with \'-c\' option:\n' + \
+           '      ./icovid.py [-c|--cached]\n' + \
+           '\n' + \
+           '  To export the DB series to CSV, JSON lines or Parquet (needs pyarrow) file,\n' + \
+           '  run tool with \'-e\' option. Dates (YYYY-MM-DD) and countries are optional:\n' + \
+           '      ./icovid.py [-e|--export] data.csv [--since DATE] [--until DATE] [--country NAME]\n' + \
+           '\n' + \
+           '  To serve the DB over HTTP (/countries, /country/<code>/history?from=&to=,\n' + \
+           '  /country/<code>/regions), run tool with \'--http\' option. In server mode the\n' + \
+           '  service is refreshed after every update:\n' + \
+           '      ./icovid.py --http PORT [-s|--server]\n' + \
+           '\n' + \
+           '  To run without any questions (e.g. on restart by the service manager), add\n' + \
+           '  \'-n\' option. FTP and SMTP credentials are taken from ICOVID_FTP_LOGIN,\n' + \
+           '  ICOVID_FTP_PASSWORD, ICOVID_SMTP_LOGIN, ICOVID_SMTP_PASSWORD variables, the\n' + \
+           '  credentials file (chmod 600) or the system keyring:\n' + \
+           '      ./icovid.py [-n|--non_interactive] [--credentials PATH] [-s|--server]\n' + \
+           '\n' + \
+           '  To parse sources and render the page in N worker processes, add \'-j\' option.\n' + \
+           '  Scaling of the workers may be measured on synthetic data:\n' + \
+           '      ./icovid.py [-j|--jobs] N [--chunksize K]\n' + \
+           '      ./icovid.py --parallel_bench\n' + \
+           '\n' + \
+           '  To write logs to the rotating file (optionally as JSON lines), add \'--log\'\n' + \
+           '  option. In server mode messages are written by the background thread:\n' + \
+           '      ./icovid.py [-s|--server] --log PATH [--log_json]\n' + \
+           '\n' + \
+           '  To profile a single update cycle, run tool with \'-p\' option. Reports are\n' + \
+           '  stored next to the DB (*.pstats, *.folded for flamegraphs, *.memory):\n' + \
+           '      ./icovid.py [-p|--profile] [-w|--web_update]\n' + \
+           '\n' + \
            '  To get help, run tool with \'-h\' option:\n' + \
            '      ./icovid.py [-h|--help]\n' + \
            '\n'
@@ -1743,15 +3476,307 @@ def help():
     print(text)
 
 
+def show_cached():
+    ''' Print summary of the latest update without DB loading
+
+    :return: TRUE if summary exists, FALSE otherwise
+    '''
+    base = iCovidBase()
+
+    last_date = base.summary.get_last_date()
+    if not last_date:
+        logger.error('Зведені дані відсутні. Запустіть оновлення')
+        return False
+
+    print(base.summary.render(last_date, base.translate, base.metrics))
+    return True
+
+
+def profile(web_update=False, top=25):
+    ''' Run single update cycle under profilers
+
+    CPU time is collected with cProfile and a stack sampler, memory with
+    tracemalloc snapshots around DB load/save and HTML rendering. Reports
+    are stored next to the DB file.
+
+    :param web_update: publish generated web-page as well
+    :param top: number of entries in the text reports
+    '''
+    import cProfile
+    import pstats
+    import io
+
+    # wrap stages of interest with memory snapshots
+    memory = MemTracker()
+    stages = [(dbWorker, '_upload'), (dbWorker, 'save'), (iCovid, '_html_report')]
+    originals = [(cls, name, getattr(cls, name)) for cls, name in stages]
+    for cls, name, func in originals:
+        setattr(cls, name, memory.track('%s.%s' % (cls.__name__, name), func))
+
+    cpu = cProfile.Profile()
+    sampler = StackSampler()
+
+    logger.normal('Запуск профілювання циклу оновлення ..')
+    memory.start()
+    sampler.start()
+    cpu.enable()
+
+    try:
+        covid = iCovid()
+
+        # profilers watch the current thread, so sources are parsed in it
+        covid.update(workers=1)
+        covid._html_report()
+
+        if web_update:
+            covid._webpage_publish('covidinfo.zzz.com.ua')
+
+        covid.db.save()
+
+    finally:
+        cpu.disable()
+        sampler.stop()
+
+        for cls, name, func in originals:
+            setattr(cls, name, func)
+
+    # store reports next to the DB
+    base = covid.db._path
+
+    cpu.dump_stats(base + '.pstats')
+    samples = sampler.dump(base + '.folded')
+
+    with open(base + '.memory', 'w+') as fp:
+        fp.write(memory.report(top))
+    memory.stop()
+
+    stream = io.StringIO()
+    pstats.Stats(cpu, stream=stream).sort_stats('cumulative').print_stats(top)
+    logger.print(stream.getvalue(), end='\n')
+
+    logger.success('Профіль CPU збережено у "%s.pstats"' % base)
+    logger.success('Стеки (%d зразків) збережено у "%s.folded"' % (samples, base))
+    logger.success('Звіт про виділення пам\'яті збережено у "%s.memory"' % base)
+
+
+def export(target, since=None, until=None, countries=None):
+    ''' Export DB series to the file without DB loading
+
+    :param target: path to the target file (*.csv, *.jsonl, *.parquet)
+    :param since: first date to export (date object)
+    :param until: last date to export (date object)
+    :param countries: names or codes of countries to export
+    :return: TRUE if exported, FALSE otherwise
+    '''
+    stats = exportWorker(dbWorker('icovid.db', lazy=True)).export(
+        target, since=since, until=until, countries=countries)
+    if not stats:
+        return False
+
+    logger.success('Експортовано {} рядків у "{}"'.format(stats['rows'], target))
+    return True
+
+
+def export_benchmark(scales=(1, 4, 16), path='icovid.db'):
+    ''' Measure export throughput on histories of different length
+
+    Synthetic DBs repeat the real history shifted in time. Throughput is
+    measured without tracing, memory peak is measured in a separate pass
+    and should not grow with the history length.
+
+    :param scales: number of history copies in the synthetic DBs
+    :param path: path to the source DB
+    '''
+    import tracemalloc
+    import tempfile
+
+    # count source dates and their span without DB loading
+    source = dbWorker(path, lazy=True)
+    days = [datetime.strptime(day, '%d %b %Y') for day, _ in source.iter_dates()]
+    if not days:
+        return
+
+    shift = max(days) - min(days) + timedelta(days=1)
+    formats = dict(exportWorker.formats)
+    report = '   {:>5} | {:<7} | {:>9} | {:>10} | {:>8} | {:>10}\n'
+    text = report.format('scale', 'format', 'rows', 'rows/s', 'MB/s', 'peak, KB')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in scales:
+            # write synthetic DB entry by entry
+            db_path = os.path.join(tmp, 'bench.db')
+            with open(db_path, 'w') as fp:
+                fp.write('{')
+                for copy in range(scale):
+                    for index, (day, data) in enumerate(source.iter_dates()):
+                        key = (datetime.strptime(day, '%d %b %Y') + shift * copy).strftime('%d %b %Y')
+                        fp.write('%s%s: %s' % (', ' if copy or index else '', json.dumps(key),
+                                               json.dumps(data, ensure_ascii=False)))
+                fp.write('}')
+
+            worker = exportWorker(dbWorker(db_path, lazy=True))
+            for ext, fmt in list(formats.items()):
+                target = os.path.join(tmp, 'bench' + ext)
+                stats = worker.export(target)
+                if not stats:
+                    # format is not available, do not retry it
+                    del formats[ext]
+                    continue
+
+                tracemalloc.start()
+                worker.export(target)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+                text += report.format(scale, fmt, stats['rows'], int(stats['rows'] / stats['time']),
+                                      '%.1f' % (stats['bytes'] / stats['time'] / 2**20), peak // 1024)
+
+    logger.print(text, end='\n')
+
+
+def serve(port):
+    ''' Serve DB over HTTP without updates
+
+    :param port: port to listen
+    '''
+    service = queryService(iCovidBase(), port=port)
+    service.refresh()
+    if not service.start():
+        exit(1)
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        service.stop()
+
+
+def _synthetic_sources(path, countries, regions, seed=1):
+    ''' Create synthetic countries parsed from recorded Google-like pages
+
+    :param path: directory to store JSON specs in
+    :param countries: number of synthetic countries
+    :param regions: number of regions per country
+    :param seed: seed of the random data
+    :return: tuple of recorded pages by URL and list of tab arguments
+             (config, summary row, SVG paths, checked)
+    '''
+    rng = random.Random(seed)
+    row_tmpl = '<tr><th><div><div>{}</div><div>{}</div></div></th><td>{}</td><td>0</td></tr>'
+
+    pages = {}
+    tabs = []
+    for index in range(countries):
+        code = 'b%02d' % index
+        names = ['Регіон %d-%d' % (index, reg) for reg in range(regions)]
+        spec = {'parsers': ['google_regions'],
+                'config': {'Name': 'Країна %d' % index, 'Code': code, 'ViewBoxSz': '0 0 640 410',
+                           'ViewBoxLineSz': 0.7, 'Population': 10 ** 7, 'Area': 10 ** 5, 'Tested': 0,
+                           'Sick': 0, 'Recovered': 0, 'Dead': 0, 'Peak': 10 ** 5, 'Description': '',
+                           'Cure': 0, 'Regions': {}},
+                'regions': names, 'mapping': {},
+                'urls': {'regions': 'bench://%s' % code},
+                'xpath': {'google_rows': './/tbody[@class="ppcUXd"]//tr', 'google_name': './/th//div//div',
+                          'cells': './/td'}}
+        with open(os.path.join(path, code + '.json'), 'w') as fp:
+            json.dump(spec, fp, ensure_ascii=False)
+
+        rows = [row_tmpl.format(name, name, '{:,}'.format(rng.randrange(10 ** 5)).replace(',', '\xa0'))
+                for name in names]
+        pages[spec['urls']['regions']] = '<html><body><table><tbody class="ppcUXd">%s</tbody></table></body></html>' % \
+                                          ''.join(['<tr></tr>', '<tr></tr>'] + rows)
+
+        paths = {name: ' '.join('l%d,%d' % (rng.randrange(-50, 50), rng.randrange(-50, 50)) for _ in range(300))
+                 for name in names}
+        s_data = {'Regions': [[name, rng.randrange(10 ** 5), rng.randrange(100)] for name in names]}
+        tabs.append((spec['config'], s_data, paths, ''))
+
+    return pages, tabs
+
+
+def parallel_benchmark(countries=36, regions=150, jobs=None, chunksize=1):
+    ''' Measure scaling of parsing and rendering with worker processes
+
+    Synthetic countries are parsed from recorded Google-like pages of
+    regions and their tabs are rendered with SVG paths of every region.
+    Time of process startup is not measured, workers log warnings only.
+
+    :param countries: number of synthetic countries
+    :param regions: number of regions per country
+    :param jobs: list of process counts, powers of two up to CPUs if empty
+    :param chunksize: number of tabs sent to the worker at once
+    '''
+    import multiprocessing
+    import tempfile
+    from concurrent.futures import ProcessPoolExecutor, wait
+
+    cpus = os.cpu_count() or 1
+    jobs = jobs or sorted({1, cpus} | {2 ** i for i in range(cpus.bit_length()) if 2 ** i <= cpus})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # specs and pages of synthetic countries
+        pages, tabs = _synthetic_sources(tmp, countries, regions)
+
+        report = '   {:>9} | {:>10} | {:>7} | {:>10} | {:>7}\n'
+        text = report.format('processes', 'parse, s', 'speedup', 'render, s', 'speedup')
+        base = None
+
+        for count in jobs:
+            with ProcessPoolExecutor(count, mp_context=multiprocessing.get_context('spawn'), initializer=_worker_init,
+                                     initargs=(tmp, min(logger.get_lvl(), LogLevel.WARNING), True, pages)) as pool:
+                # start all the processes before measurement
+                wait([pool.submit(time.sleep, 0.2) for _ in range(count)])
+
+                start = time.perf_counter()
+                configs = list(pool.map(_worker_parse, ['b%02d' % i for i in range(countries)]))
+                parse = time.perf_counter() - start
+
+                start = time.perf_counter()
+                nodes = list(pool.map(_render_tab, *zip(*tabs), chunksize=chunksize))
+                render = time.perf_counter() - start
+
+            if len(configs) != countries or len(nodes) != countries:
+                logger.error('Синтетичні дані оброблено не повністю')
+                return
+
+            base = base or (parse, render)
+            text += report.format(count, '%.3f' % parse, '%.2f' % (base[0] / parse),
+                                  '%.3f' % render, '%.2f' % (base[1] / render))
+
+    logger.print(text, end='\n')
+
+
 def main():
     parser = argparse.ArgumentParser(add_help=False)
     parser.add_argument('-w', '--web_update',  action='store_true')
+    parser.add_argument('-m', '--multipage', action='store_true')
     parser.add_argument('-s', '--server', action='store_true')
     parser.add_argument('-d', '--debug', action='store_true')
+    parser.add_argument('-p', '--profile', action='store_true')
+    parser.add_argument('-c', '--cached', action='store_true')
+    parser.add_argument('-e', '--export', metavar='PATH')
+    parser.add_argument('--since', type=date.fromisoformat)
+    parser.add_argument('--until', type=date.fromisoformat)
+    parser.add_argument('--country', action='append')
+    parser.add_argument('--export_bench', action='store_true')
+    parser.add_argument('--http', type=int, metavar='PORT')
+    parser.add_argument('-j', '--jobs', type=int, metavar='N')
+    parser.add_argument('--chunksize', type=int, default=1)
+    parser.add_argument('--parallel_bench', action='store_true')
+    parser.add_argument('--log', metavar='PATH')
+    parser.add_argument('--log_json', action='store_true')
+    parser.add_argument('-n', '--non_interactive', action='store_true')
+    parser.add_argument('--credentials', metavar='PATH', default='icovid.credentials')
     parser.add_argument('-h', '--help', action='store_true')
 
     args = parser.parse_args()
 
+    if args.multipage and not args.web_update:
+        parser.error('Multipage mode is allowed with web update only.')
+
+    if args.log or args.log_json or args.server:
+        # long-running modes must not be blocked by the console output
+        logger.configure(args.log, json_lines=args.log_json)
 
     if args.help:
         if args.debug or args.web_update:
@@ -1759,53 +3784,152 @@ def main():
 
         help()
 
-    else:
+    elif args.cached:
+        if args.server or args.web_update or args.profile:
+            parser.error('You are not allowed to use cached view with other options.')
+
+        if not show_cached():
+            exit(1)
+
+    elif args.export or args.export_bench:
+        if args.server or args.web_update or args.profile:
+            parser.error('You are not allowed to export data with other options.')
+
         logger.set_lvl(LogLevel.DEBUG if args.debug else LogLevel.NORMAL)
-        logger.userless_mode(args.server)
+        if args.export_bench:
+            export_benchmark()
+        elif not export(args.export, args.since, args.until, args.country):
+            exit(1)
 
-        # initialize iCovid object
-        covid = iCovid(args.server)
+    elif args.parallel_bench:
+        logger.set_lvl(LogLevel.DEBUG if args.debug else LogLevel.NORMAL)
+        parallel_benchmark(jobs=[args.jobs] if args.jobs else None, chunksize=args.chunksize)
 
-        while True:
-            try:
-                # update database and print it to the CLI
-                covid.update()
-                print(covid)
+    elif args.http and not args.server:
+        if args.web_update or args.profile:
+            parser.error('You are not allowed to run read-only service with other options.')
+
+        logger.set_lvl(LogLevel.DEBUG if args.debug else LogLevel.NORMAL)
+        serve(args.http)
 
-                if args.web_update:
-                    # run webpage update
-                    covid.webpage_update('covidinfo.zzz.com.ua')
+    elif args.profile:
+        if args.server:
+            parser.error('You are not allowed to profile in server mode.')
 
-                logger.success('Дані оновлено')
+        logger.set_lvl(LogLevel.DEBUG if args.debug else LogLevel.NORMAL)
+        profile(args.web_update)
 
-            except Exception as e:
-                # oops... something unexpectedly failed
-                error_msg = 'При оновленні даних веб-сторінки щось пішло не так'
-                logger.error(error_msg)
+    else:
+        logger.set_lvl(LogLevel.DEBUG if args.debug else LogLevel.NORMAL)
+        logger.userless_mode(args.server or args.non_interactive)
 
-                tb_error = traceback.format_exc().split('\n')
-                tb_error = tb_error[-1:] + tb_error[:-1]
-                covid.add_error(error_msg, '\n'.join(tb_error))
+        # termination exits normally, so pending saves are flushed
+        signal.signal(signal.SIGTERM, lambda signum, frame: exit(0))
 
-            # prepare email if there are any errors
-            content = covid.prepare_error_report()
+        # initialize iCovid object
+        covid = iCovid(args.server, not args.non_interactive, args.credentials)
+        if args.jobs:
+            covid.start_workers(args.jobs, args.chunksize)
+
+        service = None
+        if args.http:
+            # serve data of the previous runs until the first update
+            service = queryService(covid, port=args.http)
+            service.refresh()
+            if not service.start():
+                exit(1)
 
-            if content:
-                # send an email
-                email = Email('sviytiv@gmail.com', '⛔️ Звіт про помилки оновлення даних', content)
-                covid.smtp_send([email])
-                logger.normal('Звіт про помилки надіслано')
+        # only the leader updates data, other instances are read-only
+        lease = LeaderLease('icovid.lease', logger)
+        leader = None
 
-            if not args.server:
-                # exit if user not enabled server mode
-                break
+        try:
+            while True:
+                if not lease.acquire():
+                    if leader is not False:
+                        logger.normal('Дані оновлює інший екземпляр (PID {}), режим лише читання'.format(
+                                      (lease.holder() or {}).get('pid', '?')))
+                    if leader:
+                        # lease was lost, data in memory is older than files of the new leader
+                        covid.open_storage()
+                    leader = False
+
+                    if not args.server:
+                        # show data of the leader
+                        show_cached()
+                        break
 
-            else:
-                # print delay till next request
-                logger.normal('Наступний запит буде о {:%H:%M:%S}'.format(datetime.now() + timedelta(hours=1)))
-                # sleep an hour before the next request
-                time.sleep(3600)
+                    if service:
+                        # leader stores snapshot on every save
+                        service.refresh()
+
+                    time.sleep(lease.ttl / 2)
+                    continue
+
+                if leader is False:
+                    # files were changed by the previous leader
+                    covid.open_storage()
+                leader = True
+
+                try:
+                    # update database and print it to the CLI
+                    updated = covid.update()
+                    print(covid)
+
+                    if service:
+                        # drop answers cached before the update
+                        service.refresh()
+
+                    blocker = covid.quality.publish_blocker(updated)
+                    if args.web_update and blocker:
+                        logger.warning('Веб-сторінку не оновлено, %s' % blocker)
+
+                    elif args.web_update and lease.is_held():
+                        # run webpage update
+                        covid.webpage_update('covidinfo.zzz.com.ua', args.multipage)
+
+                    logger.success('Дані оновлено')
+                    covid.upd_errors.resolve('main')
+
+                except updateError as e:
+                    # user refused to continue
+                    logger.critical(str(e))
+                    exit(1)
+
+                except Exception as e:
+                    # oops... something unexpectedly failed
+                    error_msg = 'При оновленні даних веб-сторінки щось пішло не так'
+                    logger.error(error_msg)
+
+                    tb_error = traceback.format_exc().split('\n')
+                    tb_error = tb_error[-1:] + tb_error[:-1]
+                    covid.add_error(error_msg, '\n'.join(tb_error))
+
+                # prepare email if there are any errors
+                content = covid.prepare_error_report()
+
+                if content:
+                    # send an email
+                    email = Email('sviytiv@gmail.com', '⛔️ Звіт про помилки оновлення даних', content)
+                    covid.smtp_send([email])
+                    logger.normal('Звіт про помилки додано до черги надсилання')
+
+                if not args.server:
+                    # exit if user not enabled server mode, undelivered emails
+                    # will be sent on the next run
+                    covid.mail.close()
+                    break
+
+                else:
+                    # sleep till the next source is due to refresh
+                    next_due = covid.sources.next_due()
+                    logger.normal('Наступний запит буде о {:%H:%M:%S}'.format(datetime.fromtimestamp(next_due)))
+                    time.sleep(max(next_due - time.time(), 60))
 
+        finally:
+            # data must be saved before the other instance takes the lead
+            saver.flush()
+            lease.release()
 
 if __name__ == '__main__':
     main()
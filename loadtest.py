@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+
+# metadata
+__title__ = 'iCovid HTTP Load Test'
+__version__ = '1.0.0'
+
+# modules
+import argparse
+import asyncio
+import random
+import json
+import time
+
+from utils import LogLevel, Logger
+
+
+# global logger object
+logger = Logger(LogLevel.NORMAL)
+
+
+async def request(reader, writer, host, target):
+    ''' Send GET request over the keep-alive connection
+
+    :param reader: stream reader of the connection
+    :param writer: stream writer of the connection
+    :param host: value of the Host header
+    :param target: path with query string
+    :return: tuple (HTTP status, body in bytes)
+    '''
+    writer.write('GET {} HTTP/1.1\r\nHost: {}\r\n\r\n'.format(target, host).encode())
+    await writer.drain()
+
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+    status = int(head[0].split(' ')[1])
+    length = next(int(l.split(':')[1]) for l in head if l.lower().startswith('content-length:'))
+
+    return status, await reader.readexactly(length)
+
+
+async def client(host, port, targets, deadline, stats):
+    ''' Send requests in a loop till the deadline
+
+    :param host: address of the service
+    :param port: port of the service
+    :param targets: list of paths to request
+    :param deadline: loop time to stop at
+    :param stats: dict for latencies and errors
+    '''
+    loop = asyncio.get_running_loop()
+    reader, writer = await asyncio.open_connection(host, port)
+
+    try:
+        while loop.time() < deadline:
+            target = random.choice(targets)
+            start = loop.time()
+            status, _ = await request(reader, writer, host, target)
+
+            stats['latency'].append(loop.time() - start)
+            if status != 200:
+                stats['errors'] += 1
+
+    finally:
+        writer.close()
+
+
+async def run(host, port, connections, duration):
+    ''' Run load test
+
+    :param host: address of the service
+    :param port: port of the service
+    :param connections: number of simultaneous connections
+    :param duration: test duration in seconds
+    :return: dict with latencies, errors and duration
+    '''
+    # requests are built for the countries known to the service
+    reader, writer = await asyncio.open_connection(host, port)
+    _, body = await request(reader, writer, host, '/countries')
+    writer.close()
+
+    targets = ['/countries']
+    for country in json.loads(body):
+        code = country['code']
+        targets += ['/country/%s/history' % code, '/country/%s/history?from=2021-01-01' % code,
+                    '/country/%s/history?from=2020-06-01&to=2020-09-01' % code, '/country/%s/regions' % code]
+
+    stats = {'latency': [], 'errors': 0, 'targets': len(targets)}
+
+    start = time.perf_counter()
+    deadline = asyncio.get_running_loop().time() + duration
+    await asyncio.gather(*[client(host, port, targets, deadline, stats) for _ in range(connections)])
+    stats['duration'] = time.perf_counter() - start
+
+    return stats
+
+
+def report(stats):
+    ''' Print results of the load test
+
+    :param stats: dict with latencies, errors and duration
+    '''
+    latency = sorted(stats['latency'])
+    if not latency:
+        logger.error('Жодного запиту не виконано')
+        return
+
+    def percentile(value):
+        return latency[min(len(latency) - 1, int(len(latency) * value))] * 1000
+
+    text = '   {:.<30} {}\n'.format('Ресурсів', stats['targets'])
+    text += '   {:.<30} {}\n'.format('Запитів', len(latency))
+    text += '   {:.<30} {}\n'.format('Помилок', stats['errors'])
+    text += '   {:.<30} {:.0f}\n'.format('Запитів за секунду', len(latency) / stats['duration'])
+    text += '   {:.<30} {:.2f} / {:.2f} / {:.2f}\n'.format('Затримка p50/p90/p99, мс', percentile(0.5),
+                                                          percentile(0.9), percentile(0.99))
+    logger.print(text, end='\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test of iCovid HTTP service')
+    parser.add_argument('--host', default='127.0.0.1', help='address of the service')
+    parser.add_argument('--port', type=int, default=8020, help='port of the service')
+    parser.add_argument('-c', '--connections', type=int, default=16, help='number of simultaneous connections')
+    parser.add_argument('-t', '--duration', type=float, default=10, help='test duration in seconds')
+
+    args = parser.parse_args()
+
+    try:
+        stats = asyncio.run(run(args.host, args.port, args.connections, args.duration))
+    except OSError as e:
+        logger.error('HTTP сервіс недоступний: %s' % e)
+        exit(1)
+
+    report(stats)
+
+
+if __name__ == '__main__':
+    main()
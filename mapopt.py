@@ -0,0 +1,486 @@
+#!/usr/bin/python3
+
+# metadata
+__title__ = 'iCovid Map Optimizer'
+__version__ = '1.0.0'
+
+# modules
+import argparse
+import shutil
+import math
+import json
+import time
+import os
+import re
+
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from utils import LogLevel, Logger
+
+
+# global logger object
+logger = Logger(LogLevel.NORMAL)
+
+# tokens of SVG path data
+_token = re.compile(r'[MmLlHhVvCcZz]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+# number of arguments of supported commands
+_args = {'M': 2, 'L': 2, 'H': 1, 'V': 1, 'C': 6, 'Z': 0}
+
+
+class pathGeometry:
+    ''' Geometry of SVG path in integer grid coordinates
+
+    Path is a list of subpaths, every subpath is a dict with start point,
+    list of segments and closing flag. Segment is ('L', point) for lines
+    and ('C', point, point, point) for cubic curves.
+    '''
+
+    def __init__(self, data, step):
+        ''' Parse path data
+
+        :param data: value of SVG "d" attribute
+        :param step: size of grid cell coordinates are quantized to
+        '''
+        self.step = step
+        self.subpaths = []
+        self._parse(data)
+
+    def _grid(self, x, y):
+        return (round(x / self.step), round(y / self.step))
+
+    def _parse(self, data):
+        tokens = _token.findall(data)
+        if ''.join(tokens).replace(' ', '') != re.sub(r'[\s,]', '', data):
+            raise ValueError('Непідтримувані дані шляху')
+
+        x = y = 0.0
+        sub = None
+        cmd = None
+        i = 0
+
+        while i < len(tokens):
+            if tokens[i].isalpha():
+                cmd = tokens[i]
+                i += 1
+            elif cmd is None:
+                raise ValueError('Шлях не починається з команди')
+
+            kind = cmd.upper()
+            rel = cmd.islower()
+            args = [float(t) for t in tokens[i:i + _args[kind]]]
+            i += _args[kind]
+
+            if len(args) != _args[kind]:
+                raise ValueError('Недостатньо аргументів команди "%s"' % cmd)
+
+            if kind == 'Z':
+                if sub is not None:
+                    sub['closed'] = True
+                    x, y = sub['origin']
+                cmd = None
+                continue
+
+            if kind == 'M':
+                x, y = (x + args[0], y + args[1]) if rel else args
+                sub = {'start': self._grid(x, y), 'origin': (x, y), 'segments': [], 'closed': False}
+                self.subpaths.append(sub)
+
+                # implicit commands after moveto are linetos
+                cmd = 'l' if rel else 'L'
+                continue
+
+            if sub is None:
+                raise ValueError('Шлях не починається з команди переміщення')
+
+            if kind == 'L':
+                x, y = (x + args[0], y + args[1]) if rel else args
+            elif kind == 'H':
+                x = x + args[0] if rel else args[0]
+            elif kind == 'V':
+                y = y + args[0] if rel else args[0]
+            else:
+                pts = [(x + args[k], y + args[k + 1]) if rel else (args[k], args[k + 1]) for k in (0, 2, 4)]
+                x, y = pts[2]
+                sub['segments'].append(('C',) + tuple(self._grid(*p) for p in pts))
+                continue
+
+            sub['segments'].append(('L', self._grid(x, y)))
+
+        for sub in self.subpaths:
+            del sub['origin']
+
+    def dedupe(self):
+        ''' Remove repeated vertices
+
+        :return: number of removed vertices
+        '''
+        removed = 0
+
+        for sub in self.subpaths:
+            segments = []
+            last = sub['start']
+
+            for seg in sub['segments']:
+                if seg[0] == 'L' and seg[1] == last:
+                    removed += 1
+                    continue
+                segments.append(seg)
+                last = seg[-1]
+
+            # line back to the start is drawn by closing command
+            if sub['closed'] and segments and segments[-1] == ('L', sub['start']):
+                segments.pop()
+                removed += 1
+
+            sub['segments'] = segments
+
+        return removed
+
+    def vertices(self):
+        ''' Iterate through all the vertices of the path '''
+        for sub in self.subpaths:
+            yield sub['start']
+            for seg in sub['segments']:
+                yield seg[-1]
+
+    def area(self):
+        ''' Area of the path polygon, control points of curves are ignored '''
+        total = 0
+        for sub in self.subpaths:
+            ring = [sub['start']] + [seg[-1] for seg in sub['segments']]
+            total += abs(sum(a[0] * b[1] - b[0] * a[1] for a, b in zip(ring, ring[1:] + ring[:1]))) / 2
+
+        return total * self.step * self.step
+
+    def serialize(self):
+        ''' Write path data with relative commands
+
+        :return: value of SVG "d" attribute
+        '''
+        def num(value):
+            text = ('%.6f' % (value * self.step)).rstrip('0').rstrip('.')
+            text = text.replace('0.', '.', 1) if text.startswith(('0.', '-0.')) else text
+            return '0' if text in ('', '-0', '-') else text
+
+        def pair(dx, dy):
+            y = num(dy)
+            return num(dx) + ('' if y.startswith('-') else ',') + y
+
+        out = []
+        cur = (0, 0)
+
+        for n, sub in enumerate(self.subpaths):
+            sx, sy = sub['start']
+            out.append(('M%s,%s' % (num(sx), num(sy))) if n == 0 else ('m' + pair(sx - cur[0], sy - cur[1])))
+            cur = sub['start']
+            prev = None
+
+            for seg in sub['segments']:
+                if seg[0] == 'C':
+                    out.append('c' + ' '.join(pair(p[0] - cur[0], p[1] - cur[1]) for p in seg[1:]))
+                    prev = None
+                else:
+                    dx, dy = seg[1][0] - cur[0], seg[1][1] - cur[1]
+                    if dy == 0:
+                        out.append('h' + num(dx))
+                        prev = None
+                    elif dx == 0:
+                        out.append('v' + num(dy))
+                        prev = None
+                    else:
+                        # repeated linetos do not need the command letter
+                        text = pair(dx, dy)
+                        out.append((' ' if prev == 'l' and not text.startswith('-') else '') + text
+                                   if prev == 'l' else 'l' + text)
+                        prev = 'l'
+
+                cur = seg[-1]
+
+            if sub['closed']:
+                out.append('z')
+                cur = sub['start']
+
+        return ''.join(out)
+
+
+def _simplify(points, tolerance):
+    ''' Douglas-Peucker simplification of the polyline
+
+    :param points: list of grid points, ends are kept
+    :param tolerance: max distance in grid cells
+    :return: simplified list of points
+    '''
+    if len(points) < 3:
+        return list(points)
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+
+    while stack:
+        first, last = stack.pop()
+        (ax, ay), (bx, by) = points[first], points[last]
+        dx, dy = bx - ax, by - ay
+        norm = math.hypot(dx, dy)
+
+        best, index = -1, None
+        for i in range(first + 1, last):
+            px, py = points[i]
+            if norm:
+                dist = abs(dy * (px - ax) - dx * (py - ay)) / norm
+            else:
+                dist = math.hypot(px - ax, py - ay)
+            if dist > best:
+                best, index = dist, i
+
+        if index is not None and best > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+    return [p for p, k in zip(points, keep) if k]
+
+
+def optimize_paths(paths, tolerance=0.0005, step=None):
+    ''' Optimize paths of regions of the single map
+
+    Vertices shared by regions split outlines into chains. Every chain is
+    simplified once in canonical direction, so neighbours keep identical
+    borders. Vertices where set of regions changes and ends of curves are
+    never removed.
+
+    :param paths: dict region -> SVG path data
+    :param tolerance: max deviation as a fraction of the map size
+    :param step: size of grid cell, chosen by tolerance if not specified
+    :return: dict region -> optimized path data, dict of statistics
+    '''
+    # size of the map used to scale tolerance
+    coords = [float(v) for data in paths.values() for v in re.findall(r'\d+\.?\d*', data)]
+    size = (max(coords) - min(coords)) if coords else 1
+    tolerance = tolerance * size
+
+    if step is None:
+        step = 10 ** math.floor(math.log10(tolerance)) if tolerance > 0 else 0.01
+
+    stats = {'regions': len(paths), 'before': sum(len(d) for d in paths.values()),
+             'duplicates': 0, 'vertices': 0, 'removed': 0, 'skipped': [], 'area': 0.0}
+
+    geometry = {}
+    for region, data in paths.items():
+        try:
+            geometry[region] = pathGeometry(data, step)
+        except (ValueError, KeyError) as e:
+            # keep unsupported path as is
+            stats['skipped'].append(region)
+            continue
+
+        stats['duplicates'] += geometry[region].dedupe()
+
+    # regions sharing every vertex
+    owners = {}
+    for region, geo in geometry.items():
+        for vertex in geo.vertices():
+            owners.setdefault(vertex, set()).add(region)
+
+    areas = {region: geo.area() for region, geo in geometry.items()}
+    chains = {}
+    grid_tolerance = tolerance / step
+
+    for region, geo in geometry.items():
+        for sub in geo.subpaths:
+            ring = [sub['start']] + [seg[-1] for seg in sub['segments']]
+            count = len(ring)
+            stats['vertices'] += count
+
+            # vertices which are not removed
+            anchors = {0}
+            for i, seg in enumerate(sub['segments'], 1):
+                if seg[0] == 'C':
+                    anchors.update((i - 1, i))
+            for i in range(count):
+                prev = ring[i - 1] if (i or sub['closed']) else None
+                succ = ring[(i + 1) % count] if (i < count - 1 or sub['closed']) else None
+                own = owners[ring[i]]
+                if len(own) > 2 or prev is None or succ is None or \
+                   owners[prev] != own or owners[succ] != own:
+                    anchors.add(i)
+
+            if count < 4:
+                continue
+
+            # simplify chains between anchors
+            order = sorted(anchors) + ([count] if sub['closed'] else [])
+            points = ring + [ring[0]]
+            removed = set()
+
+            for first, last in zip(order, order[1:]):
+                if last - first < 2:
+                    continue
+
+                chain = points[first:last + 1]
+                forward = chain[0] <= chain[-1] if chain[0] != chain[-1] else chain <= chain[::-1]
+                key = tuple(chain if forward else chain[::-1])
+
+                if key not in chains:
+                    chains[key] = set(_simplify(list(key), grid_tolerance))
+
+                kept = chains[key]
+                removed.update(i for i in range(first + 1, last) if points[i] not in kept)
+
+            # closed outlines keep at least a triangle
+            if sub['closed'] and count - len(removed) < 3:
+                continue
+
+            segments = []
+            for i, seg in enumerate(sub['segments'], 1):
+                if i not in removed:
+                    segments.append(seg)
+
+            stats['removed'] += len(removed)
+            sub['segments'] = segments
+
+    result = {}
+    for region, data in paths.items():
+        if region in geometry:
+            geo = geometry[region]
+            result[region] = geo.serialize()
+            if areas[region]:
+                stats['area'] = max(stats['area'], abs(geo.area() - areas[region]) / areas[region])
+        else:
+            result[region] = data
+
+    stats['after'] = sum(len(d) for d in result.values())
+    stats['step'] = step
+    return result, stats
+
+
+def _optimize_map(job):
+    ''' Process pool worker
+
+    :param job: tuple of name, dict region -> path data and tolerance
+    :return: tuple of name, optimized paths, statistics and duration
+    '''
+    name, paths, tolerance = job
+    start = time.time()
+    result, stats = optimize_paths(paths, tolerance)
+
+    return name, result, stats, time.time() - start
+
+
+def _svg_paths(content):
+    ''' Extract paths of SVG file, regions are identified by path position '''
+    return {str(i): m.group(2) for i, m in enumerate(re.finditer(r'(<path\b[^>]*?\sd=")([^"]*)(")', content))}
+
+
+def _svg_replace(content, paths):
+    ''' Put optimized paths back to SVG file '''
+    counter = iter(range(len(paths)))
+    return re.sub(r'(<path\b[^>]*?\sd=")([^"]*)(")',
+                  lambda m: m.group(1) + paths[str(next(counter))] + m.group(3), content)
+
+
+def optimize(source, target, svg_dir=None, svg_target=None, tolerance=0.0005, workers=None):
+    ''' Optimize regions map and SVG maps in the process pool
+
+    :param source: path to the regions map
+    :param target: path to the optimized regions map
+    :param svg_dir: directory with SVG maps, SVG maps are skipped if not specified
+    :param svg_target: directory for optimized SVG maps
+    :param tolerance: max deviation as a fraction of the map size
+    :param workers: number of processes, number of CPUs if not specified
+    :return: dict name -> statistics
+    '''
+    with open(source, 'r') as fp:
+        regions_map = json.load(fp)
+
+    jobs = [(country, paths, tolerance) for country, paths in regions_map.items()]
+
+    svgs = {}
+    if svg_dir:
+        for fname in sorted(os.listdir(svg_dir)):
+            if fname.endswith('.svg'):
+                with open(os.path.join(svg_dir, fname), 'r', encoding='utf-8-sig') as fp:
+                    svgs[fname] = fp.read()
+                jobs.append((fname, _svg_paths(svgs[fname]), tolerance))
+
+    workers = workers or os.cpu_count() or 1
+    results = {}
+
+    # number of maps in flight is bounded, so memory does not grow with maps
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        queue = iter(jobs)
+
+        for job in queue:
+            pending.add(pool.submit(_optimize_map, job))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                results.update((r[0], r[1:]) for r in (f.result() for f in done))
+
+        for future in pending:
+            result = future.result()
+            results[result[0]] = result[1:]
+
+    # keep backup of the regions map if it is overwritten
+    if os.path.abspath(source) == os.path.abspath(target):
+        shutil.copyfile(source, source + '.backup')
+
+    with open(target, 'w') as fp:
+        json.dump({country: results[country][0] for country in regions_map}, fp,
+                  ensure_ascii=False, indent=4)
+
+    for fname, content in svgs.items():
+        os.makedirs(svg_target, exist_ok=True)
+        with open(os.path.join(svg_target, fname), 'w', encoding='utf-8') as fp:
+            fp.write(_svg_replace(content, results[fname][0]))
+
+    return {name: (stats, duration) for name, (_, stats, duration) in results.items()}
+
+
+def report(stats):
+    ''' Print table of savings
+
+    :param stats: dict name -> (statistics, duration)
+    '''
+    row = '   {:<16} {:>9} {:>9} {:>7} {:>8} {:>8} {:>7} {:>7}'
+    logger.print(row.format('Карта', 'До, Б', 'Після, Б', 'Ощадн.', 'Вершин', 'Видалено', 'Площа', 'Час, с'), end='\n')
+
+    before = after = 0
+    for name, (st, duration) in stats.items():
+        before += st['before']
+        after += st['after']
+        logger.print(row.format(name[:16], st['before'], st['after'],
+                                '{:.1%}'.format(1 - st['after'] / st['before']) if st['before'] else '—',
+                                st['vertices'], st['duplicates'] + st['removed'],
+                                '{:.2%}'.format(st['area']), '{:.2f}'.format(duration)), end='\n')
+
+        if st['skipped']:
+            logger.warning('%s: шляхи без змін (%s)' % (name, ', '.join(st['skipped'])))
+
+    if before:
+        logger.print(row.format('Разом', before, after, '{:.1%}'.format(1 - after / before), '', '', '', ''), end='\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline optimization of iCovid maps')
+    parser.add_argument('-i', '--input', default='./report/regions.map', help='regions map')
+    parser.add_argument('-o', '--output', default=None, help='optimized regions map, input is overwritten if not specified')
+    parser.add_argument('-s', '--svg', default=None, help='directory with SVG maps to optimize as well')
+    parser.add_argument('--svg_output', default='./report/maps.min', help='directory for optimized SVG maps')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.0005, help='max deviation as fraction of the map size')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of processes')
+    parser.add_argument('-d', '--debug', action='store_true')
+
+    args = parser.parse_args()
+    logger.set_lvl(LogLevel.DEBUG if args.debug else LogLevel.NORMAL)
+
+    start = time.time()
+    stats = optimize(args.input, args.output or args.input, args.svg, args.svg_output,
+                     args.tolerance, args.jobs)
+
+    report(stats)
+    logger.success('Карти оптимізовано [%fс]' % (time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
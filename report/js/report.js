@@ -1,10 +1,11 @@
 $description = $(".description");
 $notification = -1;
 $modal_isopen = false;
-$test_chart = null;
-$sick_chart = null;
-$recv_chart = null;
-$dead_chart = null;
+$charts = {};
+$country = 'ukr';
+$chart_range = {kind: 'recent'};
+$daily_window = 90;
+$history = {};
 
 $(document).ready(function(){
     /* Hack for ZZZ hosting */
@@ -27,8 +28,8 @@ $(document).ready(function(){
         document.body.removeChild(cbalinks[0]);
     }
 
-    /* Initialize total data */
-    country_changed('ukr');
+    /* Initialize total data with the selected country */
+    country_changed($('input[name="tabgroup"]:checked').attr('id') || 'ukr');
 
     /* Welcome message */
     msg = 'Вітаємо!<br>На цій сторінці ви можете отримати коротку інформацію про поширення вірусу SARS-nCov-2 на теренах України та країн світу.<br><br>👉 Щоб отримати інформацію про певний регіон, наведіть на нього вказівник.<br><br>👉 Щоб побачити зміну кількості осіб відносно попередньої доби, наведіть на значення потрібного критерію.<br><br>👉 Щоб скопіювати дані, натисність на регіон чи на його назву у панелі даних.<br><br>Гарного вам дня!';
@@ -122,6 +123,7 @@ $('#footer_content').hover(
  */
 function country_changed(name) {
     node_id = '#total_' + name;
+    $country = name;
 
     if ($(node_id).length > 0) {
         /* General information */
@@ -140,10 +142,10 @@ function country_changed(name) {
 
         /* Data for charts */
         $('#total').data('days', $(node_id).data('days'));
-        $('#total').data('test', $(node_id).data('test'));
-        $('#total').data('sick', $(node_id).data('sick'));
-        $('#total').data('recv', $(node_id).data('recv'));
-        $('#total').data('dead', $(node_id).data('dead'));
+        $('#total').data('test', series_decode($(node_id).data('test')));
+        $('#total').data('sick', series_decode($(node_id).data('sick')));
+        $('#total').data('recv', series_decode($(node_id).data('recv')));
+        $('#total').data('dead', series_decode($(node_id).data('dead')));
 
         /* Data for details */
         $('#total').data('regs', $(node_id).data('regs'));
@@ -155,6 +157,9 @@ function country_changed(name) {
         /* Data for cure timeline */
         $('#total').attr('cure', $(node_id).attr('cure'));
 
+        /* Precalculated metrics */
+        $('#total').data('metrics', $(node_id).data('metrics'));
+
     } else {
         /* General information */
         $('#total').attr('title',     '—');
@@ -171,14 +176,14 @@ function country_changed(name) {
         $('#total').attr('d_dead',      '—');
 
         /* Data for charts */
-        $('#total').data('days',   '[]');
-        $('#total').data('test',   '[]');
-        $('#total').data('sick',   '[]');
-        $('#total').data('recv',   '[]');
-        $('#total').data('dead',   '[]');
+        $('#total').data('days',   []);
+        $('#total').data('test',   []);
+        $('#total').data('sick',   []);
+        $('#total').data('recv',   []);
+        $('#total').data('dead',   []);
 
         /* Data for details */
-        $('#total').data('regs', '[]');
+        $('#total').data('regs', []);
         $('#total').attr('popl', '—');
         $('#total').attr('area', '—');
         $('#total').attr('dens', '—');
@@ -186,6 +191,9 @@ function country_changed(name) {
 
         /* Data for cure timeline */
         $('#total').attr('cure', '0');
+
+        /* Precalculated metrics */
+        $('#total').data('metrics', {});
     }
 
     /* Initialize total data */
@@ -338,6 +346,15 @@ function update_region_stats(name)
     $('#psm_infwt').html(psm_infwt + ' %');
     $('#psi_infwt').attr('class', 'ps_marker dtrr_danger' + danger_lvl);
 
+    /* Precalculated metrics, unknown values are shown as dash */
+    metrics = $('#total').data('metrics') || {};
+    metric_show('inc7',     metrics.Incidence7,  0, 500, '');
+    metric_show('inc14',    metrics.Incidence14, 0, 1000, '');
+    metric_show('growth',   metrics.Growth,      0.8, 1.2, '');
+    metric_show('rt',       metrics.Rt,          0.8, 1.2, '');
+    metric_show('posit',    metrics.Positivity,  0, 20, ' %');
+    metric_show('dead100k', metrics.DeadPer100k, 0, 200, '');
+
     /* Update cure development timeline */
     cure_stage = parseInt($('#total').attr('cure'));
     for (i = 1; i < 8; i++) {
@@ -353,6 +370,18 @@ function update_region_stats(name)
 
 }
 
+/* Show precalculated metric with its danger level */
+function metric_show(name, value, min_v, max_v, unit) {
+    if (value == null) {
+        $('#psm_' + name).html('—');
+        $('#psi_' + name).attr('class', 'ps_marker');
+        return;
+    }
+
+    $('#psm_' + name).html(value + unit);
+    $('#psi_' + name).attr('class', 'ps_marker dtrr_danger' + min_max_level_get(min_v, max_v, 5, value));
+}
+
 /* Update region details
  * Update detailed information when country changed
  */
@@ -371,14 +400,50 @@ function update_region_details(name) {
                   '<p class="dtrh_item">Хворих</p>' +
                   '<p class="dtrh_item">За добу</p>';
 
+    /* Each region is: name, sick, d_sick, sick zone, d_sick zone */
     var regions_num = regions_data.length;
     for (var i = 0; i < regions_num; i += 5) {
-        dtr_regions += '<p class="dtrr_item ' + regions_data[i+3] + '" style="text-align: left;">' + regions_data[i]   + '</p>' +
-                       '<p class="dtrr_item ' + regions_data[i+3] + '">' + regions_data[i+1] + '</p>' +
-                       '<p class="dtrr_item ' + regions_data[i+4] + '">' + regions_data[i+2] + '</p>';
+        dtr_regions += '<p class="dtrr_item dtrr_danger' + regions_data[i+3] + '" style="text-align: left; cursor: pointer;" onclick="region_trend(' + i + ')">' + regions_data[i]   + ' 📈</p>' +
+                       '<p class="dtrr_item dtrr_danger' + regions_data[i+3] + '">' + regions_data[i+1] + '</p>' +
+                       '<p class="dtrr_item dtrr_danger' + regions_data[i+4] + '">' + regions_data[i+2] + '</p>';
     }
 
     $('#dtr_regions').html(dtr_regions);
+
+    /* Trend of the previous country region is not actual */
+    $('#dtr_trend').hide();
+}
+
+/* Show trend of the region
+ * History of regions is loaded on the first request
+ *
+ * index - position of the region in regions data
+ */
+function region_trend(index) {
+    var name = $("#total").data('regs')[index];
+    var country = $country;
+
+    history_load('regions', function(history) {
+        var pos = history.names.indexOf(name);
+        if (country != $country || pos < 0) {
+            notify('Немає історії регіону "' + name + '"', 5000);
+            return;
+        }
+
+        /* Chart shows new cases per day */
+        var sick = history.sick[pos];
+        var new_cases = sick.map(function(value, i) {
+            return (i > 0) ? value - sick[i - 1] : value;
+        });
+
+        /* Show latest month, there are too many points otherwise */
+        var from = Math.max(0, sick.length - 30);
+
+        $('#dtr_trend_name').html('📈 Нові випадки за добу: ' + name);
+        $('#dtr_trend').show();
+        draw_chart('region', history.days.slice(from), new_cases.slice(from),
+                   history.avg[pos].slice(from), null);
+    });
 }
 
 /* Copy current region to clipboard.
@@ -497,23 +562,139 @@ $('#modal').drags();
 
 /* Redraw dynamics chart for country */
 function redraw_chart(chart_name) {
-    /* Create full name of chart */
-    var full_chart_name = chart_name + '_chart';
+    /* Latest days are embedded into the page */
+    if ($chart_range.kind == 'recent') {
+        draw_chart(chart_name, $("#total").data('days'), $("#total").data(chart_name), null, null);
+        return;
+    }
+
+    var country = $country;
+    var kind = ($chart_range.kind == 'all') ? 'overview' : 'daily';
+
+    history_load(kind, function(history) {
+        /* Country could be changed while history was loading */
+        if (country != $country) {
+            return;
+        }
+
+        if (kind == 'overview') {
+            /* Click on the point zooms into its days */
+            draw_chart(chart_name, history.days, history[chart_name], null, function(index) {
+                var span = history.span[index];
+                chart_range('daily', span[0], span[1]);
+            });
+            return;
+        }
+
+        /* The latest days are shown if range is not specified */
+        var to   = ($chart_range.to == null) ? history.days.length : $chart_range.to;
+        var from = ($chart_range.from == null) ? to - $daily_window : $chart_range.from;
+        from = Math.max(0, Math.min(from, to - 14));
+
+        draw_chart(chart_name, history.days.slice(from, to), history[chart_name].slice(from, to),
+                   history.avg[chart_name].slice(from, to), null);
+    });
+}
+
+/* Change range of dynamics charts
+ *
+ * kind - 'recent' for embedded data, 'all' for the whole history
+ *        or 'daily' for days [from, to) of the history, the latest
+ *        $daily_window days by default
+ */
+function chart_range(kind, from=null, to=null) {
+    $chart_range = {kind: kind, from: from, to: to};
+
+    redraw_chart('test');
+    redraw_chart('sick');
+    redraw_chart('recv');
+    redraw_chart('dead');
+}
+
+/* Load history of the country on demand
+ *
+ * kind - 'overview', 'daily' or 'regions'
+ * callback - function that receives history data
+ */
+function history_load(kind, callback) {
+    var key = $country + '.' + kind;
 
-    if (full_chart_name == 'test_chart' && $test_chart != null) {
-        $test_chart.destroy();
+    if (key in $history) {
+        callback($history[key]);
+        return;
     }
 
-    if (full_chart_name == 'sick_chart' && $sick_chart != null) {
-        $sick_chart.destroy();
+    var file = 'history/' + $country + (kind == 'overview' ? '' : '.' + kind) + '.json';
+    $.getJSON(file, function(data) {
+        if (kind == 'regions') {
+            /* Series of regions are in order of names */
+            data.sick = data.sick.map(series_decode);
+            data.avg = data.avg.map(series_decode);
+        } else {
+            ['test', 'sick', 'recv', 'dead'].forEach(function(name) {
+                data[name] = series_decode(data[name]);
+                if (data.avg) {
+                    data.avg[name] = series_decode(data.avg[name]);
+                }
+            });
+        }
+
+        $history[key] = data;
+        callback(data);
+    }).fail(function() {
+        notify('Не вдалось завантажити історію', 5000);
+    });
+}
+
+/* Decode series of numbers
+ *
+ * Long series are packed by the generator as "d64:" prefix followed by
+ * base64 of zigzag varint deltas; other values are returned as is.
+ */
+function series_decode(value) {
+    if (typeof value != 'string' || value.indexOf('d64:') != 0) {
+        return value;
     }
 
-    if (full_chart_name == 'recv_chart' && $recv_chart != null) {
-        $recv_chart.destroy();
+    var bytes  = atob(value.substring(4));
+    var result = [];
+    var prev   = 0;
+    var zigzag = 0;
+    var scale  = 1;
+
+    for (var i = 0; i < bytes.length; i++) {
+        var byte = bytes.charCodeAt(i);
+
+        /* Multiplication keeps values above 32 bits */
+        zigzag += (byte & 0x7f) * scale;
+        if (byte & 0x80) {
+            scale *= 128;
+            continue;
+        }
+
+        prev += (zigzag % 2) ? -(zigzag + 1) / 2 : zigzag / 2;
+        result.push(prev);
+
+        zigzag = 0;
+        scale  = 1;
     }
 
-    if (full_chart_name == 'dead_chart' && $dead_chart != null) {
-        $dead_chart.destroy();
+    return result;
+}
+
+/* Draw chart
+ *
+ * labels - labels of X axis
+ * values - values of the chart
+ * average - moving average drawn as dashed line (optional)
+ * on_select - function called with index of clicked point (optional)
+ */
+function draw_chart(chart_name, labels, values, average, on_select) {
+    /* Create full name of chart */
+    var full_chart_name = chart_name + '_chart';
+
+    if ($charts[chart_name] != null) {
+        $charts[chart_name].destroy();
     }
 
     var chart    = document.getElementById(full_chart_name).getContext('2d'),
@@ -524,17 +705,28 @@ function redraw_chart(chart_name) {
     gradient.addColorStop(1, 'rgba(255, 0, 0, 0)');
 
     var data  = {
-        labels: $("#total").data('days'),
+        labels: labels,
         datasets: [{
                 label: '',
                 backgroundColor: gradient,
                 pointBackgroundColor: 'white',
                 borderWidth: 1,
                 borderColor: '#911215',
-                data:  $("#total").data(chart_name)
+                data:  values
         }]
     };
 
+    if (average != null) {
+        data.datasets.push({
+                label: 'Середнє за 7 днів',
+                fill: false,
+                pointRadius: 0,
+                borderWidth: 1,
+                borderDash: [5, 5],
+                borderColor: '#000000',
+                data:  average
+        });
+    }
 
     var options = {
         responsive: true,
@@ -579,27 +771,19 @@ function redraw_chart(chart_name) {
         }
     };
 
-    var chartInstance = new Chart(chart, {
+    if (on_select != null) {
+        options.onClick = function(evt, elements) {
+            if (elements.length > 0) {
+                on_select(elements[0]._index);
+            }
+        };
+    }
+
+    $charts[chart_name] = new Chart(chart, {
         type: 'line',
         data: data,
         options: options
     });
-
-    if (full_chart_name == 'test_chart') {
-        $test_chart = chartInstance;
-    }
-
-    if (full_chart_name == 'sick_chart') {
-        $sick_chart = chartInstance;
-    }
-
-    if (full_chart_name == 'recv_chart') {
-        $recv_chart = chartInstance;
-    }
-
-    if (full_chart_name == 'dead_chart') {
-        $dead_chart = chartInstance;
-    }
 }
 
 /* Opens modal window for additional information */
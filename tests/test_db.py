@@ -0,0 +1,195 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import unittest
+
+import icovid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# instance in the other process: loads the DB and runs commands from input
+INSTANCE = '''
+import sys
+sys.path.insert(0, sys.argv[1])
+import icovid
+from utils import FileLock
+
+icovid.logger.set_lvl(icovid.LogLevel.CRITICAL)
+db = icovid.dbWorker(sys.argv[2])
+lock = None
+
+for command in sys.stdin:
+    command = command.split()
+    if command[0] == 'update':
+        day = command[1].replace('_', ' ')
+        db.update_batch(day, {'Країна': {'Name': 'Країна', 'Sick': int(command[2])}})
+        db.save()
+    elif command[0] == 'hold':
+        lock = FileLock(sys.argv[2] + '.lock').hold()
+        lock.__enter__()
+    elif command[0] == 'release':
+        lock.__exit__(None, None, None)
+    print('done', flush=True)
+'''
+
+
+def config(name, sick):
+    return {'Name': name, 'Code': name[:3], 'Population': 1000, 'Tested': sick * 10, 'Sick': sick,
+            'Recovered': 0, 'Dead': 0, 'Regions': {'Північ': sick}}
+
+
+class dbTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        icovid.logger.set_lvl(icovid.LogLevel.CRITICAL)
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'icovid.db')
+        with open(self.path, 'w') as fp:
+            json.dump({'24 Mar 2021': {'Країна': config('Країна', 1)}}, fp, ensure_ascii=False)
+
+        self.marks = []
+        self.mark = icovid.saver.mark
+        icovid.saver.mark = lambda name, func: self.marks.append(name)
+
+    def tearDown(self):
+        icovid.saver.mark = self.mark
+        shutil.rmtree(self.tmp)
+
+    def test_update_batch(self):
+        db = icovid.dbWorker(self.path)
+        db.update_batch('25 Mar 2021', {'Країна': config('Країна', 2), 'Інша': config('Інша', 3)})
+
+        # all the countries are written with a single save request
+        self.assertEqual(self.marks, [self.path])
+        self.assertEqual(db.get({'date': '25 Mar 2021'}), {'Країна': config('Країна', 2),
+                                                          'Інша': config('Інша', 3)})
+        self.assertEqual(db.get({'date': '24 Mar 2021'}), {'Країна': config('Країна', 1)})
+
+        db.update_batch('25 Mar 2021', {})
+        self.assertEqual(len(self.marks), 1)
+
+    def test_update_while_saving(self):
+        db = icovid.dbWorker(self.path)
+        db.update_batch('25 Mar 2021', {'Країна': config('Країна', 2)})
+
+        # saver is stopped while the snapshot is written
+        writing, proceed = threading.Event(), threading.Event()
+        write = icovid.dbSnapshot.write
+
+        def blocked(*args):
+            writing.set()
+            proceed.wait(5)
+            write(*args)
+
+        icovid.dbSnapshot.write = blocked
+        try:
+            saver = threading.Thread(target=db.save)
+            saver.start()
+            self.assertTrue(writing.wait(5))
+
+            # DB is not locked while the file is written
+            updater = threading.Thread(target=db.update_batch,
+                                       args=('26 Mar 2021', {'Країна': config('Країна', 3)}))
+            updater.start()
+            updater.join(5)
+            self.assertFalse(updater.is_alive())
+
+            proceed.set()
+            saver.join(5)
+        finally:
+            icovid.dbSnapshot.write = write
+
+        with open(self.path) as fp:
+            self.assertEqual(list(json.load(fp)), ['24 Mar 2021', '25 Mar 2021'])
+
+        db.save()
+        with open(self.path) as fp:
+            self.assertEqual(list(json.load(fp)), ['24 Mar 2021', '25 Mar 2021', '26 Mar 2021'])
+
+        # nothing is written if the state is already saved
+        stat = os.stat(self.path)
+        db.save()
+        self.assertEqual(os.stat(self.path).st_mtime_ns, stat.st_mtime_ns)
+
+
+class dbProcessTest(unittest.TestCase):
+    ''' Instances in different processes using the same DB file '''
+    @classmethod
+    def setUpClass(cls):
+        icovid.logger.set_lvl(icovid.LogLevel.CRITICAL)
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'icovid.db')
+        with open(self.path, 'w') as fp:
+            json.dump({'24 Mar 2021': {'Країна': config('Країна', 1)}}, fp, ensure_ascii=False)
+
+        self.mark = icovid.saver.mark
+        icovid.saver.mark = lambda name, func: None
+
+        self.process = subprocess.Popen([sys.executable, '-c', INSTANCE, ROOT, self.path],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+
+    def tearDown(self):
+        self.process.stdin.close()
+        self.process.wait(5)
+        self.process.stdout.close()
+        icovid.saver.mark = self.mark
+        shutil.rmtree(self.tmp)
+
+    def command(self, command):
+        self.process.stdin.write(command + '\n')
+        self.process.stdin.flush()
+        self.assertEqual(self.process.stdout.readline().strip(), 'done')
+
+    def dates(self):
+        with open(self.path) as fp:
+            return list(json.load(fp))
+
+    def test_saves_are_serialized(self):
+        db = icovid.dbWorker(self.path)
+        db.update_batch('25 Mar 2021', {'Країна': config('Країна', 2)})
+
+        self.command('hold')
+        thread = threading.Thread(target=db.save)
+        thread.start()
+
+        # save waits for the other process
+        time.sleep(0.3)
+        self.assertTrue(thread.is_alive())
+        self.assertEqual(self.dates(), ['24 Mar 2021'])
+
+        self.command('release')
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(self.dates(), ['24 Mar 2021', '25 Mar 2021'])
+
+    def test_stale_state_is_not_saved(self):
+        # demoted leader keeps the DB loaded before the new leader saved it
+        ctx = types.SimpleNamespace(db=icovid.dbWorker(self.path))
+        self.command('update 25_Mar_2021 2')
+
+        ctx.db.update_batch('26 Mar 2021', {'Країна': config('Країна', 3)})
+        ctx.db.save()
+        self.assertEqual(self.dates(), ['24 Mar 2021', '25 Mar 2021'])
+
+        # reopened DB serves data of the new leader from the snapshot
+        service = icovid.queryService(ctx, port=0)
+        service.refresh()
+        self.assertEqual(json.loads(service.answer('/country/Кра/history')[1])['days'], ['2021-03-24', '2021-03-26'])
+
+        ctx.db = icovid.dbWorker(self.path, lazy=True)
+        service.refresh()
+        self.assertEqual(json.loads(service.answer('/country/Кра/history')[1])['days'], ['2021-03-24', '2021-03-25'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from utils import LeaderLease, LogLevel, Logger
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# instance in the other process: takes the lease, releases it on "release"
+# command and exits on the end of input
+INSTANCE = '''
+import sys
+sys.path.insert(0, sys.argv[1])
+from utils import LeaderLease, LogLevel, Logger
+
+lease = LeaderLease(sys.argv[2], Logger(LogLevel.CRITICAL), ttl=float(sys.argv[3]))
+print(lease.acquire(), flush=True)
+
+for command in sys.stdin:
+    if command.strip() == 'release':
+        lease.release()
+        print('released', flush=True)
+'''
+
+
+class LeaderLeaseTest(unittest.TestCase):
+    ttl = 1.0
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'icovid.lease')
+        self.processes = []
+
+    def tearDown(self):
+        for process in self.processes:
+            process.kill()
+            process.wait()
+            process.stdin.close()
+            process.stdout.close()
+        shutil.rmtree(self.tmp)
+
+    def instance(self):
+        process = subprocess.Popen([sys.executable, '-c', INSTANCE, ROOT, self.path, str(self.ttl)],
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        self.processes.append(process)
+        return process
+
+    def lease(self):
+        return LeaderLease(self.path, Logger(LogLevel.CRITICAL), ttl=self.ttl)
+
+    def test_single_leader(self):
+        leader = self.instance()
+        self.assertEqual(leader.stdout.readline().strip(), 'True')
+
+        follower = self.instance()
+        self.assertEqual(follower.stdout.readline().strip(), 'False')
+
+        # heartbeat keeps the lease longer than its duration
+        time.sleep(self.ttl * 2)
+        lease = self.lease()
+        self.assertFalse(lease.acquire())
+        self.assertEqual(lease.holder()['pid'], leader.pid)
+
+    def test_takeover_after_expiry(self):
+        leader = self.instance()
+        self.assertEqual(leader.stdout.readline().strip(), 'True')
+
+        # stopped leader does not release the lease
+        leader.kill()
+        leader.wait()
+
+        lease = self.lease()
+        self.assertFalse(lease.acquire())
+
+        time.sleep(self.ttl * 1.2)
+        self.assertTrue(lease.acquire())
+        self.assertEqual(lease.holder()['pid'], os.getpid())
+        lease.release()
+
+    def test_release(self):
+        leader = self.instance()
+        self.assertEqual(leader.stdout.readline().strip(), 'True')
+
+        leader.stdin.write('release\n')
+        leader.stdin.flush()
+        self.assertEqual(leader.stdout.readline().strip(), 'released')
+
+        # lease is free at once and is not renewed by the stopped heartbeat
+        self.assertIsNone(self.lease().holder())
+        time.sleep(self.ttl / 2)
+        self.assertFalse(os.path.exists(self.path))
+
+        lease = self.lease()
+        self.assertTrue(lease.acquire())
+        lease.release()
+
+    def test_release_waits_for_heartbeat(self):
+        lease = self.lease()
+        self.assertTrue(lease.acquire())
+
+        thread = lease._thread
+        lease.release()
+
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import email
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+import unittest
+
+from utils import Email, LogLevel, Logger, MailQueue
+
+
+class SmtpStandIn(socketserver.ThreadingTCPServer):
+    ''' Local SMTP server that keeps received messages
+
+    First "failures" sessions are refused on MAIL command.
+    '''
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, failures=0):
+        super().__init__(('127.0.0.1', 0), SmtpHandler)
+        self.port = self.server_address[1]
+        self.failures = failures
+        self.sessions = 0
+        self.messages = []
+
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+    def reply(self, text):
+        self.wfile.write((text + '\r\n').encode())
+
+    def handle(self):
+        self.server.sessions += 1
+        refuse = self.server.sessions <= self.server.failures
+
+        self.reply('220 stand-in')
+        while True:
+            line = self.rfile.readline().decode().strip()
+            command = line.split(' ')[0].upper()
+
+            if not line or command == 'QUIT':
+                self.reply('221 bye')
+                return
+            elif command in ('EHLO', 'HELO'):
+                self.reply('250 stand-in')
+            elif command == 'MAIL' and refuse:
+                self.reply('451 try again later')
+            elif command == 'DATA':
+                self.reply('354 go ahead')
+                data = b''
+                while not data.endswith(b'\r\n.\r\n'):
+                    data += self.rfile.readline()
+                self.server.messages.append(email.message_from_bytes(data[:-5]))
+                self.reply('250 accepted')
+            else:
+                self.reply('250 ok')
+
+
+class MailQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'icovid.mail')
+        self.logger = Logger(LogLevel.CRITICAL)
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+        shutil.rmtree(self.tmp)
+
+    def server(self, failures=0):
+        server = SmtpStandIn(failures)
+        self.servers.append(server)
+        return server
+
+    def queue(self, port, **kwargs):
+        options = {'window': 0.2, 'interval': 0, 'retries': 3, 'backoff': 0.2}
+        options.update(kwargs)
+        return MailQueue(self.path, self.logger, lambda: ('icovid@localhost', ''), host='127.0.0.1',
+                         port=port, use_ssl=False, **options)
+
+    @staticmethod
+    def wait(condition, timeout=5):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.02)
+        return condition()
+
+    @staticmethod
+    def body(message):
+        return message.get_payload()[0].get_payload(decode=True).decode().replace('\r\n', '\n')
+
+    def test_coalescing(self):
+        server = self.server()
+        queue = self.queue(server.port)
+
+        for index in range(3):
+            queue.put(Email('admin@localhost', 'Звіт', 'error %d' % index, is_html=False))
+        queue.put(Email('admin@localhost', 'Інший звіт', 'other', is_html=False))
+
+        self.assertTrue(self.wait(lambda: queue.pending() == 0))
+        queue.close()
+
+        self.assertEqual(len(server.messages), 2)
+        merged = [m for m in server.messages if self.body(m).startswith('error')][0]
+        self.assertEqual(self.body(merged), 'error 0\n\nerror 1\n\nerror 2')
+
+    def test_retry_with_backoff(self):
+        server = self.server(failures=2)
+        queue = self.queue(server.port)
+
+        start = time.time()
+        queue.put(Email('admin@localhost', 'Звіт', 'error', is_html=False))
+
+        self.assertTrue(self.wait(lambda: server.messages))
+        queue.close()
+
+        # window, then two failures with delays of 0.2 and 0.4 seconds
+        self.assertEqual(server.sessions, 3)
+        self.assertGreaterEqual(time.time() - start, 0.2 + 0.2 + 0.4)
+
+    def test_drop_after_retries(self):
+        server = self.server(failures=10)
+        queue = self.queue(server.port, retries=2, backoff=0.05)
+
+        queue.put(Email('admin@localhost', 'Звіт', 'error', is_html=False))
+
+        self.assertTrue(self.wait(lambda: queue.pending() == 0))
+        queue.close(flush=False)
+
+        self.assertEqual(server.sessions, 2)
+        self.assertEqual(server.messages, [])
+
+    def test_persistence(self):
+        # nobody listens on the port of the stopped server
+        server = self.server()
+        server.stop()
+        self.servers.remove(server)
+
+        queue = self.queue(server.port, window=60)
+        queue.put(Email('admin@localhost', 'Звіт', 'error', is_html=False))
+        queue.close(flush=False)
+        self.assertTrue(os.path.isfile(self.path))
+
+        server = self.server()
+        queue = self.queue(server.port, window=60)
+        self.assertEqual(queue.pending(), 1)
+        queue.close()
+
+        self.assertEqual([self.body(m) for m in server.messages], ['error'])
+        queue = self.queue(server.port)
+        self.assertEqual(queue.pending(), 0)
+        queue.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+import copy
+import json
+import os
+import shutil
+import tempfile
+import types
+import unittest
+
+import icovid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def config(sick, dead=0, regions=None, tested=0):
+    regions = regions if regions is not None else {'Північ': sick // 2, 'Південь': sick - sick // 2}
+    return {'Name': 'Країна', 'Code': 'aaa', 'Tested': tested, 'Sick': sick, 'Recovered': 0, 'Dead': dead,
+            'Regions': regions}
+
+
+class QualityChecksTest(unittest.TestCase):
+    ''' Checks of a single country against its history '''
+    day = '15 Jan 2021'
+
+    def setUp(self):
+        self.gate = icovid.qualityGate()
+
+        # steady growth by 100 sick and 2 dead a day
+        start = icovid.datetime.strptime('01 Jan 2021', '%d %b %Y').toordinal()
+        self.history = [(start + i, config(1000 + 100 * i, 10 + 2 * i)) for i in range(14)]
+
+    def issues(self, cfg):
+        return self.gate.issues(self.day, cfg, self.history)
+
+    def test_clean(self):
+        self.assertEqual(self.issues(config(2400, 38)), [])
+        self.assertEqual(self.gate.issues(self.day, config(5), []), [])
+
+    def test_invalid_values(self):
+        self.assertEqual(len(self.issues(dict(config(2400, 38), Sick='—'))), 1)
+        self.assertEqual(len(self.issues(config(2400, 38, {'Північ': -1}))), 1)
+
+    def test_decrease(self):
+        self.assertIn('Sick зменшилось з 2300 до 1150', self.issues(config(1150, 38)))
+
+    def test_regions_ratio(self):
+        found = self.issues(config(2400, 38, {'Північ': 3600, 'Південь': 3600}))
+        self.assertEqual(found, ['сума регіонів до кількості хворих змінилась з 1.00 до 3.00'])
+
+    def test_jump(self):
+        found = self.issues(config(2400, 3000))
+        self.assertEqual(len(found), 1)
+        self.assertTrue(found[0].startswith('Dead: приріст'))
+
+        # growth is normalized by the gap between records
+        self.assertEqual(self.gate.issues('24 Jan 2021', config(3300, 56), self.history), [])
+
+
+class QuarantineTest(unittest.TestCase):
+    ''' Quarantine of the countries with the DB of the previous runs '''
+    day = '01 Apr 2021'
+
+    @classmethod
+    def setUpClass(cls):
+        icovid.logger.set_lvl(icovid.LogLevel.CRITICAL)
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'icovid.db')
+        shutil.copy(os.path.join(ROOT, 'icovid.db'), self.path)
+
+        self.db = icovid.dbWorker(self.path)
+        self.last = self.db.get({'date': '31 Mar 2021'})
+        self.gate = icovid.qualityGate()
+
+    def tearDown(self):
+        # pending background saves target the temporary directory
+        icovid.saver.flush()
+        shutil.rmtree(self.tmp)
+
+    def apply(self, rows):
+        buffer = icovid.mergeBuffer()
+        updated, rejected = buffer.apply(self.db, self.day, rows, lambda r: self.gate.check(self.db, self.day, r))
+        return updated, rejected, self.gate.carry_forward(self.db, self.day, rejected)
+
+    def test_rejected_country_is_carried_forward(self):
+        rows = copy.deepcopy(self.last)
+        rows['Україна']['Sick'] //= 2
+
+        updated, rejected, carried = self.apply(rows)
+
+        self.assertIn('Україна', rejected)
+        self.assertNotIn('Україна', updated)
+        self.assertIn('Україна', carried)
+
+        # every country of the previous day is present, Ukraine keeps the accepted data
+        today = self.db.get({'date': self.day})
+        self.assertEqual(set(today), set(self.last))
+        self.assertEqual(today['Україна'], self.last['Україна'])
+        self.assertEqual(today['Ізраїль'], rows['Ізраїль'])
+
+        # other countries are published
+        self.assertIsNone(self.gate.publish_blocker(updated))
+        self.assertEqual(self.gate.publish_blocker([]), 'нових перевірених даних немає')
+
+    def test_data_of_the_day_is_kept(self):
+        rows = copy.deepcopy(self.last)
+        self.apply({'Україна': rows['Україна']})
+
+        rows['Україна']['Sick'] //= 2
+        updated, rejected, carried = self.apply({'Україна': rows['Україна']})
+
+        self.assertEqual((updated, list(rejected), carried), ([], ['Україна'], []))
+        self.assertEqual(self.db.get({'date': self.day, 'country': 'Україна'}), self.last['Україна'])
+
+    def test_recovery(self):
+        rows = copy.deepcopy(self.last)
+        del rows['Львівщина']
+
+        updated, rejected, carried = self.apply(rows)
+        self.assertEqual(rejected, {})
+        self.assertIsNone(self.gate.publish_blocker(updated))
+        self.assertEqual(self.gate.publish_blocker([]), 'нових перевірених даних немає')
+
+    def test_hold(self):
+        self.gate._hold = 0
+        rows = copy.deepcopy(self.last)
+        rows['Україна']['Sick'] //= 2
+
+        updated, rejected, carried = self.apply({'Україна': rows['Україна']})
+        self.assertEqual(updated, ['Україна'])
+        self.assertEqual(self.gate.quarantine, {})
+
+
+class ReportTest(unittest.TestCase):
+    ''' Web page is rendered and published with a quarantined country '''
+
+    @classmethod
+    def setUpClass(cls):
+        icovid.logger.set_lvl(icovid.LogLevel.CRITICAL)
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp()
+        for name in ('icovid.db', 'eng_ukr.vocab'):
+            shutil.copy(os.path.join(ROOT, name), self.tmp)
+        for name in ('sources', 'report'):
+            shutil.copytree(os.path.join(ROOT, name), os.path.join(self.tmp, name))
+        os.chdir(self.tmp)
+
+    def tearDown(self):
+        icovid.saver.flush()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp)
+
+    def test_render(self):
+        covid = icovid.iCovid()
+        day = icovid.date.today().strftime('%d %b %Y')
+        last = covid.db.get({'date': '31 Mar 2021'})
+
+        rows = copy.deepcopy(last)
+        rows['Україна']['Sick'] //= 2
+        del rows['Львівщина']
+
+        _, rejected = covid.merge.apply(covid.db, day, rows, lambda r: covid.quality.check(covid.db, day, r))
+        covid.quality.carry_forward(covid.db, day, rejected)
+        self.assertEqual(list(rejected), ['Україна'])
+
+        covid._html_report()
+        with open('report/index.html') as fp:
+            page = fp.read()
+
+        self.assertIn(last['Україна']['Name'], page)
+
+    def test_multipage_publish(self):
+        covid = icovid.iCovid()
+        day = icovid.date.today().strftime('%d %b %Y')
+
+        rows = copy.deepcopy(covid.db.get({'date': '31 Mar 2021'}))
+        rows['Україна']['Sick'] //= 2
+
+        updated, rejected = covid.merge.apply(covid.db, day, rows, lambda r: covid.quality.check(covid.db, day, r))
+        covid.quality.carry_forward(covid.db, day, rejected)
+        self.assertIsNone(covid.quality.publish_blocker(updated))
+
+        uploaded = []
+        covid._ftp = {'login': 'login', 'password': 'password'}
+        covid.ftp = types.SimpleNamespace(connect=lambda *args: None, login=lambda *args: None,
+                                          cwd=lambda *args: None, mkd=lambda *args: None)
+        covid._ftp_upload = uploaded.append
+        covid.webpage_update('localhost', multipage=True)
+
+        # page of the quarantined country is not uploaded
+        self.assertNotIn('./report/ukr.html', uploaded)
+        self.assertIn('./report/isr.html', uploaded)
+        self.assertIn('./report/index.html', uploaded)
+
+
+if __name__ == '__main__':
+    unittest.main()
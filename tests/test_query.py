@@ -0,0 +1,163 @@
+import http.client
+import json
+import os
+import shutil
+import tempfile
+import types
+import unittest
+
+import icovid
+
+
+def config(code, sick, regions):
+    return {'Name': code, 'Code': code, 'Population': 1000, 'Tested': sick * 10, 'Sick': sick,
+            'Recovered': sick // 2, 'Dead': sick // 10, 'Regions': regions}
+
+
+class QueryServiceTest(unittest.TestCase):
+    ''' Answers of the HTTP service built from a small DB '''
+    entries = {
+        '24 Mar 2021': {'Країна': config('aaa', 100, {'Північ': 60, 'Південь': 40})},
+        '25 Mar 2021': {'Країна': config('aaa', 120, {'Північ': 70, 'Південь': 50})},
+        '27 Mar 2021': {'Країна': config('aaa', 150, {'Північ': 90, 'Південь': 60})},
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        icovid.logger.set_lvl(icovid.LogLevel.CRITICAL)
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'icovid.db')
+        with open(self.path, 'w') as fp:
+            json.dump(self.entries, fp, ensure_ascii=False)
+
+        self.service = self.make_service()
+
+    def tearDown(self):
+        self.service.stop()
+        shutil.rmtree(self.tmp)
+
+    def make_service(self):
+        service = icovid.queryService(types.SimpleNamespace(db=icovid.dbWorker(self.path, lazy=True)), port=0)
+        service.refresh()
+        return service
+
+    def get(self, target):
+        status, body = self.service.answer(target)
+        return status, json.loads(body)
+
+    def test_countries(self):
+        status, content = self.get('/countries')
+        self.assertEqual(status, 200)
+        self.assertEqual(content, [{'code': 'aaa', 'name': 'Країна', 'population': 1000, 'date': '2021-03-27',
+                                    'tested': 1500, 'sick': 150, 'recovered': 75, 'dead': 15}])
+
+    def test_history(self):
+        status, content = self.get('/country/aaa/history?from=2021-03-25&to=2021-03-26')
+        self.assertEqual(status, 200)
+        self.assertEqual(content['days'], ['2021-03-25'])
+        self.assertEqual(content['sick'], [120])
+
+        status, content = self.get('/country/aaa/history')
+        self.assertEqual(content['days'], ['2021-03-24', '2021-03-25', '2021-03-27'])
+
+    def test_regions(self):
+        status, content = self.get('/country/aaa/regions')
+        self.assertEqual(status, 200)
+        # there is no data for the day before
+        self.assertEqual(content['regions'], [{'name': 'Північ', 'sick': 90, 'new': None},
+                                              {'name': 'Південь', 'sick': 60, 'new': None}])
+
+    def test_regions_new_cases(self):
+        entries = dict(self.entries)
+        entries['26 Mar 2021'] = {'Країна': config('aaa', 140, {'Північ': 85})}
+        with open(self.path, 'w') as fp:
+            json.dump(entries, fp, ensure_ascii=False)
+
+        answers = []
+        for snapshot in (False, True):
+            if snapshot:
+                icovid.dbSnapshot.write(self.path + '.snap', entries.items(), self.path)
+            answers.append(self.make_service().answer('/country/aaa/regions'))
+
+        self.assertEqual(answers[0], answers[1])
+        self.assertEqual(json.loads(answers[0][1])['regions'], [{'name': 'Північ', 'sick': 90, 'new': 5},
+                                                               {'name': 'Південь', 'sick': 60, 'new': None}])
+
+    def test_dates_are_normalized(self):
+        iso = self.service.answer('/country/aaa/history?from=2021-03-25')
+        basic = self.service.answer('/country/aaa/history?from=20210325')
+
+        self.assertEqual(basic, iso)
+        self.assertEqual(json.loads(basic[1])['days'], ['2021-03-25', '2021-03-27'])
+        self.assertEqual(len(self.service._cache), 1)
+
+    def test_errors_are_not_cached(self):
+        self.assertEqual(self.get('/country/aaa/history?from=yesterday')[0], 400)
+        self.assertEqual(self.get('/country/zzz/history')[0], 404)
+        self.assertEqual(self.get('/unknown?x=1')[0], 404)
+        self.assertEqual(len(self.service._cache), 0)
+
+    def test_cache_is_bounded(self):
+        self.service.cache_limit = 3
+
+        self.service.answer('/countries')
+        for day in range(24, 28):
+            self.service.answer('/country/aaa/history?from=2021-03-%d' % day)
+            self.service.answer('/countries')
+
+        self.assertEqual(len(self.service._cache), 3)
+        self.assertIn(('countries',), self.service._cache)
+        self.assertIn(('history', 'aaa', '2021-03-27', None), self.service._cache)
+
+    def test_snapshot_index(self):
+        answers = [self.service.answer(target) for target in ('/countries', '/country/aaa/history',
+                                                               '/country/aaa/regions')]
+
+        icovid.dbSnapshot.write(self.path + '.snap', self.entries.items(), self.path)
+        service = self.make_service()
+        snapshot = service._ctx.db.snapshot()
+        self.assertIsNotNone(snapshot)
+        snapshot.close()
+        self.assertEqual(list(service._index), ['aaa'])
+
+        self.assertEqual([service.answer(target) for target in ('/countries', '/country/aaa/history',
+                                                                '/country/aaa/regions')], answers)
+
+    def test_snapshot_country_without_data(self):
+        entries = dict(self.entries)
+        entries['27 Mar 2021'] = dict(entries['27 Mar 2021'], Нова={'Name': 'Нова', 'Code': 'new', 'Regions': {}})
+        with open(self.path, 'w') as fp:
+            json.dump(entries, fp, ensure_ascii=False)
+
+        answers = []
+        for snapshot in (False, True):
+            if snapshot:
+                icovid.dbSnapshot.write(self.path + '.snap', entries.items(), self.path)
+            service = self.make_service()
+
+            self.assertEqual(list(service._index), ['aaa'])
+            self.assertEqual(service.answer('/country/new/history')[0], 404)
+            answers.append(service.answer('/countries'))
+
+        self.assertEqual(answers[0], answers[1])
+
+    def test_http(self):
+        self.assertTrue(self.service.start())
+        port = self.service._server.sockets[0].getsockname()[1]
+
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        for target in ('/countries', '/country/aaa/regions'):
+            connection.request('GET', target)
+            response = connection.getresponse()
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.read(), self.service.answer(target)[1])
+
+        connection.request('POST', '/countries')
+        self.assertEqual(connection.getresponse().status, 405)
+        connection.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
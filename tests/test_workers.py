@@ -0,0 +1,59 @@
+import multiprocessing
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+import icovid
+
+
+class WorkerProcessesTest(unittest.TestCase):
+    ''' Results of worker processes match the in-process ones '''
+    countries = 6
+    regions = 20
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.pages, cls.tabs = icovid._synthetic_sources(cls.tmp, cls.countries, cls.regions)
+        cls.codes = ['b%02d' % index for index in range(cls.countries)]
+
+        cls.pool = ProcessPoolExecutor(2, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=icovid._worker_init,
+                                       initargs=(cls.tmp, icovid.LogLevel.CRITICAL, True, cls.pages))
+
+        # the same worker state in the test process
+        icovid._worker_init(cls.tmp, icovid.LogLevel.CRITICAL, True, cls.pages)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+        shutil.rmtree(cls.tmp)
+
+    def test_parse(self):
+        local = [icovid._worker_parse(code) for code in self.codes]
+        remote = list(self.pool.map(icovid._worker_parse, self.codes))
+
+        # configs and contributions, duration differs
+        self.assertEqual([r[:2] for r in remote], [r[:2] for r in local])
+        self.assertEqual(remote[0][0]['Code'], 'b00')
+        self.assertEqual(len(remote[0][0]['Regions']), self.regions)
+        self.assertTrue(any(remote[0][0]['Regions'].values()))
+
+    def test_render(self):
+        local = [icovid._render_tab(*tab) for tab in self.tabs]
+
+        for chunksize in (1, 4):
+            remote = list(self.pool.map(icovid._render_tab, *zip(*self.tabs), chunksize=chunksize))
+            self.assertEqual(remote, local)
+
+    def test_contributions(self):
+        buffer = icovid.mergeBuffer()
+        buffer.extend('b00', [('Країна 1', 'Регіон 1-0', 5)])
+
+        self.assertEqual(buffer.take('b00'), [('Країна 1', 'Регіон 1-0', 5)])
+        self.assertEqual(buffer.take('b00'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,9 +4,14 @@ __version__ = '0.8.0[b]'
 __release__ = '02 Nov 2020'
 __author__ = 'Alex Viytiv'
 
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-
+import itertools
+import bisect
+import hashlib
+import base64
+import json
+import time
+import os
+import re
 
 class Font:
     ''' Font class '''
@@ -82,15 +87,86 @@ class LogLevel:
               TRACE: Font.fg.lightcyan}
 
 
+class RotatingFile:
+    ''' Log file rotated by size and/or age
+
+    Rotated files get suffixes ".1" (the newest) to ".<backups>" (the
+    oldest), files older than that are removed.
+    '''
+    def __init__(self, path, max_bytes=10 * 2**20, interval=None, backups=5):
+        ''' Constructor
+
+        :param path: path to the log file
+        :param max_bytes: rotate when file exceeds the size, 0 to disable
+        :param interval: rotate when file is older than interval in seconds
+        :param backups: number of rotated files to keep
+        '''
+        self._path = path
+        self._max_bytes = max_bytes
+        self._interval = interval
+        self._backups = backups
+        self._open()
+
+    def _open(self):
+        self._fp = open(self._path, 'a', encoding='utf-8')
+        self._opened = time.time()
+
+    def _rotate(self):
+        self._fp.close()
+
+        for index in range(self._backups - 1, 0, -1):
+            if os.path.exists('%s.%d' % (self._path, index)):
+                os.replace('%s.%d' % (self._path, index), '%s.%d' % (self._path, index + 1))
+
+        if self._backups:
+            os.replace(self._path, self._path + '.1')
+        else:
+            os.remove(self._path)
+
+        self._open()
+
+    def write(self, text):
+        ''' Write text to the file, rotate it if needed '''
+        if (self._max_bytes and self._fp.tell() + len(text) > self._max_bytes and self._fp.tell()) or \
+           (self._interval and time.time() - self._opened >= self._interval):
+            self._rotate()
+
+        self._fp.write(text)
+        self._fp.flush()
+
+    def close(self):
+        self._fp.close()
+
+
 class Logger:
-    ''' Logger object provide logging subsystem '''
+    ''' Logger object provide logging subsystem
+
+    By default messages are printed immediately. After configure() they are
+    put to the bounded queue and written to the console and/or rotating
+    file by the background thread, so logging never blocks. Messages that
+    do not fit into the queue are dropped and counted.
+    '''
     def __init__(self, lvl):
         ''' Constructor
 
         :param gllvl: Global Logging Level
         '''
+        import threading
+
         self._gllvl = lvl
         self._is_user_active = True
+        self._policy = {}
+
+        # questions may be asked from several threads at once
+        self._prompt_lock = threading.Lock()
+
+        # output configuration
+        self._console = True
+        self._file = None
+        self._json = False
+        self._queue = None
+        self._thread = None
+        self._dropped = 0
 
     def set_lvl(self, lvl):
         ''' Configure logging level
@@ -107,59 +183,177 @@ class Logger:
     def get_lvl(self):
         return self._gllvl
 
+    def enabled(self, lvl):
+        ''' Check messages of the level are logged
+
+        :param lvl: log level
+        :return: TRUE if messages are logged, FALSE otherwise
+        '''
+        return LogLevel.CRITICAL <= lvl <= self._gllvl
+
+    def configure(self, path=None, json_lines=False, console=True, max_bytes=10 * 2**20,
+                  interval=None, backups=5, queue_size=10000):
+        ''' Write messages in the background thread
+
+        :param path: path to the log file, no file if not specified
+        :param json_lines: write messages as JSON objects, one per line
+        :param console: print messages to the console
+        :param max_bytes: rotate log file when it exceeds the size
+        :param interval: rotate log file when it is older than interval in seconds
+        :param backups: number of rotated log files to keep
+        :param queue_size: max number of messages waiting for output
+        '''
+        import threading
+        import atexit
+        import queue
+
+        self.close()
+
+        self._console = console
+        self._json = json_lines
+        self._file = RotatingFile(path, max_bytes, interval, backups) if path else None
+
+        self._queue = queue.Queue(queue_size)
+        self._thread = threading.Thread(target=self._run, name='logger', daemon=True)
+        self._thread.start()
+
+        atexit.register(self.close)
+
+    def flush(self):
+        ''' Wait till all queued messages are written '''
+        if self._queue is not None:
+            self._queue.join()
+
+    def close(self):
+        ''' Write queued messages and stop the background thread '''
+        if self._queue is None:
+            return
+
+        self._queue.put(None)
+        self._thread.join()
+        self._queue = None
+
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            try:
+                if record is None:
+                    return
+
+                self._write(record)
+
+                if self._dropped and self._queue.empty():
+                    # report the gap once the backlog is written
+                    dropped, self._dropped = self._dropped, 0
+                    self._write((time.time(), LogLevel.WARNING, 'Пропущено повідомлень: %d' % dropped, False, '.\n'))
+
+            except Exception:
+                # output must not break the thread
+                pass
+
+            finally:
+                self._queue.task_done()
+
+    def _emit(self, lvl, msg, raw, end):
+        ''' Write message immediately or pass it to the background thread '''
+        record = (time.time(), lvl, msg, raw, end)
+
+        if self._queue is None:
+            self._write(record)
+            return
+
+        try:
+            self._queue.put_nowait(record)
+        except Exception:
+            # queue is full
+            self._dropped += 1
+
+    def _write(self, record):
+        ''' Write message to the outputs
+
+        :param record: tuple of time, level (None for user messages),
+                       message, raw flag and end sequence
+        '''
+        stamp, lvl, msg, raw, end = record
+
+        if self._json:
+            line = json.dumps({'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(stamp)),
+                               'level': LogLevel.token.get(lvl, ''), 'msg': msg.strip()}, ensure_ascii=False) + '\n'
+
+            # progress lines are transient and not written to the logs
+            if end.endswith('\r'):
+                return
+            if self._console:
+                print(line, end='')
+            if self._file:
+                self._file.write(line)
+            return
+
+        if self._console:
+            prefix = '' if raw or lvl is None else \
+                '[%s%s%s] ' % (LogLevel.colour[lvl], LogLevel.token[lvl], Font.NORMAL)
+            print(prefix + msg, end=end)
+
+        if self._file and not end.endswith('\r'):
+            prefix = '' if raw or lvl is None else '[%s] ' % LogLevel.token[lvl]
+            self._file.write(time.strftime('%Y-%m-%d %H:%M:%S ', time.localtime(stamp)) + prefix + msg +
+                             (end if end.endswith('\n') else end + '\n'))
+
     def print(self, msg, end='.\n'):
         ''' Print user message anyway
 
         :param msg: message itself
         :param end: message end sequence
         '''
-        print(msg, end=end)
+        self._emit(None, str(msg), True, end)
 
-    def log(self, lvl, msg, raw=False, end='.\n'):
+    def log(self, lvl, msg, *args, raw=False, end='.\n'):
         ''' Print log message
 
         :param lvl: user-defined log level of message
         :param msg: message itself
+        :param args: arguments of "%"-formatting applied only if level is logged
         :param raw: flag to disable msg postformatting
         :param end: message end sequence
         '''
 
-        if lvl > self._gllvl or lvl < LogLevel.CRITICAL:
+        if not self.enabled(lvl):
             # invalid log level
             return
 
-        prefix = '[%s%s%s] ' % (LogLevel.colour[lvl], LogLevel.token[lvl],
-                                Font.NORMAL)
-
-        print(('' if raw else prefix) + str(msg), end=end)
+        self._emit(lvl, str(msg) % args if args else str(msg), raw, end)
 
-    def critical(self, msg, end='.\n'):
+    def critical(self, msg, *args, end='.\n'):
         ''' Print critical level log '''
-        self.log(LogLevel.CRITICAL, msg, end=end)
+        self.log(LogLevel.CRITICAL, msg, *args, end=end)
 
-    def error(self, msg, end='.\n'):
+    def error(self, msg, *args, end='.\n'):
         ''' Print error level log '''
-        self.log(LogLevel.ERROR, msg, end=end)
+        self.log(LogLevel.ERROR, msg, *args, end=end)
 
-    def warning(self, msg, end='.\n'):
+    def warning(self, msg, *args, end='.\n'):
         ''' Print warning level log '''
-        self.log(LogLevel.WARNING, msg, end=end)
+        self.log(LogLevel.WARNING, msg, *args, end=end)
 
-    def success(self, msg, end='.\n'):
+    def success(self, msg, *args, end='.\n'):
         ''' Print success level log '''
-        self.log(LogLevel.SUCCESS, msg, end=end)
+        self.log(LogLevel.SUCCESS, msg, *args, end=end)
 
-    def normal(self, msg, end='.\n'):
+    def normal(self, msg, *args, end='.\n'):
         ''' Print normal level log '''
-        self.log(LogLevel.NORMAL, msg, end=end)
+        self.log(LogLevel.NORMAL, msg, *args, end=end)
 
-    def debug(self, msg, end='.\n'):
+    def debug(self, msg, *args, end='.\n'):
         ''' Print debug level log '''
-        self.log(LogLevel.DEBUG, msg, end=end)
+        self.log(LogLevel.DEBUG, msg, *args, end=end)
 
-    def trace(self, msg, end='.\n'):
+    def trace(self, msg, *args, end='.\n'):
         ''' Print trace level log '''
-        self.log(LogLevel.TRACE, msg, end=end)
+        self.log(LogLevel.TRACE, msg, *args, end=end)
 
     def approve(self, msg, default=False):
         ''' Get user approve
@@ -167,14 +361,23 @@ class Logger:
         :param msg: user message
         :return: TRUE if approved, FALSE otherwise
         '''
+        if msg in self._policy:
+            # reply is configured
+            self.debug('Відповідь "{}" на запит "{}" задана політикою'.format(self._policy[msg], msg))
+            return bool(self._policy[msg])
+
         if not self._is_user_active:
             # send default reply if there is no user
             self.normal('Ввімкнено режим "Без користувача". Виконується дія за умовчанням')
             return default
 
-        resp = input('> {}? [{}/{}] '.format(msg,
-                                             'Y' if default else 'y',
-                                             'n' if default else 'N'))
+        with self._prompt_lock:
+            # question must follow the queued messages
+            self.flush()
+
+            resp = input('> {}? [{}/{}] '.format(msg,
+                                                 'Y' if default else 'y',
+                                                 'n' if default else 'N'))
         if resp in ['y', 'ye', 'yes']:
             return True
         elif resp in ['n', 'no']:
@@ -183,6 +386,13 @@ class Logger:
         self.warning('Недійсна відповідь "{}". Дія за умовчанням [{}]'.format(resp, default))
         return default
 
+    def set_policy(self, policy):
+        ''' Configure replies to the questions
+
+        :param policy: dict of question and reply
+        '''
+        self._policy = dict(policy)
+
     def userless_mode(self, enable):
         """ Function is used to activate in logger userless mode """
         self._is_user_active = False if enable else True
@@ -192,6 +402,15 @@ class Logger:
 class Email:
     """ Object used to store email data """
     def __init__(self, to_email, subject, msg, is_html=True):
+        from email.mime.text import MIMEText
+        from email.mime.multipart import MIMEMultipart
+
+        # keep raw data to be able to store and merge emails
+        self.to = to_email
+        self.subject = subject
+        self.body = msg
+        self.is_html = is_html
+
         self.message = MIMEMultipart('alternative')
         self.message['To'] = to_email
         self.message['Subject'] = subject
@@ -205,3 +424,1333 @@ class Email:
 
     def get_message(self):
         return self.message.as_string()
+
+
+class MailQueue:
+    ''' Background email delivery queue
+
+    Emails to the same recipient with the same subject are coalesced during
+    the time window, SMTP sessions are opened not more often than once per
+    interval and failed deliveries are retried with exponential backoff.
+    Undelivered emails are stored in the file and survive restarts.
+    '''
+    def __init__(self, path, logger, credentials, host='smtp.gmail.com', port=465,
+                 use_ssl=True, window=300, interval=600, retries=6, backoff=60):
+        ''' Constructor
+
+        :param path: file used to store undelivered emails
+        :param logger: Logger object
+        :param credentials: callable returning (email, password) of sender
+        :param host: SMTP server host
+        :param port: SMTP server port
+        :param use_ssl: use SMTP over SSL
+        :param window: time in seconds to coalesce emails
+        :param interval: minimal time in seconds between SMTP sessions
+        :param retries: number of delivery attempts before email is dropped
+        :param backoff: initial delay in seconds before the next attempt
+        '''
+        import threading
+
+        self._path = path
+        self._logger = logger
+        self._credentials = credentials
+        self._host = host
+        self._port = port
+        self._use_ssl = use_ssl
+        self._window = window
+        self._interval = interval
+        self._retries = retries
+        self._backoff = backoff
+
+        self._queue = []
+        self._last_session = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        if os.path.isfile(self._path):
+            with open(self._path, 'r') as fp:
+                self._queue = json.load(fp)
+
+            if self._queue:
+                self._logger.normal('Знайдено {} ненадісланих листів'.format(len(self._queue)))
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _store(self):
+        ''' Store undelivered emails. Must be called under the lock '''
+        with open(self._path + '.tmp', 'w+') as fp:
+            json.dump(self._queue, fp, ensure_ascii=False)
+
+        os.replace(self._path + '.tmp', self._path)
+
+    def put(self, email):
+        ''' Enqueue email for delivery
+
+        :param email: Email object
+        '''
+        now = time.time()
+        separator = '<hr>' if email.is_html else '\n\n'
+
+        with self._cond:
+            for item in self._queue:
+                # merge with pending email if it is still in its window
+                if item['to'] == email.to and item['subject'] == email.subject and \
+                   item['is_html'] == email.is_html and item['attempts'] == 0 and \
+                   now < item['created'] + self._window:
+                    item['body'] += separator + email.body
+                    item['merged'] += 1
+                    break
+            else:
+                self._queue.append({'to': email.to, 'subject': email.subject,
+                                    'body': email.body, 'is_html': email.is_html,
+                                    'created': now, 'due': now + self._window,
+                                    'attempts': 0, 'merged': 1})
+
+            self._store()
+            self._cond.notify()
+
+    def pending(self):
+        ''' Get number of undelivered emails '''
+        with self._cond:
+            return len(self._queue)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    now = time.time()
+                    allowed = self._last_session + self._interval
+
+                    batch = [item for item in self._queue if item['due'] <= now]
+                    if batch and now >= allowed:
+                        break
+
+                    # sleep till the next due email or rate limit expiration
+                    wakeup = min([item['due'] for item in self._queue], default=None)
+                    self._cond.wait(None if wakeup is None else max(wakeup, allowed) - now)
+
+                if self._closed:
+                    return
+
+                self._last_session = now
+
+            self._deliver(batch)
+
+    def _deliver(self, batch):
+        ''' Send batch of emails in a single SMTP session
+
+        :param batch: list of queued emails
+        :return: TRUE if delivered, FALSE otherwise
+        '''
+        import smtplib
+        import ssl
+
+        sender, password = self._credentials()
+        start = time.time()
+        error = None
+
+        if not sender:
+            error = 'Дані для входу в обліковий запис не надані'
+        else:
+            try:
+                if self._use_ssl:
+                    server = smtplib.SMTP_SSL(self._host, self._port, context=ssl.create_default_context())
+                else:
+                    server = smtplib.SMTP(self._host, self._port)
+
+                with server:
+                    if password:
+                        server.login(sender, password)
+
+                    for item in batch:
+                        email = Email(item['to'], item['subject'], item['body'], item['is_html'])
+                        server.sendmail(sender, email.get_to(), email.get_message())
+
+            except Exception as e:
+                error = str(e)
+
+        with self._cond:
+            for item in batch:
+                if error is None:
+                    self._queue.remove(item)
+                    continue
+
+                item['attempts'] += 1
+                if item['attempts'] >= self._retries:
+                    self._logger.error('Лист "{}" відкинуто після {} спроб'.format(item['subject'], item['attempts']))
+                    self._queue.remove(item)
+                    continue
+
+                item['due'] = time.time() + self._backoff * 2 ** (item['attempts'] - 1)
+
+            self._store()
+
+        if error is not None:
+            self._logger.warning('Не вдалось надіслати {} лист(ів): {}'.format(len(batch), error))
+            return False
+
+        duration = time.time() - start
+        self._logger.success('Надіслано {} лист(ів) [{:.3f} c]'.format(len(batch), duration))
+        return True
+
+    def close(self, flush=True):
+        ''' Stop delivery thread
+
+        :param flush: try to deliver all pending emails immediately
+        '''
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+        self._thread.join()
+
+        with self._cond:
+            batch = list(self._queue)
+
+        if flush and batch:
+            self._deliver(batch)
+
+
+def atomic_write(path, mode='w', **kwargs):
+    ''' Open temporary file that replaces the target when closed
+
+    Target is never left partially written: file is replaced only after
+    all the data is written and synced to the disk.
+
+    :param path: path to the target file
+    :param mode: mode of writing
+    :return: context manager with file object
+    '''
+    import contextlib
+
+    @contextlib.contextmanager
+    def writer():
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            with open(tmp, mode, **kwargs) as fp:
+                yield fp
+                fp.flush()
+                os.fsync(fp.fileno())
+
+            os.replace(tmp, path)
+
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    return writer()
+
+
+class SaveQueue:
+    ''' Background persistence with coalesced saves
+
+    Targets are marked dirty together with the function that saves them.
+    A target is saved once the debounce interval passes since it was
+    marked, no matter how many times it was marked in between. Pending
+    saves are flushed on interpreter exit.
+    '''
+    def __init__(self, logger, debounce=5):
+        ''' Constructor
+
+        :param logger: Logger object
+        :param debounce: time in seconds to coalesce saves
+        '''
+        import threading
+        import atexit
+
+        self._logger = logger
+        self._debounce = debounce
+
+        self._pending = {}
+        self._closed = False
+        self._thread = None
+        self._cond = threading.Condition()
+        self._io = threading.Lock()
+
+        atexit.register(self.close)
+
+    def mark(self, name, func):
+        ''' Mark target as dirty
+
+        :param name: name of the target
+        :param func: function that saves the target
+        '''
+        import threading
+
+        with self._cond:
+            if not self._closed:
+                # the first mark defines the time of save
+                due = self._pending[name][1] if name in self._pending else time.time() + self._debounce
+                self._pending[name] = (func, due)
+
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='saver', daemon=True)
+                    self._thread.start()
+
+                self._cond.notify()
+                return
+
+        # queue is closed, save immediately
+        self._save([(name, func)])
+
+    def pending(self):
+        ''' Get names of targets waiting for save '''
+        with self._cond:
+            return list(self._pending)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    now = time.time()
+                    batch = [name for name, (_, due) in self._pending.items() if due <= now]
+                    if batch:
+                        break
+
+                    # sleep till the next due save
+                    wakeup = min([due for _, due in self._pending.values()], default=None)
+                    self._cond.wait(None if wakeup is None else wakeup - now)
+
+                if self._closed:
+                    return
+
+                batch = [(name, self._pending.pop(name)[0]) for name in batch]
+
+                # saving starts before the lock is released, so flush waits for it
+                self._io.acquire()
+
+            try:
+                self._save(batch, locked=True)
+            finally:
+                self._io.release()
+
+    def _save(self, batch, locked=False):
+        ''' Call save functions of the batch
+
+        :param batch: list of (name, func)
+        :param locked: IO lock is already acquired
+        '''
+        if not locked:
+            with self._io:
+                return self._save(batch, locked=True)
+
+        for name, func in batch:
+            start = time.time()
+            try:
+                func()
+            except Exception as e:
+                self._logger.error('Не вдалось зберегти "{}": {}'.format(name, e))
+                continue
+
+            self._logger.debug('Збережено "{}" [{:.3f} c]'.format(name, time.time() - start))
+
+    def flush(self):
+        ''' Save all pending targets immediately '''
+        with self._cond:
+            batch = [(name, func) for name, (func, _) in self._pending.items()]
+            self._pending = {}
+
+        self._save(batch)
+
+    def close(self):
+        ''' Flush pending targets and stop the thread '''
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+        self.flush()
+
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+
+class FileLock:
+    ''' Advisory lock shared between processes
+
+    Lock is taken on a separate file, so the protected file may be replaced
+    while the lock is held. Locking is skipped on platforms without fcntl.
+    '''
+    def __init__(self, path):
+        ''' Constructor
+
+        :param path: path to the lock file
+        '''
+        self._path = path
+
+    def hold(self, shared=False):
+        ''' Hold the lock while in context
+
+        :param shared: take shared (read) lock instead of exclusive one
+        :return: context manager
+        '''
+        import contextlib
+
+        @contextlib.contextmanager
+        def holder():
+            try:
+                import fcntl
+            except ImportError:
+                yield
+                return
+
+            with open(self._path, 'a') as fp:
+                fcntl.flock(fp, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(fp, fcntl.LOCK_UN)
+
+        return holder()
+
+
+class LeaderLease:
+    ''' Lease of the leadership among instances on the same host
+
+    Lease file keeps the holder and expiration time. Instance becomes the
+    leader if the lease is free, expired or already held by it. The leader
+    renews the lease in the background, so the lease expires only if the
+    leader is stopped or hangs.
+    '''
+    def __init__(self, path, logger, ttl=120):
+        ''' Constructor
+
+        :param path: path to the lease file
+        :param logger: Logger object
+        :param ttl: lease duration in seconds
+        '''
+        import threading
+        import socket
+
+        self._path = path
+        self._logger = logger
+        self.ttl = ttl
+
+        self._lock = FileLock(path + '.lock')
+        self._id = '%s:%d:%s' % (socket.gethostname(), os.getpid(), hashlib.md5(os.urandom(8)).hexdigest()[:8])
+        self._held = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _read(self):
+        ''' Read lease record, must be called under the lock '''
+        try:
+            with open(self._path, 'r') as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+    def holder(self):
+        ''' Get record of the current holder
+
+        :return: dict with id, pid and expiration time or None if free
+        '''
+        with self._lock.hold(shared=True):
+            record = self._read()
+
+        return record if record and record['expires'] > time.time() else None
+
+    def acquire(self):
+        ''' Take or renew the lease
+
+        :return: TRUE if instance is the leader, FALSE otherwise
+        '''
+        import threading
+
+        with self._lock.hold():
+            record = self._read()
+            now = time.time()
+
+            if record and record['id'] != self._id and record['expires'] > now:
+                if self._held:
+                    self._logger.warning('Лідерство перейшло до процесу {}'.format(record['pid']))
+                self._held = False
+                return False
+
+            with open(self._path + '.tmp', 'w') as fp:
+                json.dump({'id': self._id, 'pid': os.getpid(), 'expires': now + self.ttl}, fp)
+            os.replace(self._path + '.tmp', self._path)
+
+        if not self._held:
+            self._logger.debug('Отримано лідерство [{}]'.format(self._id))
+            self._held = True
+
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._heartbeat, name='lease', daemon=True)
+            self._thread.start()
+
+        return True
+
+    def is_held(self):
+        ''' Check the instance is the leader '''
+        return self._held
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.ttl / 3):
+            if not self.acquire():
+                break
+
+        self._thread = None
+
+    def release(self):
+        ''' Give the lease away '''
+        import threading
+
+        self._stop.set()
+
+        # renewal in progress must not rewrite the lease after it is removed
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+        with self._lock.hold():
+            record = self._read()
+            if record and record['id'] == self._id:
+                os.remove(self._path)
+
+        self._held = False
+
+
+class Credentials:
+    ''' Provider of credentials and approval policy
+
+    Credentials of the service are looked up in the environment variables
+    ICOVID_<SERVICE>_LOGIN and ICOVID_<SERVICE>_PASSWORD, in the JSON file
+    readable by the owner only and in the system keyring (needs keyring
+    module). The user is asked only if the provider is interactive and
+    the standard input is a terminal.
+
+    File format:
+        {"ftp": {"login": "...", "password": "..."},
+         "smtp": {"login": "...", "password": "..."},
+         "approve": {"<question>": true}}
+    '''
+    def __init__(self, logger, path='icovid.credentials', interactive=True):
+        ''' Constructor
+
+        :param logger: Logger object
+        :param path: path to the credentials file
+        :param interactive: allow to ask the user
+        '''
+        import sys
+
+        self._logger = logger
+        self._path = path
+        self._interactive = interactive and sys.stdin is not None and sys.stdin.isatty()
+        self._file = self._load()
+
+    def _load(self):
+        ''' Read the credentials file
+
+        :return: dict with file content, empty if file is not available
+        '''
+        if not self._path or not os.path.isfile(self._path):
+            return {}
+
+        if os.stat(self._path).st_mode & 0o077:
+            self._logger.error('Файл "{}" доступний іншим користувачам, виконайте "chmod 600 {}"'
+                               .format(self._path, self._path))
+            return {}
+
+        try:
+            with open(self._path, 'r') as fp:
+                return json.load(fp)
+        except (OSError, ValueError) as e:
+            self._logger.error('Файл "{}" пошкоджено: {}'.format(self._path, e))
+            return {}
+
+    def policy(self):
+        ''' Get replies to the questions configured in the file
+
+        :return: dict of question and reply
+        '''
+        return self._file.get('approve', {})
+
+    def is_interactive(self):
+        ''' Check the user may be asked '''
+        return self._interactive
+
+    def _keyring(self, service):
+        try:
+            import keyring
+        except ImportError:
+            return None, None
+
+        try:
+            login = keyring.get_password('icovid', service)
+            return login, keyring.get_password('icovid', '%s:%s' % (service, login)) if login else None
+        except Exception as e:
+            self._logger.debug('Сховище ключів недоступне: {}'.format(e))
+            return None, None
+
+    def _prompt(self, service):
+        from getpass import getpass
+
+        self._logger.normal('Введіть дані для {}-з\'єднань ..'.format(service.upper()))
+        self._logger.flush()
+
+        try:
+            login = input(' [запит даних] > ім\'я користувача: ')
+            password = getpass(' [запит даних] > пароль %s: ' % login)
+        except (KeyboardInterrupt, EOFError):
+            self._logger.print('', end='\n')
+            self._logger.debug('Дані користувача не надано')
+            return None, None
+
+        return login, password
+
+    def get(self, service, ask=True):
+        ''' Get credentials of the service
+
+        :param service: service name, e.g. "ftp"
+        :param ask: ask the user if credentials are not found
+        :return: tuple (login, password), (None, None) if not found
+        '''
+        env = 'ICOVID_%s_' % service.upper()
+        record = self._file.get(service, {})
+
+        lookups = (('зі змінних середовища', lambda: (os.environ.get(env + 'LOGIN'), os.environ.get(env + 'PASSWORD'))),
+                   ('з файлу', lambda: (record.get('login'), record.get('password'))),
+                   ('зі сховища ключів', lambda: self._keyring(service)))
+
+        for source, lookup in lookups:
+            login, password = lookup()
+            if login and password:
+                self._logger.debug('Дані {} отримано {}'.format(service.upper(), source))
+                return login, password
+
+        if ask and self._interactive:
+            return self._prompt(service)
+
+        return None, None
+
+
+def normalize_name(name):
+    ''' Normalize name to be insensitive to case, whitespaces, soft hyphens,
+    different apostrophes and dashes
+
+    :param name: original name
+    :return: normalized name
+    '''
+    import unicodedata
+
+    name = unicodedata.normalize('NFKC', name).casefold()
+    return name.translate(_name_translation)
+
+
+# characters removed or unified by the name normalization
+_name_translation = {ord(c): None for c in '\u00ad\u200b\u200c\u200d\u2060\ufeff'}
+_name_translation.update({ord(c): "'" for c in '’‘ʼ`´'})
+_name_translation.update({ord(c): '-' for c in '‐‑‒–—'})
+_name_translation.update({ord(c): None for c in ' \t\n\r\xa0\u2009\u202f'})
+
+
+class AhoCorasick:
+    ''' Aho-Corasick automaton to find many patterns in a single text pass '''
+    def __init__(self, patterns):
+        ''' Constructor
+
+        :param patterns: dict of pattern -> value
+        '''
+        from collections import deque
+
+        # trie of patterns: transitions, failure links and matches per state
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        for pattern, value in patterns.items():
+            state = 0
+            for char in pattern:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+
+            self._out[state].append((len(pattern), value))
+
+        # breadth-first construction of failure links
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+
+                self._fail[nxt] = self._goto[fail].get(char, 0) if self._goto[fail].get(char) != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text):
+        ''' Find leftmost-longest pattern in the text
+
+        :param text: text to search in
+        :return: value of the pattern or None
+        '''
+        state = 0
+        best = None
+
+        for pos, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+
+            for length, value in self._out[state]:
+                start = pos - length + 1
+                if best is None or start < best[0] or (start == best[0] and length > best[1]):
+                    best = (start, length, value)
+
+        return best[2] if best else None
+
+
+class NameIndex:
+    ''' Lookup table of names built with normalized keys
+
+    Keeps metrics of matched and unmatched names to detect changes in the
+    naming on data sources.
+    '''
+    # max number of distinct unmatched names stored
+    unmatched_limit = 128
+
+    def __init__(self, mapping):
+        ''' Constructor
+
+        :param mapping: dict of original name -> value
+        '''
+        self._index = {normalize_name(k): v for k, v in mapping.items()}
+        self._matcher = None
+
+        self.matched = 0
+        self.unmatched = {}
+
+    def __len__(self):
+        return len(self._index)
+
+    def _count(self, name, value):
+        if value is not None:
+            self.matched += 1
+        elif name in self.unmatched or len(self.unmatched) < self.unmatched_limit:
+            self.unmatched[name] = self.unmatched.get(name, 0) + 1
+
+        return value
+
+    def get(self, name, default=None):
+        ''' Get value by the name
+
+        :param name: name to look up
+        :param default: value returned if name is unknown
+        :return: value or default
+        '''
+        value = self._count(name, self._index.get(normalize_name(name)) if name else None)
+        return default if value is None else value
+
+    def __contains__(self, name):
+        return bool(name) and normalize_name(name) in self._index
+
+    def search(self, text):
+        ''' Find the first known name in the free text
+
+        :param text: text to search in
+        :return: value of the found name or None
+        '''
+        if self._matcher is None:
+            self._matcher = AhoCorasick(self._index)
+
+        return self._matcher.find(normalize_name(text))
+
+    def reset(self):
+        ''' Reset matching metrics, e.g. before the next update cycle '''
+        self.matched = 0
+        self.unmatched = {}
+
+    def metrics(self):
+        ''' Get matching metrics
+
+        :return: dict with number of matched names and unmatched names
+        '''
+        return {'matched': self.matched, 'unmatched': dict(self.unmatched)}
+
+
+class JsonStream:
+    ''' Streaming extractor of JSON subtrees
+
+    Document is scanned chunk by chunk and only the requested subtrees are
+    decoded. Other values are skipped without building Python objects, and
+    reading stops as soon as all the requested subtrees are found. Members
+    of a big object can be iterated one by one with items().
+    '''
+    _space = re.compile(r'\s*')
+    _struct = re.compile(r'[\[\]{}"]')
+    _string = re.compile(r'(?:[^"\\]|\\.)*"', re.S)
+    _scalar = re.compile(r'[^,:\]}\s]*')
+
+    def __init__(self, chunks):
+        ''' Constructor
+
+        :param chunks: iterable of bytes or str chunks
+        '''
+        import codecs
+
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._pos = 0
+        self._keep = None
+        self._eof = False
+
+        # statistics
+        self.read = 0
+        self.peak = 0
+
+    def _more(self):
+        ''' Read the next chunk
+
+        :return: FALSE if there is no more data
+        '''
+        if self._eof:
+            return False
+
+        # drop consumed data unless it is being captured
+        start = self._pos if self._keep is None else min(self._pos, self._keep)
+        self._buf = self._buf[start:]
+        self._pos -= start
+        if self._keep is not None:
+            self._keep -= start
+
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self._eof = True
+            self._buf += self._decoder.decode(b'', final=True)
+            return False
+
+        self.read += len(chunk)
+        self._buf += self._decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        self.peak = max(self.peak, len(self._buf))
+        return True
+
+    def _peek(self):
+        ''' Skip whitespaces and get the next character '''
+        while True:
+            self._pos = self._space.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._more():
+                raise ValueError('Неочікуваний кінець JSON')
+
+    def _search(self, regex, match=False):
+        ''' Find regex in the buffer reading more data if needed '''
+        while True:
+            found = regex.match(self._buf, self._pos) if match else regex.search(self._buf, self._pos)
+            if found and (found.end() < len(self._buf) or self._eof):
+                return found
+            if not self._more() and not found:
+                raise ValueError('Неочікуваний кінець JSON')
+
+    def _skip(self):
+        ''' Move position to the end of the current value '''
+        char = self._peek()
+
+        if char == '"':
+            self._skip_string()
+        elif char in '{[':
+            depth = 0
+            while True:
+                found = self._search(self._struct)
+                self._pos = found.start()
+
+                if found.group() == '"':
+                    self._skip_string()
+                    continue
+
+                self._pos += 1
+                depth += 1 if found.group() in '{[' else -1
+                if depth == 0:
+                    break
+        else:
+            self._pos = self._search(self._scalar, match=True).end()
+
+    def _skip_string(self):
+        ''' Move position to the end of the string started at position '''
+        self._pos += 1
+        self._pos = self._search(self._string, match=True).end()
+        return self._pos
+
+    def _value(self, path, targets, results):
+        ''' Process value at the path
+
+        :return: TRUE if all the targets are found
+        '''
+        char = self._peek()
+
+        if path in targets:
+            self._keep = self._pos
+            self._skip()
+            results[path] = json.loads(self._buf[self._keep:self._pos])
+            self._keep = None
+            return len(results) == len(targets)
+
+        if char != '{' or not any(t[:len(path)] == path for t in targets):
+            self._skip()
+            return False
+
+        # descend into the object
+        self._pos += 1
+        for key in self._keys():
+            if self._value(path + (key,), targets, results):
+                return True
+
+        return False
+
+    def _keys(self):
+        ''' Iterate through keys of the object entered at position
+
+        Position is left at the value of every key, the caller must consume
+        the value before the next key is requested.
+        '''
+        while self._peek() != '}':
+            if self._buf[self._pos] == ',':
+                self._pos += 1
+                continue
+
+            self._keep = self._pos
+            self._skip_string()
+            key = json.loads(self._buf[self._keep:self._pos])
+            self._keep = None
+
+            if self._peek() != ':':
+                raise ValueError('Очікувався символ ":" у JSON')
+            self._pos += 1
+
+            yield key
+
+        self._pos += 1
+
+    def items(self, path=()):
+        ''' Iterate through members of the object at the path
+
+        Only one member is decoded at a time, so memory does not depend on
+        the size of the object.
+
+        :param path: path of the object as tuple of keys
+        :return: generator of (key, value)
+        '''
+        if self._peek() != '{':
+            return
+
+        # descend to the object
+        self._pos += 1
+        for name in path:
+            for key in self._keys():
+                if key == name:
+                    break
+                self._skip()
+            else:
+                return
+
+            if self._peek() != '{':
+                return
+            self._pos += 1
+
+        for key in self._keys():
+            self._keep = self._pos
+            self._skip()
+            value = json.loads(self._buf[self._keep:self._pos])
+            self._keep = None
+
+            yield key, value
+
+    def extract(self, *paths):
+        ''' Extract subtrees by their paths
+
+        :param paths: paths as tuples of object keys
+        :return: dict of path -> decoded value for the found paths
+        '''
+        results = {}
+        self._value((), set(paths), results)
+        return results
+
+
+class ErrorStore:
+    ''' Bounded storage of deduplicated errors
+
+    Errors are fingerprinted by their source, exception type and the code
+    line where the exception was raised. Each fingerprint keeps number of
+    occurrences, first/last seen time and state. Fingerprint is reported
+    only when it is new or its state changed since the previous report.
+    '''
+    ACTIVE = 'active'
+    RESOLVED = 'resolved'
+
+    # max length of stored traceback
+    details_limit = 4096
+
+    def __init__(self, limit=64):
+        ''' Constructor
+
+        :param limit: max number of stored fingerprints
+        '''
+        from collections import OrderedDict
+
+        self._limit = limit
+        self._errors = OrderedDict()
+
+    def __len__(self):
+        return len(self._errors)
+
+    @staticmethod
+    def fingerprint(source, details):
+        ''' Calculate fingerprint of the error
+
+        :param source: name of the error source
+        :param details: traceback text
+        :return: fingerprint string
+        '''
+        # the latest frame is the place where exception was raised
+        frames = re.findall(r'File "([^"]+)", line (\d+), in (\S+)', details)
+        site = '%s:%s:%s' % (os.path.basename(frames[-1][0]), *frames[-1][1:]) if frames else ''
+
+        # exception type without the message, because it often contains data
+        exc_type = ''
+        for line in details.split('\n'):
+            match = re.match(r'^([A-Za-z_][\w.]*)(:|$)', line.strip())
+            if match and match.group(1) != 'Traceback':
+                exc_type = match.group(1)
+
+        return hashlib.sha1('|'.join([source, exc_type, site]).encode()).hexdigest()[:12]
+
+    def add(self, source, message, details):
+        ''' Register error occurrence
+
+        :param source: name of the error source
+        :param message: user message
+        :param details: traceback text
+        '''
+        now = time.time()
+        fprint = self.fingerprint(source, details)
+
+        error = self._errors.pop(fprint, None)
+        if error is None:
+            error = {'source': source, 'count': 0, 'first': now, 'notified': None}
+
+        error.update({'message': message, 'details': details[-self.details_limit:],
+                      'count': error['count'] + 1, 'last': now, 'state': self.ACTIVE})
+
+        # the most recent errors are at the end
+        self._errors[fprint] = error
+        self._shrink()
+
+    def resolve(self, source):
+        ''' Mark all active errors of the source as resolved
+
+        :param source: name of the error source
+        '''
+        for error in self._errors.values():
+            if error['source'] == source:
+                error['state'] = self.RESOLVED
+
+    def _shrink(self):
+        ''' Drop the oldest fingerprints, reported and resolved ones first '''
+        while len(self._errors) > self._limit:
+            for fprint, error in self._errors.items():
+                if error['state'] == self.RESOLVED and error['notified'] == self.RESOLVED:
+                    break
+            else:
+                fprint = next(iter(self._errors))
+
+            del self._errors[fprint]
+
+    def pending(self):
+        ''' Get errors which state was not reported yet
+
+        :return: list of (fingerprint, error) pairs
+        '''
+        return [(fprint, error) for fprint, error in self._errors.items()
+                if error['state'] != error['notified'] and
+                not (error['notified'] is None and error['state'] == self.RESOLVED)]
+
+    def mark_notified(self, fprints):
+        ''' Remember that state of the errors was reported
+
+        :param fprints: list of fingerprints
+        '''
+        for fprint in fprints:
+            if fprint in self._errors:
+                self._errors[fprint]['notified'] = self._errors[fprint]['state']
+
+
+def pack_series(values):
+    ''' Pack series of integers into base64 string
+
+    Series are delta-encoded, so slowly growing totals need one or two bytes
+    per value. Deltas are zigzag-mapped and stored as varints.
+
+    :param values: list of integers
+    :return: base64 string
+    '''
+    out = bytearray()
+    prev = 0
+
+    for value in values:
+        delta = value - prev
+        prev = value
+
+        zigzag = delta * 2 if delta >= 0 else -delta * 2 - 1
+        while zigzag >= 0x80:
+            out.append(zigzag & 0x7f | 0x80)
+            zigzag >>= 7
+        out.append(zigzag)
+
+    return base64.b64encode(bytes(out)).decode('ascii')
+
+
+def unpack_series(packed):
+    ''' Unpack series of integers packed by pack_series
+
+    :param packed: base64 string
+    :return: list of integers
+    '''
+    values = []
+    prev = zigzag = shift = 0
+
+    for byte in base64.b64decode(packed):
+        zigzag |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+
+        prev += -(zigzag + 1) // 2 if zigzag & 1 else zigzag // 2
+        values.append(prev)
+        zigzag = shift = 0
+
+    return values
+
+
+def encode_series(values, threshold=32):
+    ''' Encode series for web page
+
+    Short series are kept as JSON arrays, long ones are packed and marked
+    with "d64:" prefix.
+
+    :param values: list of integers
+    :param threshold: max length of series kept as is
+    :return: list or packed string
+    '''
+    if len(values) <= threshold:
+        return values
+
+    return 'd64:' + pack_series(values)
+
+
+def moving_average(values, window=7):
+    ''' Trailing moving average computed through prefix sums
+
+    First items of the series are averaged over the available values.
+
+    :param values: list of numbers
+    :param window: number of items to average
+    :return: list of averages of the same length
+    '''
+    sums = [0] + list(itertools.accumulate(values))
+    return [(sums[i] - sums[max(0, i - window)]) / min(i, window)
+            for i in range(1, len(sums))]
+
+
+def bucket_mean(values, spans):
+    ''' Mean values of the series buckets computed through prefix sums
+
+    :param values: list of numbers
+    :param spans: list of (start, stop) indexes of buckets
+    :return: list of means per bucket
+    '''
+    sums = [0] + list(itertools.accumulate(values))
+    return [(sums[stop] - sums[start]) / (stop - start) for start, stop in spans]
+
+
+def span_bases(days, span, start=0, tolerance=3):
+    ''' Indexes of the days the changes over the span are taken against
+
+    Base of the day is the latest day recorded not later than `span` days
+    before it, so gaps in data do not shift the window. Both ends of the
+    window only move forward over sorted days, so bases of the whole series
+    are found in a single pass and shared by all the series of these days.
+
+    :param days: sorted list of day numbers (e.g. date ordinals)
+    :param span: number of days
+    :param start: index of the first day to calculate
+    :param tolerance: max number of extra days the window may be stretched
+    :return: list of base indexes for days from `start`, None if not known
+    '''
+    bases = []
+    k = bisect.bisect_right(days, days[start] - span, 0, start) - 1 if start < len(days) else -1
+
+    for i in range(start, len(days)):
+        while k + 1 < i and days[k + 1] <= days[i] - span:
+            k += 1
+        bases.append(k if k >= 0 and days[i] - days[k] <= span + tolerance else None)
+
+    return bases
+
+
+def span_deltas(values, bases, start=0):
+    ''' Changes of cumulative series over the span of days
+
+    :param values: cumulative values of days, None for unknown
+    :param bases: base indexes of days from `start` (see span_bases)
+    :param start: index of the first day to calculate
+    :return: list of changes for days from `start`, None if not known
+    '''
+    previous = [values[k] if k is not None else None for k in bases]
+    return [v - p if v is not None and p is not None else None for v, p in zip(values[start:], previous)]
+
+
+def resolution_spans(days, daily=56, weekly=182):
+    ''' Split sorted dates into buckets with resolution decreasing to the past
+
+    Dates within `daily` days of the latest one are kept as is, dates within
+    `weekly` days are grouped by weeks and older ones by calendar months.
+
+    :param days: sorted list of dates
+    :param daily: number of latest days with daily resolution
+    :param weekly: number of latest days with weekly resolution
+    :return: list of (start, stop) indexes of buckets
+    '''
+    if not days:
+        return []
+
+    last = days[-1]
+
+    def bucket(day):
+        age = (last - day).days
+        if age < daily:
+            return ('d', age)
+        if age < weekly:
+            return ('w', (age - daily) // 7)
+        return ('m', day.year, day.month)
+
+    spans = []
+    start = 0
+    for key, group in itertools.groupby(days, key=bucket):
+        stop = start + sum(1 for _ in group)
+        spans.append((start, stop))
+        start = stop
+
+    return spans
+
+
+class StackSampler:
+    ''' Sampling profiler that collects stacks of a single thread
+
+    Samples are stored in the "folded" format (frames separated by ';'
+    followed by the number of hits) that is understood by flamegraph.pl,
+    speedscope and inferno.
+    '''
+    def __init__(self, interval=0.005, thread_id=None):
+        ''' Constructor
+
+        :param interval: sampling interval in seconds
+        :param thread_id: ID of the thread to sample (current by default)
+        '''
+        import threading
+
+        self._interval = interval
+        self._thread_id = thread_id or threading.get_ident()
+        self._stacks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        import sys
+
+        while not self._stop.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('%s (%s:%d)' % (code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+
+            if stack:
+                folded = ';'.join(reversed(stack))
+                self._stacks[folded] = self._stacks.get(folded, 0) + 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path):
+        ''' Write collected stacks in the folded format
+
+        :param path: output file path
+        :return: number of collected samples
+        '''
+        with open(path, 'w+') as fp:
+            for stack, hits in sorted(self._stacks.items()):
+                fp.write('%s %d\n' % (stack, hits))
+
+        return sum(self._stacks.values())
+
+
+class MemTracker:
+    ''' Collects tracemalloc snapshots around named stages '''
+    def __init__(self, frames=25):
+        import tracemalloc
+
+        self._tracemalloc = tracemalloc
+        self._frames = frames
+        self._stages = []
+
+    def start(self):
+        self._tracemalloc.start(self._frames)
+
+    def stop(self):
+        self._tracemalloc.stop()
+
+    def track(self, name, func):
+        ''' Wrap function to snapshot memory before and after each call
+
+        :param name: stage name used in the report
+        :param func: function to be wrapped
+        :return: wrapped function
+        '''
+        import functools
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            before = self._tracemalloc.take_snapshot()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                after = self._tracemalloc.take_snapshot()
+                self._stages.append((name, before, after))
+
+        return wrapper
+
+    def report(self, top=20):
+        ''' Prepare text report of top allocations per stage
+
+        :param top: number of allocation sites per stage
+        :return: report text
+        '''
+        text = ''
+        for name, before, after in self._stages:
+            stats = after.compare_to(before, 'lineno')
+            total = sum(stat.size_diff for stat in stats)
+
+            text += '=== {} [{:+,} B] ===\n'.format(name, total)
+            for stat in stats[:top]:
+                text += '{}\n'.format(stat)
+            text += '\n'
+
+        return text